@@ -0,0 +1,313 @@
+"""
+SICK Capstone - Acquisition process
+Serial reading, DSP, hit detection and button presses in their own process
+
+With ACQUISITION_PROCESS (or app_combined.py --split) the web server no
+longer shares an interpreter with the reader: everything between the
+Arduino and the pulse runs here, pinned to PBT_CPU_CORES at PBT_PRIORITY,
+and every block is written to a shm_ring.SharedSampleRing. The web process
+(WEB_CPU_CORES, WEB_PRIORITY) only reads that ring, so a burst of clients,
+a slow history query or a GC pause there cannot hold the GIL while a hit
+is waiting to be pressed.
+
+The two processes share:
+    ring            samples (raw, envelope, index) and the status block
+                    (baseline, envelope, t0, counters), read any time
+    stats queue     the acquisition side's stats dict, latency report and
+                    read block-size histogram, sent every STATS_INTERVAL_S;
+                    never blocks the sender (the reader gauges for /metrics,
+                    effective SPS, serial backlog, CPU and RSS, go in the
+                    ring's status block at the same time)
+    stop event      set by the web process on shutdown
+    HITS_DB         hits (and SNIPPET_DIR snippets) are written here; the
+                    web process only queries them (WAL, so neither waits)
+
+The process is started with the 'spawn' method so it inherits no Flask or
+Socket.IO state, and imports config itself; only command-line overrides
+(port, replay) are passed in.
+"""
+import os
+import sys
+import time
+import queue
+import signal
+import multiprocessing as mp
+from shm_ring import SharedSampleRing
+
+STATS_INTERVAL_S = 1.0      # Stats/latency snapshots sent to the web process
+STOP_TIMEOUT_S = 5.0        # Wait this long for a clean stop before terminating
+
+
+def apply_cpu_policy(label, cores=None, priority=None):
+    """Pin this process to `cores` and set its nice value; failures only warn."""
+    if cores:
+        try:
+            os.sched_setaffinity(0, cores)
+            print(f"{label}: pinned to CPU {', '.join(str(c) for c in cores)}")
+        except (AttributeError, OSError, ValueError) as e:
+            print(f"WARNING: {label}: could not pin to CPU {cores}: {e}")
+    if priority is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, priority)
+            print(f"{label}: nice {priority}")
+        except (AttributeError, OSError) as e:
+            # Below 0 needs root or CAP_SYS_NICE
+            print(f"WARNING: {label}: could not set nice {priority}: {e}")
+
+
+class AcquisitionProcess:
+    """Web-side handle: owns the shared ring, starts and stops the process."""
+
+    def __init__(self, capacity, detector, serial_port, replay_source=None,
+                 replay_speed=1.0, replay_loop=False):
+        self.ring = SharedSampleRing.create(capacity)
+        ctx = mp.get_context('spawn')
+        self._stats_queue = ctx.Queue(maxsize=4)
+        self._stop = ctx.Event()
+        self.process = ctx.Process(
+            target=run, name='sick-acquisition', daemon=True,
+            args=(self.ring.name, self._stats_queue, self._stop, detector),
+            kwargs={'serial_port': serial_port, 'replay_source': replay_source,
+                    'replay_speed': replay_speed, 'replay_loop': replay_loop})
+        self.latest_stats = {}
+        self.latency_report = {}
+        self.block_samples = None   # (counts, sum) of the read block-size histogram
+
+    def start(self):
+        self.process.start()
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def poll(self):
+        """Take the newest stats snapshot, if any arrived."""
+        while True:
+            try:
+                message = self._stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.latest_stats = message['stats']
+            self.latency_report = message['latency']
+            self.block_samples = message['block_samples']
+
+    def status(self):
+        return self.ring.status()
+
+    def stats(self):
+        self.poll()
+        out = dict(self.latest_stats)
+        out['acquisition_alive'] = self.alive
+        out['acquisition_pid'] = self.process.pid
+        out['ring_retries'] = self.ring.retries
+        return out
+
+    def stop(self, timeout=STOP_TIMEOUT_S):
+        """Ask the process to finish (releases the Arduino pins), then free the ring."""
+        self._stop.set()
+        if self.process.pid is not None:
+            # Keep draining the stats queue so the final snapshot is not lost
+            # (and the child's queue feeder is never blocked on exit)
+            deadline = time.monotonic() + timeout
+            while self.process.is_alive() and time.monotonic() < deadline:
+                self.process.join(0.1)
+                self.poll()
+            self.poll()
+            if self.process.is_alive():
+                print("WARNING: acquisition process did not stop, terminating it")
+                self.process.terminate()
+                self.process.join(1.0)
+        self.ring.close()
+
+
+def run(ring_name, stats_queue, stop, detector, serial_port, replay_source=None,
+        replay_speed=1.0, replay_loop=False):
+    """Process entry point: read, detect, press, and publish into the ring."""
+    # Ctrl-C reaches the whole process group; the web process decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import serial
+    from config import (BAUD, SAMPLES_PER_SEC, SERIAL_PROTOCOL, BASELINE_ALPHA,
+                        ENVELOPE_ALPHA, TRIGGER_THRESHOLD, LOG_DROPPED_SAMPLES,
+                        RECORD_ENABLED, RECORD_DIR, RECORD_MAX_FILE_MB,
+                        RECORD_MAX_FILE_S, RECORD_QUEUE_BLOCKS, HITS_DB, HITS_QUEUE,
+                        SNIPPET_DIR, SNIPPET_PRE_MS, SNIPPET_POST_MS, SNIPPET_CHUNK_MB,
+                        PBT_CPU_CORES, PBT_PRIORITY)
+    from serial_ingest import open_ingest
+    from gap_detector import GapDetector
+    from dsp import EnvelopeFilter
+    from sample_clock import SampleClock
+    from recorder import Recorder
+    from hit_store import HitStore, baseline_at
+    from snippets import SnippetRing, SnippetStore
+    from replay import ReplaySource
+    from pulse_scheduler import PulseScheduler
+    from latency import LatencyTracker
+    from metrics import Metrics
+
+    apply_cpu_policy("Acquisition", PBT_CPU_CORES, PBT_PRIORITY)
+    ring = SharedSampleRing.attach(ring_name)
+    ring.set_status(threshold=TRIGGER_THRESHOLD, running=1)
+
+    ser = None
+    pulser = None
+    recorder = None
+    hit_store = None
+    lookback = None
+    replay = None
+    gaps = GapDetector(SAMPLES_PER_SEC, log=LOG_DROPPED_SAMPLES)
+    clock = SampleClock(SAMPLES_PER_SEC)
+    latency = LatencyTracker()
+    metrics = Metrics()     # Reader side only; the web process renders /metrics
+    ring.set_status(**metrics.reader_status())
+
+    if replay_source:
+        try:
+            replay = ReplaySource(replay_source, SAMPLES_PER_SEC, replay_speed, replay_loop)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Could not open replay source {replay_source}: {e}", file=sys.stderr)
+            ring.set_status(running=0)
+            ring.close()
+            return
+        print(f"Acquisition: replaying {replay_source} ({replay.total} samples)")
+        ingest = replay
+        source_time = replay.now
+        baseline_samples = replay.peek(int(0.2 * SAMPLES_PER_SEC))
+    else:
+        try:
+            ser = serial.Serial(serial_port, BAUD, timeout=1)
+            time.sleep(0.2)
+            ser.reset_input_buffer()
+        except Exception as e:
+            print(f"ERROR: Could not open serial port {serial_port}: {e}", file=sys.stderr)
+            ring.set_status(running=0)
+            ring.close()
+            return
+
+        ingest = open_ingest(ser, SERIAL_PROTOCOL)
+        pulser = PulseScheduler(ser, latency=latency)
+        pulser.start()
+
+        # Quick baseline warm-up (200 ms)
+        baseline_samples = []
+        t0 = time.time()
+        while time.time() - t0 < 0.2:
+            baseline_samples.extend(ingest.read_block())
+        source_time = time.time
+
+    baseline = sum(baseline_samples) / len(baseline_samples) if baseline_samples else 40.0
+    print(f"Acquisition: baseline calibrated: {baseline:.1f} ADC counts")
+    dsp = EnvelopeFilter(BASELINE_ALPHA, ENVELOPE_ALPHA, baseline, 0.0)
+
+    if not replay:
+        ingest.monitor = gaps
+    if RECORD_ENABLED and not replay:
+        recorder = Recorder(RECORD_DIR, SAMPLES_PER_SEC, RECORD_MAX_FILE_MB,
+                            RECORD_MAX_FILE_S, RECORD_QUEUE_BLOCKS)
+        recorder.start()
+    if HITS_DB and not replay:
+        hit_store = HitStore(HITS_DB, HITS_QUEUE,
+                             snippets=SnippetStore(SNIPPET_DIR, SNIPPET_CHUNK_MB) if SNIPPET_DIR else None)
+        hit_store.start()
+        if SNIPPET_DIR:
+            lookback = SnippetRing(SAMPLES_PER_SEC, SNIPPET_PRE_MS, SNIPPET_POST_MS,
+                                   detector.capture_samples * 1000.0 / SAMPLES_PER_SEC)
+
+    def send_stats():
+        stats = {}
+        stats.update(gaps.stats())
+        stats.update(clock.stats())
+        if recorder:
+            stats.update(recorder.stats())
+        if hit_store:
+            stats.update(hit_store.stats())
+        if replay:
+            stats.update(replay.stats())
+        if pulser:
+            stats.update(pulser.stats())
+        stats.update(latency.stats())
+        ring.set_status(**metrics.reader_status())
+        block_samples = (list(metrics.block_samples.counts), metrics.block_samples.sum)
+        message = {'stats': stats, 'latency': latency.report(), 'block_samples': block_samples}
+        # Web process is not keeping up: drop the oldest snapshot, never the newest
+        while True:
+            try:
+                stats_queue.put_nowait(message)
+                return
+            except queue.Full:
+                pass
+            try:
+                stats_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+    sample_count = 0
+    pulse_count = 0
+    clock.start(source_time())
+    last_stats = time.perf_counter()
+
+    while not stop.is_set():
+        block = ingest.read_block()
+        t_read = time.perf_counter()
+        if not block:
+            if replay and replay.finished:
+                break
+            continue
+
+        now = source_time()
+        n = len(block)
+        first_index = clock.advance(n, now)
+        metrics.observe_block(n, ingest.last_waiting)
+        if recorder:
+            recorder.submit(block, first_index, now)
+
+        baseline_before = dsp.baseline
+        base_block, env_block = dsp.process(block)
+        for hit in detector.process(env_block):
+            pulse_count += 1
+            print(f"Pulse #{pulse_count}: Peak={hit.peak:.1f} → {hit.width_ms:.0f} ms (INVERTED)")
+            if pulser:
+                pulser.schedule(hit.width_ms, latency.trace(hit, clock, t_read))
+            if hit_store:
+                stored = (hit, clock.start_time + float(clock.times(hit.trigger_index)),
+                          baseline_at(hit.trigger_index, base_block, first_index, baseline_before))
+                if lookback:
+                    lookback.add(hit, stored)
+                else:
+                    hit_store.submit(*stored)
+        if lookback:
+            for stored, snippet in lookback.push(block, env_block, first_index):
+                hit_store.submit(*stored, snippet)
+
+        # Samples first, then the status that describes them
+        sample_count += n
+        ring.append(block, env_block, first_index)
+        ring.set_status(baseline=dsp.baseline, envelope=dsp.envelope, t0=clock.t0,
+                        sample_count=sample_count, pulse_count=pulse_count)
+
+        if t_read - last_stats >= STATS_INTERVAL_S:
+            send_stats()
+            last_stats = t_read
+
+    # Cleanup (let any in-flight button press finish first)
+    if pulser:
+        pulser.stop()
+    if recorder:
+        recorder.stop()
+    if lookback:
+        for stored, snippet in lookback.flush():
+            hit_store.submit(*stored, snippet)
+    if hit_store:
+        hit_store.stop()
+    try:
+        if ser and not ser.closed:
+            ser.write(b"RESET_GPIO\n")
+            ser.flush()
+    except Exception:
+        pass
+    if ser:
+        ser.close()
+    send_stats()
+    ring.set_status(running=0)
+    ring.close()
+    print("Acquisition process stopped")
@@ -6,11 +6,20 @@ Real-time waveform visualization
 import time
 import sys
 from threading import Thread, Lock
-from collections import deque
 import serial
-from flask import Flask, render_template
+from flask import Flask, render_template, request, jsonify, Response, abort
 from flask_socketio import SocketIO, emit
 from config import *
+from serial_ingest import open_ingest
+from gap_detector import GapDetector
+from dsp import EnvelopeFilter
+from sample_clock import SampleClock
+from ring_buffer import SampleRing, capacity_for_memory
+from history import HistoryStore, parse_query
+from broadcast import Broadcaster
+from recorder import Recorder
+from replay import ReplaySource
+from metrics import Metrics, CONTENT_TYPE
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = SECRET_KEY
@@ -18,9 +27,14 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
 # Shared data buffers
 data_lock = Lock()
-raw_buffer = deque(maxlen=BUFFER_SIZE)
-env_buffer = deque(maxlen=BUFFER_SIZE)
-time_buffer = deque(maxlen=BUFFER_SIZE)
+history = HistoryStore(SampleRing(capacity_for_memory(MAX_BUFFER_MEMORY_MB)),
+                       SAMPLES_PER_SEC, HISTORY_LEVELS)
+
+# Connected clients (payload encoding and display resolution per client)
+broadcaster = Broadcaster(socketio, SAMPLES_PER_SEC, BUFFER_SIZE, MAX_DISPLAY_POINTS,
+                          max_clients=MAX_CLIENTS, queue_frames=CLIENT_QUEUE_FRAMES,
+                          max_in_flight=CLIENT_MAX_IN_FLIGHT, lag_after=CLIENT_LAG_S,
+                          drop_after=CLIENT_DROP_S, rates=CLIENT_RATES)
 
 # Serial connection
 ser = None
@@ -30,40 +44,50 @@ serial_running = False
 baseline = 0.0
 envelope = 0.0
 sample_count = 0
-
-
-def read_one_int(ser):
-    """Read one line and parse int; return None on empty/invalid."""
-    try:
-        s = ser.readline().decode(errors="ignore").strip()
-        if not s:
-            return None
-        return int(s)
-    except (ValueError, UnicodeDecodeError):
-        return None
+gaps = GapDetector(SAMPLES_PER_SEC, log=LOG_DROPPED_SAMPLES)
+clock = SampleClock(SAMPLES_PER_SEC)
+recorder = None  # Recorder, writes raw samples to disk off the reader thread
+replay = None    # ReplaySource, stands in for the serial link when REPLAY_SOURCE is set
+metrics = Metrics()  # /metrics instrumentation, cheap enough to leave on
 
 
 def serial_reader_thread():
     """Background thread to read serial data and update buffers."""
-    global ser, serial_running, baseline, envelope, sample_count
-    
-    print("Initializing serial connection...")
-    try:
-        ser = serial.Serial(SERIAL_PORT, BAUD, timeout=1)
-        time.sleep(0.2)
-        ser.reset_input_buffer()
-    except Exception as e:
-        print(f"ERROR: Could not open serial port {SERIAL_PORT}: {e}", file=sys.stderr)
-        serial_running = False
-        return
+    global ser, serial_running, baseline, envelope, sample_count, recorder, replay
     
-    # Quick baseline warm-up (200 ms)
-    baseline_samples = []
-    t0 = time.time()
-    while time.time() - t0 < 0.2:
-        v = read_one_int(ser)
-        if v is not None:
-            baseline_samples.append(v)
+    if REPLAY_SOURCE:
+        try:
+            replay = ReplaySource(REPLAY_SOURCE, SAMPLES_PER_SEC, REPLAY_SPEED, REPLAY_LOOP)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Could not open replay source {REPLAY_SOURCE}: {e}", file=sys.stderr)
+            serial_running = False
+            return
+        speed = f"{REPLAY_SPEED:g}x" if REPLAY_SPEED > 0 else "full"
+        print(f"Replaying {REPLAY_SOURCE} ({replay.total} samples) at {speed} speed")
+        ingest = replay
+        source_time = replay.now
+        
+        # Baseline from the first 200 ms of the capture (still replayed below)
+        baseline_samples = replay.peek(int(0.2 * SAMPLES_PER_SEC))
+    else:
+        print("Initializing serial connection...")
+        try:
+            ser = serial.Serial(SERIAL_PORT, BAUD, timeout=1)
+            time.sleep(0.2)
+            ser.reset_input_buffer()
+        except Exception as e:
+            print(f"ERROR: Could not open serial port {SERIAL_PORT}: {e}", file=sys.stderr)
+            serial_running = False
+            return
+        
+        ingest = open_ingest(ser, SERIAL_PROTOCOL)
+        
+        # Quick baseline warm-up (200 ms)
+        baseline_samples = []
+        t0 = time.time()
+        while time.time() - t0 < 0.2:
+            baseline_samples.extend(ingest.read_block())
+        source_time = time.time
     
     if baseline_samples:
         baseline = sum(baseline_samples) / len(baseline_samples)
@@ -72,60 +96,80 @@ def serial_reader_thread():
     
     envelope = 0.0
     print(f"Baseline calibrated: {baseline:.1f} ADC counts")
+    dsp = EnvelopeFilter(BASELINE_ALPHA, ENVELOPE_ALPHA, baseline, envelope)
+    
+    # Count dropped samples on every read from here on (the serial link only)
+    if not replay:
+        ingest.monitor = gaps
+    
+    # A replay is not recorded again
+    if RECORD_ENABLED and not replay:
+        recorder = Recorder(RECORD_DIR, SAMPLES_PER_SEC, RECORD_MAX_FILE_MB,
+                            RECORD_MAX_FILE_S, RECORD_QUEUE_BLOCKS)
+        recorder.start()
+        print(f"Recording raw samples to {RECORD_DIR}/")
     
     # Main reading loop
-    start_time = time.time()
     sample_count = 0
-    last_emit = time.time()
+    last_emit = source_time()
+    clock.start(last_emit)
     emit_interval = EMIT_INTERVAL  # Emit data at configured rate
     
     batch_raw = []
     batch_env = []
-    batch_time = []
     
     while serial_running:
-        v = read_one_int(ser)
-        if v is None:
-            time.sleep(0.001)
+        # Drain everything buffered so far; blocks up to the serial timeout
+        block = ingest.read_block()
+        if not block:
+            if replay and replay.finished:
+                break
             continue
         
-        sample_count += 1
-        current_time = time.time() - start_time
+        # Timestamps come from the sample index, not the arrival time
+        # (replay time when replaying, so pacing and speed do not matter)
+        now = source_time()
+        n = len(block)
+        first_index = clock.advance(n, now)
+        metrics.observe_block(n, ingest.last_waiting)
+        if recorder:
+            recorder.submit(block, first_index, now)
+        sample_count += n
         
-        # Update baseline and envelope
-        baseline = (1 - BASELINE_ALPHA) * baseline + BASELINE_ALPHA * v
-        xmag = abs(v - baseline)
-        envelope = (1 - ENVELOPE_ALPHA) * envelope + ENVELOPE_ALPHA * xmag
+        # Update baseline and envelope for the whole block
+        _, env_block = dsp.process(block)
+        baseline = dsp.baseline
+        envelope = dsp.envelope
         
         # Store in batch for emission
-        batch_raw.append(v)
-        batch_env.append(envelope)
-        batch_time.append(current_time)
+        batch_raw.extend(block)
+        batch_env.extend(env_block.tolist())
         
-        # Emit data in batches
-        now = time.time()
-        if now - last_emit >= emit_interval:
+        # Emit data in batches (and the tail once a replay has run out)
+        if now - last_emit >= emit_interval or (replay and replay.finished):
+            t_emit = time.perf_counter()
             with data_lock:
-                raw_buffer.extend(batch_raw)
-                env_buffer.extend(batch_env)
-                time_buffer.extend(batch_time)
+                metrics.lock_wait_seconds.observe(time.perf_counter() - t_emit)
+                history.append(batch_raw, batch_env, clock.index - len(batch_raw))
             
-            # Emit to all connected clients
-            socketio.emit('sensor_data', {
-                'raw': batch_raw,
-                'envelope': batch_env,
-                'time': batch_time,
-                'baseline': baseline,
-                'threshold': TRIGGER_THRESHOLD
-            })
+            # Queue for the fan-out thread (each client in its own encoding and
+            # resolution); this never waits on a client
+            broadcaster.publish(batch_raw, batch_env, clock.index - len(batch_raw), clock.t0,
+                                baseline=baseline, threshold=TRIGGER_THRESHOLD)
+            
+            metrics.emit_seconds.observe(time.perf_counter() - t_emit)
+            metrics.batch_samples.observe(len(batch_raw))
             
             batch_raw = []
             batch_env = []
-            batch_time = []
             last_emit = now
     
+    if recorder:
+        recorder.stop()
     if ser:
         ser.close()
+    if replay and replay.finished:
+        print(f"Replay finished: {replay.samples_read} samples")
     print("Serial reader thread stopped")
 
 
@@ -135,37 +179,102 @@ def index():
     return render_template('index.html')
 
 
+@app.route('/api/history')
+def api_history():
+    """History between t_start and t_end (seconds): ?t_start=&t_end=&max_points="""
+    result = query_history(request.args)
+    return jsonify(result), (400 if 'error' in result else 200)
+
+
+@socketio.on('query_history')
+def handle_query_history(params):
+    """Same query over Socket.IO; the result is returned as the ack."""
+    return query_history(params if isinstance(params, dict) else {})
+
+
+def query_history(params):
+    """Answer a history query from the cheapest resolution that fits."""
+    try:
+        t_start, t_end, max_points = parse_query(params, HISTORY_MAX_POINTS)
+    except ValueError as e:
+        return {'error': str(e)}
+    with data_lock:
+        return history.query(t_start, t_end, max_points, clock.t0)
+
+
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     """Handle client connection."""
-    print('Client connected')
+    encoding, factor = broadcaster.add(request.sid, auth)
+    print(f'Client connected ({encoding}, {factor} samples/point pair)')
     
-    # Send initial buffer data
+    # Send initial buffer data (only the missed samples to a client that resumes)
     with data_lock:
-        emit('initial_data', {
-            'raw': list(raw_buffer),
-            'envelope': list(env_buffer),
-            'time': list(time_buffer),
-            'baseline': baseline,
-            'threshold': TRIGGER_THRESHOLD
-        })
+        raw, env, index, resumed = history.catch_up(broadcaster.resume_index(auth), BUFFER_SIZE)
+    
+    # The views stay valid until the ring wraps past them, so encode outside the lock
+    emit('initial_data', broadcaster.initial_data(
+        request.sid, raw, env, index, clock.t0, resumed=resumed,
+        baseline=baseline, threshold=TRIGGER_THRESHOLD))
+
+
+@socketio.on('set_viewport')
+def handle_set_viewport(data):
+    """Client chart was resized: change its display resolution."""
+    if isinstance(data, dict):
+        broadcaster.set_viewport(request.sid, data.get('width'))
+
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Change this client's channels, rate or pause state; the profile in effect is the ack."""
+    return broadcaster.subscribe(request.sid, data)
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection."""
     print('Client disconnected')
+    broadcaster.remove(request.sid)
+
+
+@app.route('/api/stats')
+def api_stats():
+    """Same statistics as the stats event."""
+    return jsonify(collect_stats())
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition."""
+    if not ENABLE_MONITORING:
+        abort(404)
+    return Response(metrics.render(collect_stats()), content_type=CONTENT_TYPE)
 
 
 @socketio.on('request_stats')
 def handle_stats_request():
     """Send current statistics to client."""
-    emit('stats', {
+    emit('stats', collect_stats())
+
+
+def collect_stats():
+    """Current statistics (stats event, /api/stats and /metrics)."""
+    stats = {
         'sample_count': sample_count,
         'baseline': baseline,
         'envelope': envelope,
-        'buffer_size': len(raw_buffer)
-    })
+        'buffer_size': len(history)
+    }
+    stats.update(gaps.stats())
+    stats.update(clock.stats())
+    stats.update(broadcaster.stats())
+    stats.update(history.stats())
+    if recorder:
+        stats.update(recorder.stats())
+    if replay:
+        stats.update(replay.stats())
+    return stats
 
 
 def start_serial_thread():
@@ -178,14 +287,40 @@ def start_serial_thread():
 
 
 if __name__ == '__main__':
+    import argparse
+    
+    if SERVER_MODE == 'asyncio':
+        # Same app on one event loop instead of threads (same command-line options)
+        from app_async import main
+        sys.exit(main())
+    
+    ap = argparse.ArgumentParser(description="SICK PBT Sensor Web App")
+    ap.add_argument("--port", default=SERIAL_PORT,
+                    help="serial port (e.g. a pty from python3 signal_gen.py --pty)")
+    ap.add_argument("--replay", metavar="PATH", default=REPLAY_SOURCE,
+                    help="replay a capture (.rec file or directory, .jsonl, ASCII dump) instead of the serial port")
+    ap.add_argument("--speed", type=float, default=REPLAY_SPEED,
+                    help="replay speed, x real time (0 = as fast as possible)")
+    ap.add_argument("--loop", action="store_true", default=REPLAY_LOOP,
+                    help="start the replay over when it runs out")
+    args = ap.parse_args()
+    SERIAL_PORT = args.port
+    REPLAY_SOURCE, REPLAY_SPEED, REPLAY_LOOP = args.replay, args.speed, args.loop
+    
     print("Starting SICK PBT Sensor Web App...")
-    print(f"Serial port: {SERIAL_PORT} @ {BAUD} baud")
+    if REPLAY_SOURCE:
+        print(f"Replay: {REPLAY_SOURCE} (no serial port)")
+    else:
+        print(f"Serial port: {SERIAL_PORT} @ {BAUD} baud")
     print(f"Samples per second: {SAMPLES_PER_SEC}")
     print(f"Server: http://{HOST}:{PORT}")
     
     # Start serial reader thread
     start_serial_thread()
     
+    if ENABLE_MONITORING and METRICS_FILE:
+        metrics.start_log(METRICS_FILE, METRICS_INTERVAL, collect_stats)
+    
     try:
         # Run Flask app
         socketio.run(app, host=HOST, port=PORT, debug=DEBUG)
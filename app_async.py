@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - PBT Sensor Web App (asyncio)
+app.py's page, events and endpoints served from one asyncio event loop
+
+Selected with SERVER_MODE = 'asyncio' (config) or run directly. Instead
+of Flask-SocketIO's threading server (OS threads per client, emits from
+the reader thread) everything runs on a single event loop with
+python-socketio's AsyncServer on aiohttp:
+    serial      the port's file descriptor is watched with loop.add_reader
+                and read without blocking when bytes arrive
+    broadcast   one coroutine, woken by the reader once EMIT_INTERVAL has
+                passed, stores the batch and sends one frame per client group
+    clients     websocket connections are coroutines, not threads
+No locks are needed: the reader callback, the broadcast coroutine and
+the handlers never run at the same time.
+
+Needs aiohttp (pip3 install aiohttp). benchmarks/server_load.py compares
+CPU and delivery delay against the threading mode.
+"""
+import os
+import sys
+import time
+import asyncio
+import serial
+import socketio
+import jinja2
+from aiohttp import web
+from config import *
+from serial_ingest import open_ingest
+from gap_detector import GapDetector
+from dsp import EnvelopeFilter
+from sample_clock import SampleClock
+from ring_buffer import SampleRing, capacity_for_memory
+from history import HistoryStore, parse_query
+from broadcast import AsyncBroadcaster
+from recorder import Recorder
+from replay import ReplaySource
+from metrics import Metrics, CONTENT_TYPE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
+web_app = web.Application()
+sio.attach(web_app)
+
+history = HistoryStore(SampleRing(capacity_for_memory(MAX_BUFFER_MEMORY_MB)),
+                       SAMPLES_PER_SEC, HISTORY_LEVELS)
+broadcaster = AsyncBroadcaster(sio, SAMPLES_PER_SEC, BUFFER_SIZE, MAX_DISPLAY_POINTS,
+                               max_clients=MAX_CLIENTS, rates=CLIENT_RATES)
+
+# Serial connection
+ser = None
+ingest = None
+dsp = None
+recorder = None
+replay = None
+
+# Statistics
+baseline = 0.0
+envelope = 0.0
+sample_count = 0
+gaps = GapDetector(SAMPLES_PER_SEC, log=LOG_DROPPED_SAMPLES)
+clock = SampleClock(SAMPLES_PER_SEC)
+metrics = Metrics()
+
+batch_raw = []
+batch_env = []
+tasks = []      # Reader/broadcast coroutines, cancelled on shutdown
+emit_due = None     # asyncio.Event: a batch is ready for broadcast_loop
+last_emit = 0.0
+
+
+def open_serial():
+    """Open the port, negotiate the protocol and calibrate (blocking; run in an executor)."""
+    global ser
+    ser = serial.Serial(SERIAL_PORT, BAUD, timeout=1)
+    time.sleep(0.2)
+    ser.reset_input_buffer()
+    source = open_ingest(ser, SERIAL_PROTOCOL)
+    baseline_samples = []
+    t0 = time.time()
+    while time.time() - t0 < 0.2:
+        baseline_samples.extend(source.read_block())
+    ser.timeout = 0     # From here on reads never block; the event loop waits
+    return source, baseline_samples
+
+
+def start_pipeline(baseline_samples, now):
+    """Baseline, DSP, gap monitor and recorder once the source is open."""
+    global baseline, envelope, dsp, recorder, last_emit
+    baseline = sum(baseline_samples) / len(baseline_samples) if baseline_samples else 40.0
+    envelope = 0.0
+    print(f"Baseline calibrated: {baseline:.1f} ADC counts")
+    dsp = EnvelopeFilter(BASELINE_ALPHA, ENVELOPE_ALPHA, baseline, envelope)
+    if not replay:
+        ingest.monitor = gaps
+        if RECORD_ENABLED:
+            recorder = Recorder(RECORD_DIR, SAMPLES_PER_SEC, RECORD_MAX_FILE_MB,
+                                RECORD_MAX_FILE_S, RECORD_QUEUE_BLOCKS)
+            recorder.start()
+            print(f"Recording raw samples to {RECORD_DIR}/")
+    clock.start(now)
+    last_emit = now
+
+
+def process_block(block, now):
+    """DSP for one block; the samples wait in the batch for the broadcast coroutine."""
+    global baseline, envelope, sample_count, last_emit
+    n = len(block)
+    first_index = clock.advance(n, now)
+    metrics.observe_block(n, ingest.last_waiting)
+    if recorder:
+        recorder.submit(block, first_index, now)
+    sample_count += n
+    _, env_block = dsp.process(block)
+    baseline = dsp.baseline
+    envelope = dsp.envelope
+    batch_raw.extend(block)
+    batch_env.extend(env_block.tolist())
+
+    # Emit right after the read that completes an interval, like the threading app
+    if now - last_emit >= EMIT_INTERVAL or (replay and replay.finished):
+        last_emit = now
+        emit_due.set()
+
+
+def on_serial_readable():
+    """Event loop callback: the serial fd has bytes."""
+    try:
+        block = ingest.read_block()
+    except OSError as e:
+        print(f"ERROR: serial read failed: {e}", file=sys.stderr)
+        asyncio.get_running_loop().remove_reader(ser.fileno())
+        return
+    if block:
+        process_block(block, time.time())
+
+
+async def replay_reader():
+    """Feed a replay (paced with sleeps, so read in an executor)."""
+    loop = asyncio.get_running_loop()
+    while not replay.finished:
+        block = await loop.run_in_executor(None, replay.read_block)
+        if block:
+            process_block(block, replay.now())
+    print(f"Replay finished: {replay.samples_read} samples")
+
+
+async def broadcast_loop():
+    """Store and send each batch (the only place that emits sensor_data)."""
+    global batch_raw, batch_env
+    while True:
+        await emit_due.wait()
+        emit_due.clear()
+        if not batch_raw:
+            continue
+        raw, env = batch_raw, batch_env
+        batch_raw, batch_env = [], []
+        t_emit = time.perf_counter()
+        first = clock.index - len(raw)
+        history.append(raw, env, first)
+        await broadcaster.publish(raw, env, first, clock.t0,
+                                  baseline=baseline, threshold=TRIGGER_THRESHOLD)
+        metrics.emit_seconds.observe(time.perf_counter() - t_emit)
+        metrics.batch_samples.observe(len(raw))
+
+
+async def start_source(app):
+    """aiohttp startup hook: open the source and start the reader and broadcaster."""
+    global ingest, replay, emit_due
+    loop = asyncio.get_running_loop()
+    emit_due = asyncio.Event()
+    if REPLAY_SOURCE:
+        try:
+            replay = ReplaySource(REPLAY_SOURCE, SAMPLES_PER_SEC, REPLAY_SPEED, REPLAY_LOOP)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Could not open replay source {REPLAY_SOURCE}: {e}", file=sys.stderr)
+            return
+        ingest = replay
+        start_pipeline(replay.peek(int(0.2 * SAMPLES_PER_SEC)), replay.now())
+        tasks.append(asyncio.create_task(replay_reader()))
+    else:
+        print("Initializing serial connection...")
+        try:
+            ingest, baseline_samples = await loop.run_in_executor(None, open_serial)
+        except Exception as e:
+            print(f"ERROR: Could not open serial port {SERIAL_PORT}: {e}", file=sys.stderr)
+            return
+        start_pipeline(baseline_samples, time.time())
+        loop.add_reader(ser.fileno(), on_serial_readable)
+    tasks.append(asyncio.create_task(broadcast_loop()))
+
+
+async def stop_source(app):
+    """aiohttp cleanup hook."""
+    for task in tasks:
+        task.cancel()
+    if ser:
+        asyncio.get_running_loop().remove_reader(ser.fileno())
+        ser.close()
+    if recorder:
+        recorder.stop()
+    print("Serial reader stopped")
+
+
+_template = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.join(BASE_DIR, 'templates')))
+
+
+async def index(request):
+    """Main page."""
+    html = _template.get_template('index.html').render(
+        url_for=lambda endpoint, filename: f'/static/{filename}')
+    return web.Response(text=html, content_type='text/html')
+
+
+async def api_history(request):
+    """History between t_start and t_end (seconds): ?t_start=&t_end=&max_points="""
+    result = query_history(request.query)
+    return web.json_response(result, status=400 if 'error' in result else 200)
+
+
+async def api_stats(request):
+    """Same statistics as the stats event."""
+    return web.json_response(collect_stats())
+
+
+async def metrics_endpoint(request):
+    """Prometheus text exposition."""
+    if not ENABLE_MONITORING:
+        raise web.HTTPNotFound()
+    return web.Response(body=metrics.render(collect_stats()).encode(),
+                        headers={'Content-Type': CONTENT_TYPE})
+
+
+web_app.router.add_get('/', index)
+web_app.router.add_get('/api/history', api_history)
+web_app.router.add_get('/api/stats', api_stats)
+web_app.router.add_get('/metrics', metrics_endpoint)
+web_app.router.add_static('/static', os.path.join(BASE_DIR, 'static'))
+web_app.on_startup.append(start_source)
+web_app.on_cleanup.append(stop_source)
+
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    """Handle client connection."""
+    encoding, factor = broadcaster.add(sid, auth)
+    await broadcaster.apply_rooms()
+    print(f'Client connected ({encoding}, {factor} samples/point pair)')
+    raw, env, index, resumed = history.catch_up(broadcaster.resume_index(auth), BUFFER_SIZE)
+    await sio.emit('initial_data', broadcaster.initial_data(
+        sid, raw, env, index, clock.t0, resumed=resumed,
+        baseline=baseline, threshold=TRIGGER_THRESHOLD), to=sid)
+
+
+@sio.event
+async def set_viewport(sid, data):
+    """Client chart was resized: change its display resolution."""
+    if isinstance(data, dict):
+        broadcaster.set_viewport(sid, data.get('width'))
+        await broadcaster.apply_rooms()
+
+
+@sio.event
+async def subscribe(sid, data):
+    """Change this client's channels, rate or pause state; the profile in effect is the ack."""
+    profile = broadcaster.subscribe(sid, data)
+    await broadcaster.apply_rooms()
+    return profile
+
+
+@sio.event
+async def disconnect(sid, *args):
+    """Handle client disconnection."""
+    print('Client disconnected')
+    broadcaster.remove(sid)
+
+
+@sio.event
+async def request_stats(sid):
+    """Send current statistics to client."""
+    await sio.emit('stats', collect_stats(), to=sid)
+
+
+async def handle_query_history(sid, params):
+    """Same query over Socket.IO; the result is returned as the ack."""
+    return query_history(params if isinstance(params, dict) else {})
+
+sio.on('query_history', handler=handle_query_history)
+
+
+def query_history(params):
+    """Answer a history query from the cheapest resolution that fits."""
+    try:
+        t_start, t_end, max_points = parse_query(params, HISTORY_MAX_POINTS)
+    except ValueError as e:
+        return {'error': str(e)}
+    return history.query(t_start, t_end, max_points, clock.t0)
+
+
+def collect_stats():
+    """Current statistics (stats event, /api/stats and /metrics)."""
+    stats = {
+        'sample_count': sample_count,
+        'baseline': baseline,
+        'envelope': envelope,
+        'buffer_size': len(history),
+        'server_mode': 'asyncio'
+    }
+    stats.update(gaps.stats())
+    stats.update(clock.stats())
+    stats.update(broadcaster.stats())
+    stats.update(history.stats())
+    if recorder:
+        stats.update(recorder.stats())
+    if replay:
+        stats.update(replay.stats())
+    return stats
+
+
+def main():
+    global SERIAL_PORT, REPLAY_SOURCE, REPLAY_SPEED, REPLAY_LOOP
+    import argparse
+
+    ap = argparse.ArgumentParser(description="SICK PBT Sensor Web App (asyncio server)")
+    ap.add_argument("--port", default=SERIAL_PORT,
+                    help="serial port (e.g. a pty from python3 signal_gen.py --pty)")
+    ap.add_argument("--replay", metavar="PATH", default=REPLAY_SOURCE,
+                    help="replay a capture (.rec file or directory, .jsonl, ASCII dump) instead of the serial port")
+    ap.add_argument("--speed", type=float, default=REPLAY_SPEED,
+                    help="replay speed, x real time (0 = as fast as possible)")
+    ap.add_argument("--loop", action="store_true", default=REPLAY_LOOP,
+                    help="start the replay over when it runs out")
+    args = ap.parse_args()
+    SERIAL_PORT = args.port
+    REPLAY_SOURCE, REPLAY_SPEED, REPLAY_LOOP = args.replay, args.speed, args.loop
+
+    print("=" * 60)
+    print("SICK PBT Sensor Web App (asyncio)")
+    print("=" * 60)
+    if REPLAY_SOURCE:
+        print(f"Replay: {REPLAY_SOURCE}")
+    else:
+        print(f"Serial port: {SERIAL_PORT} @ {BAUD} baud")
+    print(f"Samples per second: {SAMPLES_PER_SEC}")
+    print(f"Web server: http://{HOST}:{PORT}")
+    print("=" * 60)
+
+    if ENABLE_MONITORING and METRICS_FILE:
+        metrics.start_log(METRICS_FILE, METRICS_INTERVAL, collect_stats)
+    web.run_app(web_app, host=HOST, port=PORT, print=None)
+
+
+if __name__ == '__main__':
+    main()
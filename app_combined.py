@@ -6,12 +6,27 @@ Real-time waveform visualization + GPIO pulse generation
 import time
 import sys
 from threading import Thread, Lock
-from collections import deque
 import serial
 # import pigpio  # No longer needed - using Arduino GPIO control
-from flask import Flask, render_template
+from flask import Flask, render_template, request, jsonify, Response, abort
 from flask_socketio import SocketIO, emit
 from config import *
+from serial_ingest import open_ingest
+from gap_detector import GapDetector
+from dsp import EnvelopeFilter
+from sample_clock import SampleClock
+from ring_buffer import SampleRing, capacity_for_memory
+from history import HistoryStore, parse_query
+from broadcast import Broadcaster
+from recorder import Recorder
+from hit_store import HitStore, baseline_at, parse_hits_query
+from snippets import SnippetRing, SnippetStore
+from replay import ReplaySource
+from metrics import Metrics, CONTENT_TYPE
+from pulse_scheduler import PulseScheduler, PULSE_HOLD_MS
+from hit_detector import HitDetector
+from latency import LatencyTracker
+from acquisition import AcquisitionProcess, apply_cpu_policy
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = SECRET_KEY
@@ -19,13 +34,19 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
 # Shared data buffers
 data_lock = Lock()
-raw_buffer = deque(maxlen=BUFFER_SIZE)
-env_buffer = deque(maxlen=BUFFER_SIZE)
-time_buffer = deque(maxlen=BUFFER_SIZE)
+history = HistoryStore(SampleRing(capacity_for_memory(MAX_BUFFER_MEMORY_MB)),
+                       SAMPLES_PER_SEC, HISTORY_LEVELS)
+
+# Connected clients (payload encoding and display resolution per client)
+broadcaster = Broadcaster(socketio, SAMPLES_PER_SEC, BUFFER_SIZE, MAX_DISPLAY_POINTS,
+                          max_clients=MAX_CLIENTS, queue_frames=CLIENT_QUEUE_FRAMES,
+                          max_in_flight=CLIENT_MAX_IN_FLIGHT, lag_after=CLIENT_LAG_S,
+                          drop_after=CLIENT_DROP_S, rates=CLIENT_RATES)
 
 # Serial connection
 ser = None
 serial_running = False
+pulser = None  # PulseScheduler, runs button presses off the reader thread
 
 # GPIO control now handled by Arduino via Serial commands
 # No Pi GPIO needed - Arduino controls arcade motherboard pins directly
@@ -34,11 +55,11 @@ serial_running = False
 baseline = 0.0
 envelope = 0.0
 sample_count = 0
-
-# Peak detection state
-armed = True
-peak = 0.0
-cap_end = 0.0
+gaps = GapDetector(SAMPLES_PER_SEC, log=LOG_DROPPED_SAMPLES)
+clock = SampleClock(SAMPLES_PER_SEC)
+recorder = None  # Recorder, writes raw samples to disk off the reader thread
+replay = None    # ReplaySource, stands in for the serial link when REPLAY_SOURCE is set
+metrics = Metrics()  # /metrics instrumentation, cheap enough to leave on
 
 # GPIO pulse parameters (from pbt_pulse_plot.py)
 CAPTURE_MS = 250
@@ -47,87 +68,18 @@ A_MIN, A_MAX = 60, 95  # Cover your actual peak range (60-95)
 W_MIN_MS, W_MAX_MS = 10, 100  # Shorter max pulse for better high scores
 REARM_LEVEL = TRIGGER_THRESHOLD * 0.4
 
+# Peak detection state (INVERTED mapping: strong hit → short pulse)
+detector = HitDetector(SAMPLES_PER_SEC, TRIGGER_THRESHOLD, CAPTURE_MS, REFRACTORY_MS,
+                       REARM_LEVEL, (A_MIN, A_MAX), (W_MIN_MS, W_MAX_MS),
+                       inverse=True, hold_ms=PULSE_HOLD_MS)
+
 # Statistics for pulse generation
 pulse_count = 0
-
-
-def clamp(x, lo, hi):
-    """Clamp value between min and max."""
-    return max(lo, min(hi, x))
-
-
-def map_linear(x, x0, x1, y0, y1):
-    """Map value from one range to another."""
-    if x1 <= x0:
-        return y0
-    t = (x - x0) / (x1 - x0)
-    return y0 + t * (y1 - y0)
-
-
-def map_linear_inverse(x, x0, x1, y0, y1):
-    """Map value from one range to another INVERSELY (high x → low y)."""
-    if x1 <= x0:
-        return y1
-    t = (x - x0) / (x1 - x0)
-    return y1 - t * (y1 - y0)  # Inverted: subtract instead of add
-
-
-def arcade_button_press(ser, duration_ms):
-    """
-    Arcade button press protocol using Arduino GPIO control.
-    
-    Sends commands to Arduino which controls the arcade motherboard pins.
-    Arduino Pin 6: Active HIGH (normally LOW) - Press start signal
-    Arduino Pin 5: Active LOW (normally HIGH) - Press confirmation signal
-    
-    Sequence:
-    1. Send PIN6_HIGH command to Arduino
-    2. Wait for duration_ms (THE PULSE - arcade measures this gap)
-    3. Send PIN5_LOW command to Arduino
-    4. Hold active state, then reset
-    
-    The arcade measures the time between Pin 6↑ and Pin 5↓
-    """
-    try:
-        # Step 1: Pin 6 HIGH (press start signal) - 5V output from Arduino
-        ser.write(b"PIN6_HIGH\n")
-        ser.flush()  # Ensure command is sent immediately
-        
-        # Step 2: Wait for the mapped duration
-        # This is THE PULSE that arcade measures (Pin 6 HIGH to Pin 5 LOW)
-        time.sleep(duration_ms / 1000.0)
-        
-        # Step 3: Pin 5 LOW (press confirmed) - 0V output from Arduino
-        ser.write(b"PIN5_LOW\n")
-        ser.flush()  # Ensure command is sent immediately
-        
-        # Step 4: Hold active state longer (cleanup)
-        time.sleep(0.100)  # 100ms hold (pins stay active longer)
-        
-        # Step 5: Reset both pins to idle state
-        ser.write(b"PIN5_HIGH\n")  # Pin 5 back to HIGH (5V)
-        ser.write(b"PIN6_LOW\n")   # Pin 6 back to LOW (0V)
-        ser.flush()  # Ensure commands are sent
-        
-    except Exception as e:
-        print(f"Error in arcade_button_press: {e}")
-        # Try to reset GPIO on error
-        try:
-            ser.write(b"RESET_GPIO\n")
-            ser.flush()
-        except:
-            pass
-
-
-def read_one_int(ser):
-    """Read one line and parse int; return None on empty/invalid."""
-    try:
-        s = ser.readline().decode(errors="ignore").strip()
-        if not s:
-            return None
-        return int(s)
-    except (ValueError, UnicodeDecodeError):
-        return None
+latency = LatencyTracker()  # Trigger sample -> PIN6_HIGH / PIN5_LOW, per stage
+acquisition = None  # AcquisitionProcess when reading, detection and pulses run in their own process (--split)
+ring_skipped = 0    # Samples the ring reader skipped after a stall (--split)
+hit_store = None    # HitStore: every hit to SQLite (written here, or by the acquisition process with --split)
+lookback = None     # SnippetRing: holds each hit until its waveform snippet is complete
 
 
 def serial_reader_thread():
@@ -135,29 +87,47 @@ def serial_reader_thread():
     Background thread to read serial data and update buffers.
     Also handles GPIO pulse generation based on detected peaks.
     """
-    global ser, serial_running, baseline, envelope, sample_count
-    global armed, peak, cap_end, pulse_count
+    global ser, serial_running, baseline, envelope, sample_count, pulser
+    global pulse_count, recorder, replay, hit_store, lookback
     
     print("GPIO control now handled by Arduino - no Pi GPIO needed!")
     print("Arduino will control arcade motherboard pins via Serial commands.")
     
-    print("Initializing serial connection...")
-    try:
-        ser = serial.Serial(SERIAL_PORT, BAUD, timeout=1)
-        time.sleep(0.2)
-        ser.reset_input_buffer()
-    except Exception as e:
-        print(f"ERROR: Could not open serial port {SERIAL_PORT}: {e}", file=sys.stderr)
-        serial_running = False
-        return
-    
-    # Quick baseline warm-up (200 ms)
-    baseline_samples = []
-    t0 = time.time()
-    while time.time() - t0 < 0.2:
-        v = read_one_int(ser)
-        if v is not None:
-            baseline_samples.append(v)
+    if REPLAY_SOURCE:
+        try:
+            replay = ReplaySource(REPLAY_SOURCE, SAMPLES_PER_SEC, REPLAY_SPEED, REPLAY_LOOP)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Could not open replay source {REPLAY_SOURCE}: {e}", file=sys.stderr)
+            serial_running = False
+            return
+        speed = f"{REPLAY_SPEED:g}x" if REPLAY_SPEED > 0 else "full"
+        print(f"Replaying {REPLAY_SOURCE} ({replay.total} samples) at {speed} speed")
+        ingest = replay
+        source_time = replay.now
+        
+        # Baseline from the first 200 ms of the capture (still replayed below)
+        baseline_samples = replay.peek(int(0.2 * SAMPLES_PER_SEC))
+    else:
+        print("Initializing serial connection...")
+        try:
+            ser = serial.Serial(SERIAL_PORT, BAUD, timeout=1)
+            time.sleep(0.2)
+            ser.reset_input_buffer()
+        except Exception as e:
+            print(f"ERROR: Could not open serial port {SERIAL_PORT}: {e}", file=sys.stderr)
+            serial_running = False
+            return
+        
+        ingest = open_ingest(ser, SERIAL_PROTOCOL)
+        pulser = PulseScheduler(ser, latency=latency)
+        pulser.start()
+        
+        # Quick baseline warm-up (200 ms)
+        baseline_samples = []
+        t0 = time.time()
+        while time.time() - t0 < 0.2:
+            baseline_samples.extend(ingest.read_block())
+        source_time = time.time
     
     if baseline_samples:
         baseline = sum(baseline_samples) / len(baseline_samples)
@@ -166,121 +136,128 @@ def serial_reader_thread():
     
     envelope = 0.0
     print(f"Baseline calibrated: {baseline:.1f} ADC counts")
+    dsp = EnvelopeFilter(BASELINE_ALPHA, ENVELOPE_ALPHA, baseline, envelope)
+    
+    # Count dropped samples on every read from here on (the serial link only)
+    if not replay:
+        ingest.monitor = gaps
+    
+    # A replay is not recorded again
+    if RECORD_ENABLED and not replay:
+        recorder = Recorder(RECORD_DIR, SAMPLES_PER_SEC, RECORD_MAX_FILE_MB,
+                            RECORD_MAX_FILE_S, RECORD_QUEUE_BLOCKS)
+        recorder.start()
+        print(f"Recording raw samples to {RECORD_DIR}/")
+    
+    # Nor are its hits stored again (they would be counted twice in /api/hits)
+    if HITS_DB and not replay:
+        hit_store = HitStore(HITS_DB, HITS_QUEUE,
+                             snippets=SnippetStore(SNIPPET_DIR, SNIPPET_CHUNK_MB) if SNIPPET_DIR else None)
+        hit_store.start()
+        if SNIPPET_DIR:
+            lookback = SnippetRing(SAMPLES_PER_SEC, SNIPPET_PRE_MS, SNIPPET_POST_MS, CAPTURE_MS)
+        print(f"Storing hits in {HITS_DB}" + (f", waveforms in {SNIPPET_DIR}/" if SNIPPET_DIR else ""))
     
     # Main reading loop
-    start_time = time.time()
     sample_count = 0
-    last_emit = time.time()
+    last_emit = source_time()
+    clock.start(last_emit)
     emit_interval = EMIT_INTERVAL  # Emit data at configured rate
     
     batch_raw = []
     batch_env = []
-    batch_time = []
     
     while serial_running:
-        v = read_one_int(ser)
-        if v is None:
-            time.sleep(0.001)
+        # Drain everything buffered so far; blocks up to the serial timeout
+        block = ingest.read_block()
+        t_read = time.perf_counter()
+        if not block:
+            if replay and replay.finished:
+                break
             continue
         
-        sample_count += 1
-        current_time = time.time() - start_time
+        # Timestamps come from the sample index, not the arrival time
+        # (replay time when replaying, so pacing and speed do not matter)
+        now = source_time()
+        n = len(block)
+        first_index = clock.advance(n, now)
+        metrics.observe_block(n, ingest.last_waiting)
+        if recorder:
+            recorder.submit(block, first_index, now)
         
-        # Update baseline and envelope
-        baseline = (1 - BASELINE_ALPHA) * baseline + BASELINE_ALPHA * v
-        xmag = abs(v - baseline)
-        envelope = (1 - ENVELOPE_ALPHA) * envelope + ENVELOPE_ALPHA * xmag
-        
-        # Store in batch for emission
-        batch_raw.append(v)
-        batch_env.append(envelope)
-        batch_time.append(current_time)
+        # Update baseline and envelope for the whole block
+        baseline_before = dsp.baseline
+        base_block, env_block = dsp.process(block)
+        env_list = env_block.tolist()
         
         # ============================================================
         # GPIO PULSE GENERATION LOGIC (Arduino GPIO control)
         # ============================================================
-        now = time.time()
-        
-        if armed:
-            # Check for trigger
-            if envelope > TRIGGER_THRESHOLD:
-                armed = False
-                peak = envelope
-                cap_end = now + (CAPTURE_MS / 1000.0)
-        else:
-            # Capture peak during capture window
-            if envelope > peak:
-                peak = envelope
+        for hit in detector.process(env_block):
+            pulse_count += 1
+            print(f"Pulse #{pulse_count}: Peak={hit.peak:.1f} → {hit.width_ms:.0f} ms (INVERTED)")
+            print(f"  Mapping: Peak {hit.peak:.1f} → Pulse {hit.width_ms:.0f}ms (Range: {A_MIN}-{A_MAX} → {W_MIN_MS}-{W_MAX_MS}ms)")
+            
+            # Generate arcade button press on the pulse thread; the detector
+            # stays in refractory until the press sequence is over
+            # (a replay only counts hits, there is no Arduino to press with)
+            if pulser:
+                pulser.schedule(hit.width_ms, latency.trace(hit, clock, t_read))
             
-            # Check if capture window ended or envelope dropped
-            if now >= cap_end or envelope < (TRIGGER_THRESHOLD * 0.5):
-                # Map amplitude to pulse width INVERSELY
-                # High peak → Short pulse (strong hit = quick button press)
-                # Low peak → Long pulse (weak hit = slow button press)
-                a_clamped = clamp(peak, A_MIN, A_MAX)
-                width_ms = clamp(
-                    map_linear_inverse(a_clamped, A_MIN, A_MAX, W_MIN_MS, W_MAX_MS),
-                    W_MIN_MS, W_MAX_MS
-                )
-                
-                pulse_count += 1
-                print(f"Pulse #{pulse_count}: Peak={peak:.1f} → {width_ms:.0f} ms (INVERTED)")
-                print(f"  Mapping: Peak {peak:.1f} → Pulse {width_ms:.0f}ms (Range: {A_MIN}-{A_MAX} → {W_MIN_MS}-{W_MAX_MS}ms)")
-                
-                # Generate arcade button press using Arduino GPIO control
-                arcade_button_press(ser, width_ms)
-                
-                # Refractory period
-                t_ref_end = time.time() + (REFRACTORY_MS / 1000.0)
-                while time.time() < t_ref_end:
-                    v2 = read_one_int(ser)
-                    if v2 is None:
-                        continue
-                    sample_count += 1
-                    baseline = (1 - BASELINE_ALPHA) * baseline + BASELINE_ALPHA * v2
-                    xmag = abs(v2 - baseline)
-                    envelope = (1 - ENVELOPE_ALPHA) * envelope + ENVELOPE_ALPHA * xmag
-                
-                # Wait to re-arm until envelope falls below REARM_LEVEL
-                while True:
-                    if envelope < REARM_LEVEL:
-                        armed = True
-                        break
-                    v3 = read_one_int(ser)
-                    if v3 is None:
-                        time.sleep(0.001)
-                        continue
-                    sample_count += 1
-                    baseline = (1 - BASELINE_ALPHA) * baseline + BASELINE_ALPHA * v3
-                    xmag = abs(v3 - baseline)
-                    envelope = (1 - ENVELOPE_ALPHA) * envelope + ENVELOPE_ALPHA * xmag
+            # Off to the hit store's writer thread; never waits on the disk
+            # (with snippets, once SNIPPET_POST_MS more samples are in)
+            if hit_store:
+                stored = (hit, clock.start_time + float(clock.times(hit.trigger_index)),
+                          baseline_at(hit.trigger_index, base_block, first_index, baseline_before))
+                if lookback:
+                    lookback.add(hit, stored)
+                else:
+                    hit_store.submit(*stored)
+        
+        if lookback:
+            for stored, snippet in lookback.push(block, env_block, first_index):
+                hit_store.submit(*stored, snippet)
+        
+        # Store in batch for emission
+        sample_count += n
+        batch_raw.extend(block)
+        batch_env.extend(env_list)
+        baseline = dsp.baseline
+        envelope = dsp.envelope
         
         # ============================================================
         # EMIT DATA TO WEB CLIENTS
         # ============================================================
-        now = time.time()
-        if now - last_emit >= emit_interval:
+        # Batches go out every emit_interval, the tail once a replay has run out
+        if now - last_emit >= emit_interval or (replay and replay.finished):
+            t_emit = time.perf_counter()
             with data_lock:
-                raw_buffer.extend(batch_raw)
-                env_buffer.extend(batch_env)
-                time_buffer.extend(batch_time)
+                metrics.lock_wait_seconds.observe(time.perf_counter() - t_emit)
+                history.append(batch_raw, batch_env, clock.index - len(batch_raw))
             
-            # Emit to all connected clients
-            socketio.emit('sensor_data', {
-                'raw': batch_raw,
-                'envelope': batch_env,
-                'time': batch_time,
-                'baseline': baseline,
-                'threshold': TRIGGER_THRESHOLD,
-                'pulse_count': pulse_count
-            })
+            # Queue for the fan-out thread (each client in its own encoding and
+            # resolution); this never waits on a client
+            broadcaster.publish(batch_raw, batch_env, clock.index - len(batch_raw), clock.t0,
+                                baseline=baseline, threshold=TRIGGER_THRESHOLD,
+                                pulse_count=pulse_count)
+            
+            metrics.emit_seconds.observe(time.perf_counter() - t_emit)
+            metrics.batch_samples.observe(len(batch_raw))
             
             batch_raw = []
             batch_env = []
-            batch_time = []
             last_emit = now
     
-    # Cleanup
+    # Cleanup (let any in-flight button press finish first)
+    if pulser:
+        pulser.stop()
+    if recorder:
+        recorder.stop()
+    if lookback:
+        for stored, snippet in lookback.flush():
+            hit_store.submit(*stored, snippet)
+    if hit_store:
+        hit_store.stop()
     if ser:
         ser.close()
     # Send reset command to Arduino to reset GPIO pins
@@ -290,64 +267,269 @@ def serial_reader_thread():
             ser.flush()
     except:
         pass
+    if replay and replay.finished:
+        print(f"Replay finished: {replay.samples_read} samples")
     print("Serial reader thread stopped")
 
 
+def ring_reader_thread():
+    """
+    Web side of --split: every EMIT_INTERVAL, take the samples the
+    acquisition process has added to the shared ring since the last tick
+    and publish them. Nothing here touches the serial port or the pulses.
+    After a stall only the newest BUFFER_SIZE samples go out: the live
+    decimators start a fresh bucket after the gap, and the history
+    rollups keep their older records with the skipped span left empty.
+    """
+    global baseline, envelope, sample_count, pulse_count, ring_skipped
+    
+    next_index = 0
+    while serial_running:
+        time.sleep(EMIT_INTERVAL)
+        status = acquisition.status()
+        baseline, envelope = status['baseline'], status['envelope']
+        sample_count, pulse_count = int(status['sample_count']), int(status['pulse_count'])
+        
+        if sample_count - next_index > BUFFER_SIZE:
+            ring_skipped += sample_count - BUFFER_SIZE - next_index
+            next_index = sample_count - BUFFER_SIZE
+        block = acquisition.ring.since(next_index, BUFFER_SIZE)
+        if block is None:
+            if not acquisition.alive:
+                break
+            continue
+        raw, env, first_index = block
+        next_index = first_index + len(raw)
+        
+        t_emit = time.perf_counter()
+        with data_lock:
+            metrics.lock_wait_seconds.observe(time.perf_counter() - t_emit)
+            # Full-rate samples are already in the shared ring; only the rollups are built here
+            history.roll_up(raw, env, first_index)
+        
+        broadcaster.publish(raw, env, first_index, status['t0'],
+                            baseline=baseline, threshold=TRIGGER_THRESHOLD,
+                            pulse_count=pulse_count)
+        
+        metrics.emit_seconds.observe(time.perf_counter() - t_emit)
+        metrics.batch_samples.observe(len(raw))
+    
+    print("Ring reader thread stopped")
+
+
+def axis_t0():
+    """t0 of the sample time axis (kept by the acquisition process with --split)."""
+    return acquisition.status()['t0'] if acquisition else clock.t0
+
+
 @app.route('/')
 def index():
     """Main page."""
     return render_template('index.html')
 
 
+@app.route('/api/history')
+def api_history():
+    """History between t_start and t_end (seconds): ?t_start=&t_end=&max_points="""
+    result = query_history(request.args)
+    return jsonify(result), (400 if 'error' in result else 200)
+
+
+@socketio.on('query_history')
+def handle_query_history(params):
+    """Same query over Socket.IO; the result is returned as the ack."""
+    return query_history(params if isinstance(params, dict) else {})
+
+
+def query_history(params):
+    """Answer a history query from the cheapest resolution that fits."""
+    try:
+        t_start, t_end, max_points = parse_query(params, HISTORY_MAX_POINTS)
+    except ValueError as e:
+        return {'error': str(e)}
+    with data_lock:
+        return history.query(t_start, t_end, max_points, axis_t0())
+
+
+@app.route('/api/hits')
+def api_hits():
+    """Stored hits, newest first: ?since=&until=&limit=&before= (Unix seconds, hit id from `next`)"""
+    return hits_query(lambda since, until, limit, before: hit_store.page(limit, before, since, until))
+
+
+@app.route('/api/hits/top')
+def api_hits_top():
+    """Leaderboard, highest peak first: ?since=&until=&limit="""
+    return hits_query(lambda since, until, limit, before: {'hits': hit_store.top(limit, since, until)})
+
+
+@app.route('/api/hits/hourly')
+def api_hits_hourly():
+    """Hits per hour with mean and max peak: ?since=&until="""
+    return hits_query(lambda since, until, limit, before: {'hours': hit_store.hourly(since, until)})
+
+
+def hits_query(answer):
+    """Parse the hit store query arguments and answer them (404 without a store)."""
+    if not hit_store:
+        abort(404)
+    try:
+        since, until, limit, before = parse_hits_query(request.args, HITS_MAX_ROWS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(answer(since, until, limit, before))
+
+
+@app.route('/api/hits/<int:hit_id>/snippet')
+def api_hit_snippet(hit_id):
+    """Raw and envelope samples around one stored hit (404 if it has none)."""
+    snippet = hit_store.snippet(hit_id) if hit_store else None
+    if snippet is None:
+        abort(404)
+    return jsonify(snippet)
+
+
+@app.route('/api/configs/<int:config_id>')
+def api_config(config_id):
+    """The config snapshot stored hits refer to by `config_id` (404 if unknown)."""
+    config = hit_store.config(config_id) if hit_store else None
+    if config is None:
+        abort(404)
+    config.pop('SECRET_KEY', None)      # Flask's session key is not for clients
+    return jsonify(config)
+
+
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     """Handle client connection."""
-    print('Client connected')
+    encoding, factor = broadcaster.add(request.sid, auth)
+    print(f'Client connected ({encoding}, {factor} samples/point pair)')
     
-    # Send initial buffer data
+    # Send initial buffer data (only the missed samples to a client that resumes)
     with data_lock:
-        emit('initial_data', {
-            'raw': list(raw_buffer),
-            'envelope': list(env_buffer),
-            'time': list(time_buffer),
-            'baseline': baseline,
-            'threshold': TRIGGER_THRESHOLD,
-            'pulse_count': pulse_count
-        })
+        raw, env, index, resumed = history.catch_up(broadcaster.resume_index(auth), BUFFER_SIZE)
+    
+    # The views stay valid until the ring wraps past them, so encode outside the lock
+    emit('initial_data', broadcaster.initial_data(
+        request.sid, raw, env, index, axis_t0(), resumed=resumed,
+        baseline=baseline, threshold=TRIGGER_THRESHOLD, pulse_count=pulse_count))
+
+
+@socketio.on('set_viewport')
+def handle_set_viewport(data):
+    """Client chart was resized: change its display resolution."""
+    if isinstance(data, dict):
+        broadcaster.set_viewport(request.sid, data.get('width'))
+
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Change this client's channels, rate or pause state; the profile in effect is the ack."""
+    return broadcaster.subscribe(request.sid, data)
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection."""
     print('Client disconnected')
+    broadcaster.remove(request.sid)
+
+
+@app.route('/api/stats')
+def api_stats():
+    """Same statistics as the stats event."""
+    return jsonify(collect_stats())
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition."""
+    if not ENABLE_MONITORING:
+        abort(404)
+    return Response(metrics.render(collect_stats()), content_type=CONTENT_TYPE)
+
+
+@app.route('/api/latency')
+def api_latency():
+    """Hit-to-pulse latency per stage: percentiles and histograms."""
+    if acquisition:
+        acquisition.poll()
+        return jsonify(acquisition.latency_report)
+    return jsonify(latency.report())
 
 
 @socketio.on('request_stats')
 def handle_stats_request():
     """Send current statistics to client."""
-    emit('stats', {
+    emit('stats', collect_stats())
+
+
+def collect_stats():
+    """Current statistics (stats event, /api/stats and /metrics)."""
+    stats = {
         'sample_count': sample_count,
         'baseline': baseline,
         'envelope': envelope,
-        'buffer_size': len(raw_buffer),
+        'buffer_size': len(history),
         'pulse_count': pulse_count
-    })
+    }
+    stats.update(broadcaster.stats())
+    stats.update(history.stats())
+    if acquisition:
+        # Link, clock, recorder, hit store, pulse and latency stats come from the acquisition process
+        stats.update(acquisition.stats())
+        stats['ring_samples_skipped'] = ring_skipped
+        metrics.follow(acquisition.status(), acquisition.block_samples)
+        return stats
+    stats.update(gaps.stats())
+    stats.update(clock.stats())
+    if recorder:
+        stats.update(recorder.stats())
+    if hit_store:
+        stats.update(hit_store.stats())
+    if replay:
+        stats.update(replay.stats())
+    if pulser:
+        stats.update(pulser.stats())
+    stats.update(latency.stats())
+    return stats
 
 
 def start_serial_thread():
-    """Start the serial reader thread."""
+    """Start the serial reader thread (the ring reader with --split)."""
     global serial_running
     serial_running = True
-    thread = Thread(target=serial_reader_thread, daemon=True)
+    thread = Thread(target=ring_reader_thread if acquisition else serial_reader_thread, daemon=True)
     thread.start()
     return thread
 
 
 if __name__ == '__main__':
+    import argparse
+    
+    ap = argparse.ArgumentParser(description="SICK PBT Sensor - Arduino GPIO Control + Web Visualization")
+    ap.add_argument("--port", default=SERIAL_PORT,
+                    help="serial port (e.g. a pty from python3 signal_gen.py --pty)")
+    ap.add_argument("--replay", metavar="PATH", default=REPLAY_SOURCE,
+                    help="replay a capture (.rec file or directory, .jsonl, ASCII dump) instead of the serial port")
+    ap.add_argument("--speed", type=float, default=REPLAY_SPEED,
+                    help="replay speed, x real time (0 = as fast as possible)")
+    ap.add_argument("--loop", action="store_true", default=REPLAY_LOOP,
+                    help="start the replay over when it runs out")
+    ap.add_argument("--split", action="store_true", default=ACQUISITION_PROCESS,
+                    help="read, detect and pulse in a separate process (see acquisition.py)")
+    args = ap.parse_args()
+    SERIAL_PORT = args.port
+    REPLAY_SOURCE, REPLAY_SPEED, REPLAY_LOOP = args.replay, args.speed, args.loop
+    ACQUISITION_PROCESS = args.split
+    
     print("=" * 60)
     print("SICK PBT Sensor - Arduino GPIO Control + Web Visualization")
     print("=" * 60)
-    print(f"Serial port: {SERIAL_PORT} @ {BAUD} baud")
+    if REPLAY_SOURCE:
+        print(f"Replay: {REPLAY_SOURCE} (no serial port, hits are counted but not pulsed)")
+    else:
+        print(f"Serial port: {SERIAL_PORT} @ {BAUD} baud")
     print(f"Samples per second: {SAMPLES_PER_SEC}")
     print(f"Arcade Interface (Arduino GPIO):")
     print(f"  Arduino Pin 6: Press START signal (Active HIGH, 5V output)")
@@ -356,11 +538,27 @@ if __name__ == '__main__':
     print(f"Peak Range: {A_MIN}-{A_MAX} ADC → Pulse Range: {W_MIN_MS}-{W_MAX_MS}ms")
     print(f"Trigger threshold: {TRIGGER_THRESHOLD} ADC counts")
     print(f"Web server: http://{HOST}:{PORT}")
+    if ACQUISITION_PROCESS:
+        print("Acquisition: separate process, shared-memory ring to the web server")
     print("=" * 60)
     
+    if ACQUISITION_PROCESS:
+        # The shared ring is the full-rate history; this process only reads it
+        acquisition = AcquisitionProcess(capacity_for_memory(MAX_BUFFER_MEMORY_MB), detector,
+                                         SERIAL_PORT, REPLAY_SOURCE, REPLAY_SPEED, REPLAY_LOOP)
+        history = HistoryStore(acquisition.ring, SAMPLES_PER_SEC, HISTORY_LEVELS)
+        if HITS_DB and not REPLAY_SOURCE:
+            # The acquisition process writes the hits; this one only queries them
+            hit_store = HitStore(HITS_DB, snippets=SnippetStore(SNIPPET_DIR) if SNIPPET_DIR else None)
+        acquisition.start()
+        apply_cpu_policy("Web server", WEB_CPU_CORES, WEB_PRIORITY)
+    
     # Start serial reader thread (includes GPIO pulse generation)
     start_serial_thread()
     
+    if ENABLE_MONITORING and METRICS_FILE:
+        metrics.start_log(METRICS_FILE, METRICS_INTERVAL, collect_stats)
+    
     try:
         # Run Flask app
         socketio.run(app, host=HOST, port=PORT, debug=DEBUG)
@@ -368,6 +566,8 @@ if __name__ == '__main__':
         print("\nShutting down...")
     finally:
         serial_running = False
+        if acquisition:
+            acquisition.stop()
         if ser:
             ser.close()
         # Send reset command to Arduino to reset GPIO pins
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - Multi-sensor Web App
+Every enabled sensor (PBT, PMT, GM) in one process and one web server
+
+Replaces one app.py per sensor: all serial ports are read by a single
+selector loop (sensors.py), each through its own DSP/detector settings
+and history, and served by one Flask-SocketIO server. Each sensor has a
+Socket.IO namespace (/pbt, /pmt, /gm); the page picks one with
+?sensor=<name>, and the default namespace shows the first sensor.
+"""
+import time
+import sys
+from threading import Thread
+from flask import Flask, render_template, request, jsonify
+from flask_socketio import SocketIO, emit
+from config import *
+from history import parse_query
+from broadcast import Broadcaster, ClientLimit
+from sensors import SensorPipeline, SensorReader, sensor_settings, make_history
+
+app = Flask(__name__)
+app.config['SECRET_KEY'] = SECRET_KEY
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+
+pipelines = {}      # name -> SensorPipeline
+broadcasters = {}   # namespace -> (sensor name, Broadcaster)
+reader = None       # SensorReader
+serial_running = False
+
+
+def setup_sensors():
+    """Pipelines, histories and namespaces for the enabled sensors."""
+    for name, settings in sensor_settings(SENSORS, globals()).items():
+        pipeline = SensorPipeline(name, settings, log_dropped=LOG_DROPPED_SAMPLES)
+        make_history(pipeline, HISTORY_LEVELS)
+        pipelines[name] = pipeline
+        namespaces = [f'/{name}'] + (['/'] if len(pipelines) == 1 else [])
+        limit = ClientLimit(MAX_CLIENTS)    # Per sensor, across its namespaces
+        for namespace in namespaces:
+            broadcasters[namespace] = (name, Broadcaster(
+                socketio, pipeline.sample_rate, BUFFER_SIZE, MAX_DISPLAY_POINTS, namespace=namespace,
+                client_limit=limit, queue_frames=CLIENT_QUEUE_FRAMES,
+                max_in_flight=CLIENT_MAX_IN_FLIGHT, lag_after=CLIENT_LAG_S, drop_after=CLIENT_DROP_S,
+                rates=CLIENT_RATES))
+            register_handlers(namespace)
+
+
+def serial_reader_thread():
+    """Read every sensor from one selector loop and emit each at EMIT_INTERVAL."""
+    global reader
+
+    for pipeline in pipelines.values():
+        print(f"{pipeline.name}: opening {pipeline.settings['port']}"
+              f" @ {pipeline.settings['baud']} baud, {pipeline.sample_rate} SPS")
+        pipeline.open()
+    reader = SensorReader(pipelines.values())
+    if not reader.pipelines:
+        print("ERROR: no sensor could be opened", file=sys.stderr)
+
+    last_emit = time.time()
+    while serial_running:
+        reader.poll(EMIT_INTERVAL)
+        now = time.time()
+        if now - last_emit < EMIT_INTERVAL:
+            continue
+        last_emit = now
+
+        # One batch per sensor, fanned out on each of its namespaces
+        batches = {name: pipeline.take_batch() for name, pipeline in pipelines.items()}
+        for name, broadcaster in broadcasters.values():
+            raw, env, first_index = batches[name]
+            if not raw:
+                continue
+            pipeline = pipelines[name]
+            broadcaster.publish(raw, env, first_index, pipeline.clock.t0,
+                                baseline=pipeline.baseline, threshold=pipeline.threshold,
+                                pulse_count=pipeline.hit_count)
+
+    reader.close()
+    print("Sensor reader thread stopped")
+
+
+def register_handlers(namespace):
+    """Socket.IO handlers for one sensor namespace."""
+    name, broadcaster = broadcasters[namespace]
+    pipeline = pipelines[name]
+
+    def handle_connect(auth=None):
+        encoding, factor = broadcaster.add(request.sid, auth)
+        print(f'Client connected to {name} ({encoding}, {factor} samples/point pair)')
+        with pipeline.lock:
+            raw, env, index, resumed = pipeline.history.catch_up(broadcaster.resume_index(auth),
+                                                                 BUFFER_SIZE)
+        emit('initial_data', broadcaster.initial_data(
+            request.sid, raw, env, index, pipeline.clock.t0, resumed=resumed,
+            baseline=pipeline.baseline, threshold=pipeline.threshold,
+            pulse_count=pipeline.hit_count, sensor=name))
+
+    def handle_set_viewport(data):
+        if isinstance(data, dict):
+            broadcaster.set_viewport(request.sid, data.get('width'))
+
+    def handle_subscribe(data):
+        return broadcaster.subscribe(request.sid, data)
+
+    def handle_disconnect():
+        broadcaster.remove(request.sid)
+
+    def handle_stats_request():
+        emit('stats', collect_stats(name))
+
+    def handle_query_history(params):
+        return query_history(name, params if isinstance(params, dict) else {})
+
+    for event, handler in (('connect', handle_connect), ('set_viewport', handle_set_viewport),
+                           ('subscribe', handle_subscribe), ('disconnect', handle_disconnect),
+                           ('request_stats', handle_stats_request),
+                           ('query_history', handle_query_history)):
+        socketio.on_event(event, handler, namespace=namespace)
+
+
+def query_history(name, params):
+    """Answer a history query for one sensor."""
+    try:
+        t_start, t_end, max_points = parse_query(params, HISTORY_MAX_POINTS)
+    except ValueError as e:
+        return {'error': str(e)}
+    pipeline = pipelines[name]
+    with pipeline.lock:
+        return pipeline.history.query(t_start, t_end, max_points, pipeline.clock.t0)
+
+
+def collect_stats(name):
+    """Statistics of one sensor, with its clients on every namespace."""
+    stats = pipelines[name].stats()
+    stats['clients'] = sum(b.stats().get('clients', 0)
+                           for sensor, b in broadcasters.values() if sensor == name)
+    return stats
+
+
+def sensor_arg():
+    """?sensor=<name> (default: the first sensor); None if unknown."""
+    name = request.args.get('sensor') or next(iter(pipelines))
+    if name not in pipelines:
+        return None
+    return name
+
+
+@app.route('/')
+def index():
+    """Main page (?sensor=<name> selects the namespace)."""
+    return render_template('index.html')
+
+
+@app.route('/api/sensors')
+def api_sensors():
+    """Configured sensors and their namespaces."""
+    return jsonify({name: {'namespace': f'/{name}', 'port': p.settings['port'],
+                           'samples_per_sec': p.sample_rate, 'connected': p.ser is not None}
+                    for name, p in pipelines.items()})
+
+
+@app.route('/api/stats')
+def api_stats():
+    """Statistics of every sensor (or ?sensor=<name>)."""
+    if request.args.get('sensor'):
+        name = sensor_arg()
+        if name is None:
+            return jsonify({'error': 'unknown sensor'}), 404
+        return jsonify(collect_stats(name))
+    return jsonify({name: collect_stats(name) for name in pipelines})
+
+
+@app.route('/api/history')
+def api_history():
+    """History of one sensor: ?sensor=&t_start=&t_end=&max_points="""
+    name = sensor_arg()
+    if name is None:
+        return jsonify({'error': 'unknown sensor'}), 404
+    result = query_history(name, request.args)
+    return jsonify(result), (400 if 'error' in result else 200)
+
+
+def start_serial_thread():
+    """Start the sensor reader thread."""
+    global serial_running
+    serial_running = True
+    thread = Thread(target=serial_reader_thread, daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    setup_sensors()
+
+    print("=" * 60)
+    print("SICK Sensors - Multi-sensor Web Visualization")
+    print("=" * 60)
+    if not pipelines:
+        print("ERROR: no sensor enabled in SENSORS (config.py)", file=sys.stderr)
+        sys.exit(1)
+    for name, pipeline in pipelines.items():
+        s = pipeline.settings
+        print(f"{name:>4}: {s['port']} @ {s['baud']} baud, {s['samples_per_sec']} SPS,"
+              f" threshold {s['trigger_threshold']}, pulses {'on' if s['pulses'] else 'off'}"
+              f"  →  http://{HOST}:{PORT}/?sensor={name}")
+    print("=" * 60)
+
+    start_serial_thread()
+
+    try:
+        socketio.run(app, host=HOST, port=PORT, debug=DEBUG)
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        serial_running = False
+        time.sleep(EMIT_INTERVAL * 2)
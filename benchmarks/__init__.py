@@ -0,0 +1,11 @@
+"""
+SICK Capstone - Benchmark suite
+Repeatable, hardware-free measurements of the acquisition and web path
+
+    python3 -m benchmarks                       # run all, save JSON
+    python3 -m benchmarks --quick dsp detect    # a subset, smaller inputs
+    python3 -m benchmarks --compare benchmarks/results/<earlier>.json
+
+Each bench_*.py module has run(quick) returning
+{name: {"value", "unit", "better"}}. See __main__.py for the runner.
+"""
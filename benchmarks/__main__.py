@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Run the benchmark suite, save the results as JSON and optionally compare
+them with an earlier run.
+
+A result is a regression when it is worse than the earlier value by more
+than --tolerance (higher-is-better values dropped, lower-is-better values
+rose). The exit status is 1 if any regression was found, so a deploy
+script can stop before copying a slower build to the Pi.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import importlib
+
+SUITES = ("parse", "dsp", "detect", "payloads", "fanout")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def run_suites(names, quick):
+    """{suite: results} for each suite; a missing dependency skips the suite."""
+    results = {}
+    for name in names:
+        module = importlib.import_module(f"benchmarks.bench_{name}")
+        t0 = time.perf_counter()
+        try:
+            results[name] = module.run(quick)
+        except ImportError as e:
+            print(f"{name:>9}: skipped ({e})")
+            results[name] = {"skipped": str(e)}
+            continue
+        print(f"{name:>9}: {time.perf_counter() - t0:.1f} s")
+        for key, m in results[name].items():
+            print(f"{'':>11}{key:<36} {m['value']:>16,.1f} {m['unit']}")
+    return results
+
+
+def compare(current, previous, tolerance):
+    """Print changes against an earlier run; return the list of regressions."""
+    regressions = []
+    print(f"\nAgainst {previous['meta']['time']} ({previous['meta']['host']}):")
+    for suite, metrics in current["results"].items():
+        before = previous["results"].get(suite, {})
+        for key, m in metrics.items():
+            if key == "skipped" or not isinstance(before.get(key), dict):
+                continue
+            old = before[key]["value"]
+            if not old or m["better"] not in ("higher", "lower"):
+                continue
+            change = m["value"] / old - 1.0
+            worse = -change if m["better"] == "higher" else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            print(f"  {suite + '.' + key:<44} {old:>14,.1f} → {m['value']:>14,.1f} {m['unit']:<10}"
+                  f" {change:+7.1%} {flag}")
+            if flag:
+                regressions.append(f"{suite}.{key}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="SICK benchmark suite (no hardware needed).")
+    ap.add_argument("suites", nargs="*", help=f"suites to run (default: all of {', '.join(SUITES)})")
+    ap.add_argument("--quick", action="store_true", help="smaller inputs, fewer repeats")
+    ap.add_argument("--output", default=None,
+                    help="result file (default: benchmarks/results/<host>_<time>.json)")
+    ap.add_argument("--compare", metavar="JSON", default=None, help="earlier result file")
+    ap.add_argument("--tolerance", type=float, default=0.2,
+                    help="relative slowdown counted as a regression (default 0.2 = 20%%)")
+    args = ap.parse_args()
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        ap.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+
+    meta = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "quick": args.quick,
+    }
+    try:
+        import numpy
+        meta["numpy"] = numpy.__version__
+    except ImportError:
+        pass
+
+    current = {"meta": meta, "results": run_suites(args.suites or SUITES, args.quick)}
+
+    path = args.output
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{meta['host'] or 'host'}_{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"\nSaved {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressions = compare(current, previous, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
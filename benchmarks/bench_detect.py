@@ -0,0 +1,36 @@
+"""
+Hit state machine: ns per sample for HitDetector.process over envelope
+blocks of a signal with a hit every ~2.5 s.
+"""
+from config import BASELINE_ALPHA, ENVELOPE_ALPHA, TRIGGER_THRESHOLD
+from dsp import EnvelopeFilter
+from hit_detector import HitDetector
+from benchmarks.common import metric, best_time, test_signal
+
+BLOCK_SIZES = (40, 512, 4096)
+
+
+def detector():
+    """Same settings as app_combined.py."""
+    return HitDetector(800, TRIGGER_THRESHOLD, 250, 200, TRIGGER_THRESHOLD * 0.4,
+                       (60, 95), (10, 100), inverse=True, hold_ms=100)
+
+
+def run(quick=False):
+    n = 40960 if quick else 409600
+    _, env = EnvelopeFilter(BASELINE_ALPHA, ENVELOPE_ALPHA, 40.0, 0.0).process(test_signal(n))
+    repeat = 2 if quick else 5
+
+    results = {}
+    for size in BLOCK_SIZES:
+        blocks = [env[i:i + size] for i in range(0, n, size)]
+        hits = []
+
+        def go():
+            det = detector()
+            hits[:] = [h for block in blocks for h in det.process(block)]
+
+        results[f"hit_detector_block_{size}"] = metric(best_time(go, repeat) / n * 1e9,
+                                                       "ns/sample", "lower")
+    results["hits_detected"] = metric(len(hits), "hits", "same")
+    return results
@@ -0,0 +1,32 @@
+"""
+Baseline/envelope update: ns per sample for the per-sample reference
+loop and for EnvelopeFilter.process at typical block sizes.
+"""
+from config import BASELINE_ALPHA, ENVELOPE_ALPHA
+from dsp import EnvelopeFilter, envelope_reference
+from benchmarks.common import metric, best_time, test_signal
+
+BLOCK_SIZES = (40, 512, 4096)
+
+
+def run(quick=False):
+    n = 40960 if quick else 409600
+    x = test_signal(n)
+    x_list = x.tolist()
+    repeat = 2 if quick else 5
+
+    t = best_time(lambda: envelope_reference(x_list, BASELINE_ALPHA, ENVELOPE_ALPHA, 40.0, 0.0),
+                  repeat)
+    results = {"reference_loop": metric(t / n * 1e9, "ns/sample", "lower")}
+
+    for size in BLOCK_SIZES:
+        blocks = [x_list[i:i + size] for i in range(0, n, size)]
+
+        def go():
+            filt = EnvelopeFilter(BASELINE_ALPHA, ENVELOPE_ALPHA, 40.0, 0.0)
+            for block in blocks:
+                filt.process(block)
+
+        results[f"envelope_filter_block_{size}"] = metric(best_time(go, repeat) / n * 1e9,
+                                                          "ns/sample", "lower")
+    return results
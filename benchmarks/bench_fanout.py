@@ -0,0 +1,58 @@
+"""
+Fan-out: time for one tick with 1/10/50 connected Socket.IO test
+clients, all-JSON full rate and all-binary decimated.
+
+Test clients queue packets in memory, so this is the server-side cost
+of the fan-out thread (decimate, encode, queue for each client), without
+network time. publish_50_clients is what the reader thread itself pays.
+"""
+import numpy as np
+from benchmarks.common import metric, best_time, test_signal
+
+CLIENTS = (1, 10, 50)
+PROFILES = {
+    "json_full": {"encoding": "json"},
+    "binary_800px": {"encoding": "binary", "width": 800},
+}
+
+
+def run(quick=False):
+    from flask import Flask, request
+    from flask_socketio import SocketIO
+    from broadcast import Broadcaster
+
+    rate, tick = 800, 40
+    raw = test_signal(rate * 10).tolist()
+    env = (np.abs(np.asarray(raw) - 40.0) * 0.8).tolist()
+    results = {}
+
+    for profile, auth in PROFILES.items():
+        for count in CLIENTS:
+            app = Flask(__name__)
+            socketio = SocketIO(app, async_mode='threading')
+            broadcaster = Broadcaster(socketio, rate, 4000, 4000)
+
+            @socketio.on('connect')
+            def connect(auth=None):
+                broadcaster.add(request.sid, auth)
+
+            clients = [socketio.test_client(app, auth=auth) for _ in range(count)]
+            position = [0]
+
+            def fanout():
+                i = position[0] % (len(raw) - tick)
+                broadcaster._deliver(broadcaster.frames(raw[i:i + tick], env[i:i + tick], position[0],
+                                                        0.0, baseline=41.7, threshold=60))
+                position[0] += tick
+
+            t = best_time(fanout, 3, 10 if quick else 50)
+            results[f"{profile}_{count}_clients"] = metric(t * 1e3, "ms/tick", "lower")
+
+            if count == CLIENTS[-1]:
+                # The reader's side: hand the tick over; the fan-out thread does the rest
+                t = best_time(lambda: broadcaster.publish(raw[:tick], env[:tick], 0, 0.0), 3, 1000)
+                results[f"{profile}_publish_{count}_clients"] = metric(t * 1e6, "us/tick", "lower")
+            for c in clients:
+                c.get_received()
+                c.disconnect()
+    return results
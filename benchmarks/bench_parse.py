@@ -0,0 +1,39 @@
+"""
+Serial parsing: samples/s for each reader over an in-memory port
+(parse cost only, no tty or USB latency).
+"""
+from serial_ingest import SerialIngest, FrameIngest, encode_frames, read_one_int, FRAME_SAMPLES
+from benchmarks.common import metric, best_time, test_signal, MemorySerial
+
+
+def run(quick=False):
+    n = 20000 if quick else 200000
+    n -= n % FRAME_SAMPLES
+    samples = test_signal(n).tolist()
+    ascii_payload = b"".join(b"%d\r\n" % v for v in samples)
+    frame_payload = encode_frames(samples)
+
+    def per_line():
+        ser = MemorySerial(ascii_payload)
+        for _ in range(n):
+            read_one_int(ser)
+
+    def bulk(reader, payload):
+        def go():
+            ingest = reader(MemorySerial(payload))
+            received = 0
+            while received < n:
+                block = ingest.read_block()
+                if not block:
+                    break
+                received += len(block)
+        return go
+
+    repeat = 2 if quick else 3
+    return {
+        "read_one_int": metric(n / best_time(per_line, repeat), "samples/s"),
+        "serial_ingest_ascii": metric(n / best_time(bulk(SerialIngest, ascii_payload), repeat),
+                                      "samples/s"),
+        "frame_ingest_binary": metric(n / best_time(bulk(FrameIngest, frame_payload), repeat),
+                                      "samples/s"),
+    }
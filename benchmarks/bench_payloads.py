@@ -0,0 +1,30 @@
+"""
+sensor_data payloads: Socket.IO packet bytes and encode time (payload +
+packet) for JSON and binary at one 20 Hz tick, one 10 Hz tick and a
+4000-sample initial_data.
+"""
+import numpy as np
+from payloads import encode_json, encode_binary, _packet_size
+from benchmarks.common import metric, best_time, test_signal
+
+SIZES = (40, 80, 4000)
+
+
+def run(quick=False):
+    rate = 800
+    results = {}
+    for n in SIZES:
+        raw = test_signal(n).tolist()
+        env = (np.abs(np.asarray(raw) - 40.0) * 0.8).tolist()
+        times = (123.0 + np.arange(n) / rate).tolist()
+        encoders = {
+            "json": lambda: encode_json(raw, env, times, baseline=41.7, threshold=60),
+            "binary": lambda: encode_binary(raw, env, 98400, rate, 0.0123,
+                                            baseline=41.7, threshold=60),
+        }
+        number = max(5, (2000 if quick else 20000) // n)
+        for name, encode in encoders.items():
+            t = best_time(lambda: _packet_size(encode()), 3, number)
+            results[f"{name}_{n}_encode"] = metric(t * 1e6, "µs", "lower")
+            results[f"{name}_{n}_bytes"] = metric(_packet_size(encode()), "bytes", "lower")
+    return results
@@ -0,0 +1,60 @@
+"""
+Shared helpers for the benchmark suite: timing, result records and
+hardware-free stand-ins for the serial port and the sensor signal.
+"""
+import io
+import time
+
+KERNEL_RX_BUFFER = 4095     # What one in_waiting can report on Linux
+
+
+def metric(value, unit, better="higher"):
+    """One result: value, unit, and whether higher or lower is better."""
+    return {"value": float(value), "unit": unit, "better": better}
+
+
+def best_time(fn, repeat=5, number=1):
+    """Fastest of `repeat` runs of `number` calls to fn, per call (seconds)."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return best
+
+
+def test_signal(n, sample_rate=800, seed=0):
+    """Reproducible raw samples with hits, as an int64 array."""
+    from signal_gen import SignalGenerator
+    return SignalGenerator(sample_rate, "pbt", seed=seed).generate(n)
+
+
+class MemorySerial:
+    """
+    In-memory serial port preloaded with what the Arduino would send.
+
+    Like a real tty, in_waiting never reports more than the kernel
+    receive buffer, so bulk readers see realistic chunk sizes.
+    """
+
+    def __init__(self, data, timeout=0.0):
+        self._buf = io.BytesIO(data)
+        self._size = len(data)
+        self.timeout = timeout
+
+    @property
+    def in_waiting(self):
+        return min(KERNEL_RX_BUFFER, self._size - self._buf.tell())
+
+    def read(self, n=1):
+        return self._buf.read(n)
+
+    def readline(self):
+        return self._buf.readline()
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
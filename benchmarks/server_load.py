@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Compare the threading and asyncio servers under 1-100 clients.
+
+For each server mode the app is started as a subprocess on a virtual
+Arduino (signal_gen.VirtualSerialPort, so the real serial path is used),
+then N Socket.IO clients connect and receive sensor_data for a while.
+Per run:
+    cpu         server process CPU (user + system) as % of one core
+    frames      sensor_data frames per client per second (vs 1/EMIT_INTERVAL)
+    delay       arrival time minus the newest sample's time, relative to
+                the smallest such lag seen in the run (p50 / p99, ms): how
+                much later than the best case a frame reached the client
+
+Not part of the regular suite: it needs python-socketio's asyncio client
+(aiohttp), binds the web PORT from config and takes a few minutes.
+    python3 -m benchmarks.server_load --clients 1 10 50 100 --seconds 10
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import PORT, EMIT_INTERVAL, SAMPLES_PER_SEC  # noqa: E402
+from signal_gen import SignalGenerator, VirtualSerialPort  # noqa: E402
+
+SERVERS = {
+    'threading': 'app.py',
+    'asyncio': 'app_async.py',
+}
+WARMUP_S = 2.0
+
+
+def process_cpu_seconds(pid):
+    """utime + stime of a process from /proc (Linux)."""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def newest_sample_time(payload):
+    """Time-axis value of the last point in a binary sensor_data payload."""
+    n = len(payload['raw']) // 2
+    if not n:
+        return None
+    last = n - 1
+    if payload.get('offsets'):
+        last = int(np.frombuffer(payload['offsets'], dtype='<u4')[-1])
+    return payload['t0'] + (payload['start'] + last) / payload['rate']
+
+
+async def measure(url, pid, n_clients, seconds):
+    """Connect n_clients, measure for `seconds`, return the run's numbers."""
+    import socketio
+
+    lags = []
+    frames = [0] * n_clients
+    measuring = False
+
+    def make_handler(k):
+        def on_data(payload):
+            if not measuring:
+                return
+            t = newest_sample_time(payload)
+            if t is not None:
+                lags.append(time.time() - t)
+                frames[k] += 1
+        return on_data
+
+    clients = []
+    for k in range(n_clients):
+        client = socketio.AsyncClient(reconnection=False)
+        client.on('sensor_data', make_handler(k))
+        await client.connect(url, auth={'encoding': 'binary'}, transports=['websocket'])
+        clients.append(client)
+
+    await asyncio.sleep(WARMUP_S)
+    measuring = True
+    cpu0, t0 = process_cpu_seconds(pid), time.perf_counter()
+    await asyncio.sleep(seconds)
+    measuring = False
+    cpu1, elapsed = process_cpu_seconds(pid), time.perf_counter() - t0
+
+    for client in clients:
+        await client.disconnect()
+
+    lags = np.array(lags)
+    delay = (lags - lags.min()) * 1000.0 if len(lags) else np.zeros(1)
+    return {
+        'clients': n_clients,
+        'cpu_percent': 100.0 * (cpu1 - cpu0) / elapsed,
+        'frames_per_client_s': sum(frames) / n_clients / elapsed,
+        'delay_p50_ms': float(np.percentile(delay, 50)),
+        'delay_p99_ms': float(np.percentile(delay, 99)),
+    }
+
+
+def wait_for_server(url, proc, timeout=20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode}")
+        try:
+            urllib.request.urlopen(url + '/api/stats', timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not come up")
+
+
+def run_mode(mode, pty, client_counts, seconds, rate):
+    url = f'http://127.0.0.1:{PORT}'
+    # Flask-SocketIO refuses to start its development server without a tty on stdin
+    tty_master, tty_slave = os.openpty()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, SERVERS[mode]), '--port', pty],
+                            cwd=ROOT, stdin=tty_slave, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    results = []
+    try:
+        wait_for_server(url, proc)
+        for n in client_counts:
+            res = asyncio.run(measure(url, proc.pid, n, seconds))
+            res['mode'] = mode
+            results.append(res)
+            print(f"{mode:>9} {n:>4} clients: cpu {res['cpu_percent']:5.1f}%,"
+                  f" {res['frames_per_client_s']:5.1f} frames/s per client"
+                  f" (of {1 / EMIT_INTERVAL:.0f}), delay p50 {res['delay_p50_ms']:6.1f} ms"
+                  f" p99 {res['delay_p99_ms']:6.1f} ms")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        os.close(tty_master)
+        os.close(tty_slave)
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Threading vs asyncio server under client load.")
+    ap.add_argument("--modes", nargs="+", default=list(SERVERS), help="server modes to run")
+    ap.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50, 100])
+    ap.add_argument("--seconds", type=float, default=10.0, help="measurement window per run")
+    ap.add_argument("--rate", type=int, default=SAMPLES_PER_SEC, help="virtual Arduino sample rate")
+    ap.add_argument("--output", default=None, help="also write the results as JSON")
+    args = ap.parse_args()
+    unknown = set(args.modes) - set(SERVERS)
+    if unknown:
+        ap.error(f"unknown mode(s): {', '.join(sorted(unknown))}")
+
+    port = VirtualSerialPort(SignalGenerator(args.rate, seed=1))
+    port.start()
+    results = []
+    try:
+        for mode in args.modes:
+            results.extend(run_mode(mode, port.port, args.clients, args.seconds, args.rate))
+    finally:
+        port.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'emit_interval': EMIT_INTERVAL, 'rate': args.rate, 'results': results}, f, indent=2)
+        print(f"Saved {args.output}")
+
+
+if __name__ == '__main__':
+    main()
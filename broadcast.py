@@ -0,0 +1,603 @@
+"""
+SICK Capstone - Client fan-out
+Sends sensor_data to each client in its own encoding and display resolution
+
+Clients describe themselves in the Socket.IO connect auth data:
+    io({auth: {encoding: 'binary', width: 800}})
+and may send 'set_viewport' {width} later (e.g. on window resize).
+A client without a width gets every sample, like before.
+
+A client may also pick a profile, in the auth data or later with
+'subscribe' {channels, rate, paused}:
+    channels  'all' (default), 'raw', 'envelope', or 'hits' (no samples,
+              only the scalar fields such as baseline and pulse_count)
+    rate      frames per second, snapped to the nearest of `rates`; the
+              samples in between are merged into the next frame (rates
+              above the tick rate get every tick; none = every tick)
+    paused    nothing is sent until it is unpaused
+
+Clients are grouped by (encoding, decimation factor, channels, rate).
+Each tick the block is decimated once per factor in use, and a group's
+frame is encoded once when it is due, however many clients share it.
+
+publish() only hands the tick to a fan-out thread, so the serial reader
+never waits on a client. Each client then has a bounded queue of frames
+(queue_frames); a client that acknowledges sensor_data (auth {acks: true},
+as static/js/main.js does) has at most max_in_flight frames unacknowledged,
+the rest wait in its queue and the oldest are dropped when it is full.
+A client that does not acknowledge gets the same window measured on its
+Socket.IO transport queue instead: frames wait in its own queue while
+more than max_in_flight frames' worth of packets are still unsent. If the
+transport queue cannot be seen, such a client is sent every frame as it
+is produced (counted as clients_unbounded in stats()).
+A client that has made no progress for lag_after seconds is told so with
+a 'lag' event, and after drop_after seconds it is disconnected.
+Connections beyond max_clients are refused; Broadcasters given the same
+ClientLimit (one sensor on two namespaces) share one max_clients budget.
+
+Every frame carries `end`, the sample index after the last sample it
+covers. A reconnecting client sends the newest `end` it has and the
+`stream` id from its initial_data (auth {stream, resume}); if history
+still holds the gap, initial_data then carries only the missing samples
+(resumed: true), otherwise a full snapshot as for a new client.
+
+With several sensors (app_multi.py) each has its own Broadcaster on its
+own Socket.IO namespace. AsyncBroadcaster does the same for a
+python-socketio AsyncServer (app_async.py).
+"""
+import sys
+import time
+import secrets
+import traceback
+from collections import deque
+from threading import Lock, Event, Thread
+import numpy as np
+from socketio.exceptions import ConnectionRefusedError
+from payloads import negotiate, encode_json, encode_binary
+from decimate import MinMaxDecimator, decimation_factor, minmax
+
+
+FANOUT_TICKS = 64       # Ticks waiting for the fan-out thread before the oldest are dropped
+LAG_CHECK_S = 0.5       # How often idle clients are checked for lag
+CHANNELS = ('all', 'raw', 'envelope', 'hits')
+RATE_SLACK = 0.2        # A group's frame may go this fraction of a period early (tick jitter)
+
+
+class ClientLimit:
+    """A max_clients budget, shared by the Broadcasters it is given to."""
+
+    def __init__(self, max_clients):
+        self.max_clients = max_clients
+        self.count = 0
+        self._lock = Lock()
+
+    def take(self):
+        """Count one more client; False (nothing counted) when full."""
+        with self._lock:
+            if self.max_clients and self.count >= self.max_clients:
+                return False
+            self.count += 1
+            return True
+
+    def give_back(self):
+        with self._lock:
+            self.count -= 1
+
+
+class _Client:
+    """Per-client state: group, outbound queue and acknowledgement window."""
+
+    __slots__ = ('encoding', 'factor', 'channels', 'rate', 'paused', 'acks', 'queue',
+                 'in_flight', 'progress', 'dropped', 'lagging', 'sent_until', 'packets')
+
+    def __init__(self, encoding, factor, acks, queue_frames):
+        self.encoding = encoding
+        self.factor = factor
+        self.channels = 'all'
+        self.rate = None        # Frames per second (None = every tick)
+        self.paused = False
+        self.acks = acks
+        self.queue = deque(maxlen=queue_frames)
+        self.in_flight = 0
+        self.progress = time.monotonic()    # Last ack, or the send into an empty window
+        self.dropped = 0
+        self.lagging = False
+        self.sent_until = 0     # Frames ending at or before this were in initial_data
+        self.packets = 1        # Transport packets per frame sent to it (see _packets)
+
+    @property
+    def group(self):
+        return self.encoding, self.factor, self.channels, self.rate
+
+    @property
+    def wants_samples(self):
+        return not self.paused and self.channels != 'hits'
+
+    def room(self):
+        """Room of the client's group (None while paused or not yet set up)."""
+        if self.paused or self.factor is None:
+            return None
+        return _room(self.group)
+
+
+class _Pending:
+    """Decimated points of one (factor, rate) group waiting for its next frame."""
+
+    __slots__ = ('parts', 'end', 'next_at')
+
+    def __init__(self):
+        self.parts = []
+        self.end = None
+        self.next_at = float('-inf')
+
+    def due(self, rate, now):
+        return rate is None or now >= self.next_at - RATE_SLACK / rate
+
+    def take(self, rate, now):
+        """(raw, env, index, end) of everything since the last frame."""
+        if rate is not None:
+            # On schedule, so the average rate holds whatever the tick jitter
+            self.next_at += 1 / rate
+            if self.next_at <= now:
+                self.next_at = now + 1 / rate
+        parts, self.parts = self.parts, []
+        if not parts:
+            return [], [], np.empty(0, dtype=np.int64), self.end
+        raw, env, idx = parts[0]
+        for r, e, i in parts[1:]:
+            raw, env, idx = _join(raw, r), _join(env, e), np.concatenate((idx, i))
+        return raw, env, idx, self.end
+
+
+class Broadcaster:
+    """Per-client encoding/decimation registry and per-tick fan-out."""
+
+    def __init__(self, socketio, sample_rate, window_samples, max_points, namespace=None,
+                 max_clients=None, queue_frames=8, max_in_flight=2, lag_after=2.0, drop_after=10.0,
+                 rates=(5, 10, 20, 60), client_limit=None):
+        """client_limit: a ClientLimit shared with other Broadcasters (replaces max_clients)."""
+        self.socketio = socketio
+        self.namespace = namespace
+        self.sample_rate = sample_rate
+        self.window_samples = window_samples
+        self.max_points = max_points
+        self.client_limit = client_limit or ClientLimit(max_clients)
+        self.queue_frames = queue_frames
+        self.max_in_flight = max_in_flight
+        self.lag_after = lag_after
+        self.drop_after = drop_after
+        self.rates = sorted(rates)
+        self.stream = secrets.token_hex(6)     # Sample indices restart with a new server
+        self._lock = Lock()
+        self._clients = {}      # sid -> _Client
+        self._decimators = {}   # factor -> MinMaxDecimator
+        self._pending = {}      # (factor, rate) -> _Pending
+        self._ticks = deque()
+        self._wake = Event()
+        self._thread = None
+        self.ticks_dropped = 0
+        self.frames_dropped = 0
+        self.refused = 0
+        self.disconnected_slow = 0
+
+    def add(self, sid, auth=None):
+        """Register a connecting client; returns its (encoding, factor).
+
+        Raises ConnectionRefusedError when max_clients are already connected.
+        """
+        encoding = negotiate(auth)
+        width = auth.get('width') if isinstance(auth, dict) else None
+        acks = bool(auth.get('acks')) if isinstance(auth, dict) else False
+        # Fully set up before the fan-out thread can see it
+        client = _Client(encoding, self._factor(width), acks, self.queue_frames)
+        for name, value in self._profile(auth).items():
+            setattr(client, name, value)
+        with self._lock:
+            if sid not in self._clients and not self.client_limit.take():
+                self.refused += 1
+                raise ConnectionRefusedError('server full')
+            old = self._clients.get(sid)
+            old_room = old.room() if old else None
+            self._clients[sid] = client
+            if client.wants_samples and client.factor not in self._decimators:
+                self._decimators[client.factor] = MinMaxDecimator(client.factor)
+            self._prune()
+        if client.room() != old_room:
+            self._move(sid, old_room, client.room())
+        return encoding, client.factor
+
+    def resume_index(self, auth):
+        """Sample index a reconnecting client has everything before, or None."""
+        if not isinstance(auth, dict) or auth.get('stream') != self.stream:
+            return None
+        try:
+            return int(auth['resume'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def set_viewport(self, sid, width):
+        """Change a client's display resolution."""
+        self._update(sid, factor=self._factor(width))
+
+    def subscribe(self, sid, data):
+        """Change a client's profile; returns the one in effect (None if unknown)."""
+        client = self._update(sid, **self._profile(data))
+        if client is None:
+            return None
+        return {'channels': client.channels, 'rate': client.rate, 'paused': client.paused}
+
+    def remove(self, sid):
+        """Forget a disconnected client."""
+        with self._lock:
+            if self._clients.pop(sid, None) is not None:
+                self.client_limit.give_back()
+            self._prune()
+
+    def _factor(self, width):
+        try:
+            width = int(width) if width else None
+        except (TypeError, ValueError):
+            width = None
+        return decimation_factor(width, self.window_samples, self.max_points)
+
+    def _profile(self, data):
+        """Valid profile settings in auth/subscribe data (missing ones left out)."""
+        if not isinstance(data, dict):
+            return {}
+        profile = {}
+        if data.get('channels') in CHANNELS:
+            profile['channels'] = data['channels']
+        if 'rate' in data and not data['rate']:
+            profile['rate'] = None
+        elif 'rate' in data:
+            try:
+                rate = float(data['rate'])
+            except (TypeError, ValueError):
+                rate = 0
+            if rate > 0 and self.rates:
+                profile['rate'] = min(self.rates, key=lambda r: abs(r - rate))
+        if 'paused' in data:
+            profile['paused'] = bool(data['paused'])
+        return profile
+
+    def _update(self, sid, **changes):
+        """Apply factor/profile changes to a client; returns it (None if unknown)."""
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None:
+                return None
+            old_group, old_room = client.group, client.room()
+            for name, value in changes.items():
+                setattr(client, name, value)
+            if client.group != old_group or client.paused:
+                client.queue.clear()    # Queued frames are for the old group
+            if client.wants_samples and client.factor not in self._decimators:
+                self._decimators[client.factor] = MinMaxDecimator(client.factor)
+            self._prune()
+            new_room = client.room()
+        if new_room != old_room:
+            self._move(sid, old_room, new_room)
+        return client
+
+    def _move(self, sid, old_room, new_room):
+        """A client changed group (AsyncBroadcaster keeps a room per group)."""
+
+    def _prune(self):
+        """Drop decimators no client uses any more (caller holds the lock)."""
+        used = {client.factor for client in self._clients.values() if client.wants_samples}
+        for factor in list(self._decimators):
+            if factor not in used:
+                del self._decimators[factor]
+
+    def publish(self, raw, env, start, t0, **fields):
+        """Queue one tick of consecutive samples (first index `start`) for the fan-out thread.
+
+        O(1) and never blocks: the lists are kept as they are, so the caller
+        must not modify them afterwards.
+        """
+        if len(self._ticks) >= FANOUT_TICKS:
+            self._ticks.popleft()
+            self.ticks_dropped += 1
+        self._ticks.append((raw, env, start, t0, fields))
+        self._wake.set()
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='fanout', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Fan-out thread: encode queued ticks, fill client queues, watch for lag."""
+        while True:
+            self._wake.wait(LAG_CHECK_S)
+            self._wake.clear()
+            ticks = []
+            while self._ticks:
+                ticks.append(self._ticks.popleft())
+            # One bad tick must not stop sensor_data for every client
+            try:
+                for raw, env, start, t0, fields in _coalesce(ticks):
+                    self._deliver(self.frames(raw, env, start, t0, **fields))
+                self._check_lag()
+            except Exception:
+                print("ERROR: fan-out tick failed:", file=sys.stderr)
+                traceback.print_exc()
+
+    def _deliver(self, frames):
+        """Queue each group's payload for its clients and send what their windows allow."""
+        payloads = dict(frames)
+        # Sent under the lock so a client's frames cannot be reordered by _acked();
+        # an emit only queues the packet for the client's writer
+        with self._lock:
+            for sid, client in self._clients.items():
+                payload = payloads.get(client.group)
+                if payload is None or client.paused or payload['end'] <= client.sent_until:
+                    continue
+                if len(client.queue) == client.queue.maxlen:
+                    client.dropped += 1
+                    self.frames_dropped += 1
+                client.queue.append(payload)
+                for queued in self._take(sid, client):
+                    self._emit(sid, queued, client.acks)
+
+    def _take(self, sid, client):
+        """Queued frames the client may be sent now (caller holds the lock)."""
+        out = []
+        if not client.acks:
+            # The window is what is still waiting in the client's transport queue
+            backlog = self._backlog(sid)
+            room = (len(client.queue) if backlog is None
+                    else self.max_in_flight - -(-backlog // client.packets))
+            if room > 0:
+                client.progress = time.monotonic()
+            while client.queue and room > 0:
+                frame = client.queue.popleft()
+                client.packets = _packets(frame)
+                out.append(frame)
+                room -= 1
+            return out
+        while client.queue and client.in_flight < self.max_in_flight:
+            if not client.in_flight:
+                client.progress = time.monotonic()
+            client.in_flight += 1
+            out.append(client.queue.popleft())
+        return out
+
+    def _server(self):
+        # python-socketio itself (Flask-SocketIO keeps it as .server)
+        return getattr(self.socketio, 'server', None) or self.socketio
+
+    def _backlog(self, sid):
+        """Packets waiting in a client's transport queue, or None if that cannot be seen."""
+        server = self._server()
+        try:
+            eio_sid = server.manager.eio_sid_from_sid(sid, self.namespace or '/')
+            return server.eio.sockets[eio_sid].queue.qsize()
+        except (AttributeError, KeyError, TypeError, NotImplementedError):
+            return None
+
+    def _emit(self, sid, payload, acks):
+        # Acks go through python-socketio itself: Flask-SocketIO only runs
+        # callbacks for emits made inside a request context
+        callback = (lambda *_: self._acked(sid)) if acks else None
+        self._server().emit('sensor_data', payload, to=sid, namespace=self.namespace, callback=callback)
+
+    def _acked(self, sid):
+        """A client acknowledged a frame: open its window and send what is queued."""
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None:
+                return
+            client.in_flight = max(0, client.in_flight - 1)
+            client.progress = time.monotonic()
+            recovered, client.lagging = client.lagging, False
+            for payload in self._take(sid, client):
+                self._emit(sid, payload, True)
+        if recovered:
+            self._notify_lag(sid, False, client.dropped)
+
+    def _check_lag(self):
+        """Flag clients whose window has been full for lag_after s; drop them after drop_after s."""
+        now = time.monotonic()
+        flagged, stalled, recovered = [], [], []
+        with self._lock:
+            for sid, client in self._clients.items():
+                if not client.acks:
+                    # Send what waited for the transport to drain; stuck if frames still wait
+                    for payload in self._take(sid, client):
+                        self._emit(sid, payload, False)
+                    if not client.queue:
+                        if client.lagging:
+                            client.lagging = False
+                            recovered.append((sid, client.dropped))
+                        continue
+                elif client.in_flight < self.max_in_flight:
+                    continue
+                waited = now - client.progress
+                if self.drop_after and waited >= self.drop_after:
+                    stalled.append(sid)
+                elif waited >= self.lag_after and not client.lagging:
+                    client.lagging = True
+                    flagged.append((sid, client.dropped))
+        for sid, dropped in flagged:
+            self._notify_lag(sid, True, dropped)
+        for sid, dropped in recovered:
+            self._notify_lag(sid, False, dropped)
+        for sid in stalled:
+            self.remove(sid)
+            self.disconnected_slow += 1
+            self._server().disconnect(sid, namespace=self.namespace or '/')
+
+    def _notify_lag(self, sid, lagging, dropped):
+        self._server().emit('lag', {'lagging': lagging, 'dropped': dropped}, to=sid, namespace=self.namespace)
+
+    def frames(self, raw, env, start, t0, **fields):
+        """
+        (group, payload) for each group due a frame after this tick; groups
+        with nothing to send are left out. group is (encoding, factor,
+        channels, rate).
+        """
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            groups = {}     # (factor, rate) -> {(encoding, channels)}
+            for client in self._clients.values():
+                if not client.paused and client.factor is not None:
+                    groups.setdefault((client.factor, client.rate), set()).add(
+                        (client.encoding, client.channels))
+            points = {}
+            for factor in {c.factor for c in self._clients.values()
+                           if c.wants_samples and c.factor is not None}:
+                decimator = self._decimators[factor]
+                points[factor] = decimator.process(raw, env, start) + (decimator.end,)
+
+            for key in set(self._pending) - set(groups):
+                del self._pending[key]
+            for (factor, rate), members in groups.items():
+                pending = self._pending.setdefault((factor, rate), _Pending())
+                if factor in points:
+                    r, e, idx, pending.end = points[factor]
+                    if len(r):
+                        pending.parts.append((r, e, idx))
+                else:
+                    pending.end = start + len(raw)      # 'hits' only: no samples
+                if pending.due(rate, now):
+                    due.append((factor, rate, members, pending.take(rate, now)))
+
+        frames = []
+        for factor, rate, members, (r, e, idx, end) in due:
+            for encoding, channels in members:
+                if channels != 'hits' and not len(r):
+                    continue    # Bucket still open; it goes out with the next tick
+                frames.append(((encoding, factor, channels, rate),
+                               self._encode(encoding, r, e, idx, factor, t0,
+                                            dict(fields, end=end), channels)))
+        return frames
+
+    def initial_data(self, sid, raw, env, index, t0, resumed=False, **fields):
+        """
+        initial_data payload for one client from a history snapshot, or
+        from the samples it missed when `resumed` (see HistoryStore.catch_up).
+        """
+        with self._lock:
+            client = self._clients.get(sid)
+            encoding, factor, channels = ((client.encoding, client.factor, client.channels)
+                                          if client else ('json', 1, 'all'))
+        start = int(index[0]) if len(index) else 0
+        if channels == 'hits':
+            r, e, idx, leftover = raw[:0], env[:0], index[:0], 0
+        else:
+            # Closed buckets only: the open one arrives through the live stream
+            r, e, idx, leftover = minmax(raw, env, start, factor, keep_partial=False)
+        fields.update(window=self.window_samples / self.sample_rate, stream=self.stream,
+                      resumed=resumed)
+        if len(index):
+            fields['end'] = start + len(raw) - leftover
+            with self._lock:
+                if client is not None:
+                    client.sent_until = fields['end']
+        return self._encode(encoding, r, e, idx, factor, t0, fields, channels)
+
+    def _encode(self, encoding, raw, env, idx, factor, t0, fields, channels='all'):
+        fields = dict(fields, factor=factor)
+        if channels != 'all':
+            fields['channels'] = channels
+        if channels == 'hits':
+            return fields
+        if channels == 'raw':
+            env = None
+        elif channels == 'envelope':
+            raw = None
+        if encoding == 'binary':
+            start = int(idx[0]) if len(idx) else 0
+            offsets = idx - start if factor > 1 else None
+            return encode_binary(raw, env, start, self.sample_rate, t0, offsets, **fields)
+        times = t0 + idx / self.sample_rate
+        return encode_json(None if raw is None else _as_list(raw),
+                           None if env is None else _as_list(env), times.tolist(), **fields)
+
+    def stats(self):
+        """Client counts and backpressure counters for the stats event."""
+        with self._lock:
+            clients = [c for c in self._clients.values() if c.factor is not None]
+            unbounded = sum(1 for sid, c in self._clients.items()
+                            if not c.acks and self._backlog(sid) is None)
+        return {
+            'clients': len(clients),
+            'clients_binary': sum(1 for c in clients if c.encoding == 'binary'),
+            'clients_decimated': sum(1 for c in clients if c.factor > 1),
+            'clients_paused': sum(1 for c in clients if c.paused),
+            'client_profiles': len({c.group for c in clients if not c.paused}),
+            'clients_lagging': sum(1 for c in clients if c.lagging),
+            'clients_no_acks': sum(1 for c in clients if not c.acks),
+            'clients_unbounded': unbounded,
+            'clients_refused': self.refused,
+            'clients_disconnected_slow': self.disconnected_slow,
+            'client_frames_dropped': self.frames_dropped,
+            'fanout_ticks_dropped': self.ticks_dropped,
+        }
+
+
+class AsyncBroadcaster(Broadcaster):
+    """
+    Broadcaster for a python-socketio AsyncServer, one room per group.
+    Room changes are queued by add()/set_viewport() and applied by
+    `await apply_rooms()`; publish() is a coroutine that emits to the rooms
+    directly (an emit only queues on the event loop, it never waits for a
+    client), so there is no fan-out thread or per-client window here.
+    max_clients is enforced as for Broadcaster.
+    """
+
+    def __init__(self, sio, sample_rate, window_samples, max_points, namespace=None, **limits):
+        super().__init__(sio, sample_rate, window_samples, max_points, namespace, **limits)
+        self._moves = []
+
+    def _move(self, sid, old_room, new_room):
+        self._moves.append((sid, old_room, new_room))
+
+    def _backlog(self, sid):
+        """Room emits bypass the per-client window, so no client is bounded here."""
+        return None
+
+    async def apply_rooms(self):
+        """Apply the room changes queued since the last call."""
+        moves, self._moves = self._moves, []
+        for sid, old_room, new_room in moves:
+            if old_room is not None:
+                await self.socketio.leave_room(sid, old_room, namespace=self.namespace)
+            if new_room is not None:
+                await self.socketio.enter_room(sid, new_room, namespace=self.namespace)
+
+    async def publish(self, raw, env, start, t0, **fields):
+        for group, payload in self.frames(raw, env, start, t0, **fields):
+            await self.socketio.emit('sensor_data', payload, to=_room(group), namespace=self.namespace)
+
+
+def _room(group):
+    return '/'.join(str(part) for part in group)
+
+
+def _packets(payload):
+    """Transport packets one frame takes: the event plus one per binary attachment."""
+    return 1 + sum(isinstance(value, bytes) for value in payload.values())
+
+
+def _coalesce(ticks):
+    """Merge runs of consecutive ticks into one (newest fields win)."""
+    merged = []
+    for raw, env, start, t0, fields in ticks:
+        if merged:
+            m_raw, m_env, m_start, m_t0, _ = merged[-1]
+            if m_start + len(m_raw) == start and m_t0 == t0:
+                merged[-1] = (_join(m_raw, raw), _join(m_env, env), m_start, t0, fields)
+                continue
+        merged.append((raw, env, start, t0, fields))
+    return merged
+
+
+def _join(a, b):
+    if isinstance(a, list) and isinstance(b, list):
+        return a + b
+    return np.concatenate((np.asarray(a), np.asarray(b)))
+
+
+def _as_list(values):
+    return values if isinstance(values, list) else values.tolist()
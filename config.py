@@ -9,6 +9,7 @@ Modify these settings as needed for your setup
 SERIAL_PORT = "/dev/ttyUSB0"  # Change to your Arduino's serial port
 BAUD = 115200                  # Baud rate (must match Arduino)
 SAMPLES_PER_SEC = 800         # Expected sample rate from Arduino
+SERIAL_PROTOCOL = 'auto'      # 'auto' (try binary frames, fall back to ASCII), 'binary' or 'ascii'
 
 # ============================================
 # Signal Processing Parameters
@@ -27,17 +28,113 @@ HOST = '0.0.0.0'              # Listen on all interfaces (use '127.0.0.1' for lo
 PORT = 5000                   # Web server port
 SECRET_KEY = 'sick-capstone-secret'  # Change this for production!
 DEBUG = False                 # Set to True for development
+SERVER_MODE = 'threading'     # 'threading' (Flask-SocketIO) or 'asyncio' (app_async.py, needs aiohttp)
 
 # ============================================
 # Data Buffer Settings
 # ============================================
-BUFFER_SIZE = 4000           # Maximum samples to keep in memory (5 sec at 800 Hz)
+BUFFER_SIZE = 4000           # Samples sent to a newly connected client (5 sec at 800 Hz)
+MAX_BUFFER_MEMORY_MB = 50    # Sample history kept in memory (~28 bytes/sample, ~39 min at 800 Hz)
 EMIT_INTERVAL = 0.05         # How often to send data to clients (seconds, 0.05 = 20 Hz)
 
+# ============================================
+# Web Clients (backpressure)
+# ============================================
+MAX_CLIENTS = 20             # Refuse connections beyond this (None = no limit; per sensor in app_multi.py)
+CLIENT_QUEUE_FRAMES = 10     # Frames queued per client before the oldest are dropped
+CLIENT_MAX_IN_FLIGHT = 4     # Frames sent to a client and not yet acknowledged
+CLIENT_LAG_S = 2.0           # No ack for this long: client gets a 'lag' event
+CLIENT_DROP_S = 15.0         # No ack for this long: client is disconnected
+CLIENT_RATES = (5, 10, 20, 60)  # Frame rates a client may subscribe to (Hz)
+
+# ============================================
+# History (scroll-back)
+# ============================================
+# Rollups behind the full-rate buffer: (samples per bucket, seconds kept).
+# Each bucket stores raw/envelope min, max and mean (~20 bytes); these
+# defaults keep 1 h at 10x, 24 h at 100x and 7 days at 1000x in ~30 MB.
+HISTORY_LEVELS = [(10, 3600), (100, 24 * 3600), (1000, 7 * 24 * 3600)]
+HISTORY_MAX_POINTS = 2000    # Upper limit on points returned by one history query
+
+# ============================================
+# Recording
+# ============================================
+# Append raw samples to disk (see recorder.py). Writes happen on their own
+# thread behind a bounded queue; if the disk stalls long enough to fill it,
+# blocks are dropped from the recording (counted in stats), never from
+# acquisition. 2 bytes per sample: ~5.5 MB per hour at 800 SPS.
+RECORD_ENABLED = False
+RECORD_DIR = "recordings"
+RECORD_MAX_FILE_MB = 64      # Start a new file after this many MB ...
+RECORD_MAX_FILE_S = 3600     # ... or after this many seconds
+RECORD_QUEUE_BLOCKS = 1024   # Blocks the writer may fall behind before dropping
+
+# ============================================
+# Hit Store
+# ============================================
+# Every hit app_combined.py detects goes into a SQLite database (see
+# hit_store.py), written by its own thread behind a bounded queue; served
+# by /api/hits, /api/hits/top and /api/hits/hourly. ~90 bytes per hit.
+HITS_DB = "hits.db"          # None = do not store hits
+HITS_QUEUE = 1024            # Hits the writer may fall behind before dropping
+HITS_MAX_ROWS = 500          # Upper limit on hits returned by one query
+
+# Raw + envelope samples around each stored hit (see snippets.py), from
+# SNIPPET_PRE_MS before the trigger to SNIPPET_POST_MS after capture end;
+# 6 bytes per sample, ~3 KB per hit at 800 SPS. Served by
+# /api/hits/<id>/snippet.
+SNIPPET_DIR = "snippets"     # None = store hits without their waveform
+SNIPPET_PRE_MS = 200         # Lookback before the trigger
+SNIPPET_POST_MS = 200        # Kept after capture end
+SNIPPET_CHUNK_MB = 64        # Start a new chunk file after this many MB
+
+# ============================================
+# Replay
+# ============================================
+# Drive the app from a capture instead of the Arduino (see replay.py):
+# a recordings directory or .rec file, a .jsonl log or an ASCII dump.
+# Also settable per run: python3 app.py --replay recordings/ --speed 10
+REPLAY_SOURCE = None         # None = read the serial port
+REPLAY_SPEED = 1.0           # x real time; 0 = as fast as the pipeline goes
+REPLAY_LOOP = False          # Start over when the capture runs out
+
 # ============================================
 # Chart Display Settings
 # ============================================
-MAX_DISPLAY_POINTS = 4000    # Maximum points to display on chart
+MAX_DISPLAY_POINTS = 4000    # Max points per window sent to a chart (min/max decimated to its width)
 ADC_MIN = 0                  # Minimum ADC value
 ADC_MAX = 1023              # Maximum ADC value (10-bit ADC)
 
+# ============================================
+# Monitoring
+# ============================================
+LOG_DROPPED_SAMPLES = True   # Print a warning whenever samples are lost on the serial link
+ENABLE_MONITORING = True     # Serve /metrics (Prometheus text format, see metrics.py)
+METRICS_INTERVAL = 10        # Seconds between lines in METRICS_FILE
+METRICS_FILE = None          # Also append metrics as JSON lines here (None = off)
+
+# ============================================
+# Process Layout
+# ============================================
+# Run serial reading, hit detection and button presses in their own
+# process (acquisition.py) that writes into a shared-memory ring; the web
+# server only reads from it. Also: python3 app_combined.py --split
+ACQUISITION_PROCESS = False
+PBT_CPU_CORES = None         # e.g. [0] to pin acquisition to core 0 (None = any core)
+WEB_CPU_CORES = None         # e.g. [1, 2, 3]
+PBT_PRIORITY = 0             # nice value; below 0 needs root or CAP_SYS_NICE
+WEB_PRIORITY = 0
+
+# ============================================
+# Sensors (app_multi.py)
+# ============================================
+# app_multi.py reads every enabled sensor in one process, one serial port
+# each, and serves them all on PORT (?sensor=<name> picks one; the first
+# is the default). Settings left out of an entry (baud, samples_per_sec,
+# protocol, baseline_alpha, envelope_alpha, trigger_threshold, memory_mb)
+# use the values above; see sensors.py for the detector settings.
+SENSORS = {
+    'pbt': {'port': SERIAL_PORT, 'pulses': True},
+    'pmt': {'enabled': False, 'port': "/dev/ttyUSB1"},
+    'gm': {'enabled': False, 'port': "/dev/ttyUSB2"},
+}
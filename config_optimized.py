@@ -11,6 +11,7 @@ To use: Copy this to config.py or import settings from here
 SERIAL_PORT = "/dev/ttyUSB0"
 BAUD = 115200
 SAMPLES_PER_SEC = 800
+SERIAL_PROTOCOL = 'auto'     # 'auto', 'binary' or 'ascii'
 
 # ============================================
 # Signal Processing Parameters  
@@ -27,6 +28,7 @@ HOST = '0.0.0.0'
 PORT = 5000
 SECRET_KEY = 'sick-capstone-secret'  # Change in production!
 DEBUG = False
+SERVER_MODE = 'threading'    # or 'asyncio' (app_async.py, needs aiohttp)
 
 # ============================================
 # PERFORMANCE OPTIMIZATIONS
@@ -40,14 +42,70 @@ EMIT_INTERVAL = 0.1          # 10 Hz updates (was 0.05 = 20 Hz)
 
 # Limit simultaneous web clients
 MAX_CLIENTS = 10             # Reject connections beyond this
+CLIENT_QUEUE_FRAMES = 5      # 0.5 s of frames per client at 10 Hz
+CLIENT_MAX_IN_FLIGHT = 2     # Unacknowledged frames per client
+CLIENT_LAG_S = 2.0           # No ack for this long: 'lag' event
+CLIENT_DROP_S = 10.0         # No ack for this long: disconnect
+CLIENT_RATES = (5, 10, 20, 60)  # Frame rates a client may subscribe to (Hz)
 
 # Chart display settings (less data = better performance)
-MAX_DISPLAY_POINTS = 2000    # Was 4000
+MAX_DISPLAY_POINTS = 2000    # Was 4000 (server decimates to min(chart width, this))
 
 # ADC range
 ADC_MIN = 0
 ADC_MAX = 1023
 
+# ============================================
+# History (scroll-back)
+# ============================================
+# Rollups behind the full-rate buffer: (samples per bucket, seconds kept).
+# Each bucket stores raw/envelope min, max and mean (~20 bytes); these
+# defaults keep 1 h at 10x, 24 h at 100x and 7 days at 1000x in ~30 MB.
+HISTORY_LEVELS = [(10, 3600), (100, 24 * 3600), (1000, 7 * 24 * 3600)]
+HISTORY_MAX_POINTS = 2000    # Upper limit on points returned by one history query
+
+# ============================================
+# Recording
+# ============================================
+# Append raw samples to disk (see recorder.py). Writes happen on their own
+# thread behind a bounded queue; if the disk stalls long enough to fill it,
+# blocks are dropped from the recording (counted in stats), never from
+# acquisition. 2 bytes per sample: ~5.5 MB per hour at 800 SPS.
+RECORD_ENABLED = False
+RECORD_DIR = "recordings"
+RECORD_MAX_FILE_MB = 64      # Start a new file after this many MB ...
+RECORD_MAX_FILE_S = 3600     # ... or after this many seconds
+RECORD_QUEUE_BLOCKS = 1024   # Blocks the writer may fall behind before dropping
+
+# ============================================
+# Hit Store
+# ============================================
+# Every hit app_combined.py detects goes into a SQLite database (see
+# hit_store.py), written by its own thread behind a bounded queue; served
+# by /api/hits, /api/hits/top and /api/hits/hourly. ~90 bytes per hit.
+HITS_DB = "hits.db"          # None = do not store hits
+HITS_QUEUE = 1024            # Hits the writer may fall behind before dropping
+HITS_MAX_ROWS = 500          # Upper limit on hits returned by one query
+
+# Raw + envelope samples around each stored hit (see snippets.py), from
+# SNIPPET_PRE_MS before the trigger to SNIPPET_POST_MS after capture end;
+# 6 bytes per sample, ~3 KB per hit at 800 SPS. Served by
+# /api/hits/<id>/snippet.
+SNIPPET_DIR = "snippets"     # None = store hits without their waveform
+SNIPPET_PRE_MS = 200         # Lookback before the trigger
+SNIPPET_POST_MS = 200        # Kept after capture end
+SNIPPET_CHUNK_MB = 64        # Start a new chunk file after this many MB
+
+# ============================================
+# Replay
+# ============================================
+# Drive the app from a capture instead of the Arduino (see replay.py):
+# a recordings directory or .rec file, a .jsonl log or an ASCII dump.
+# Also settable per run: python3 app.py --replay recordings/ --speed 10
+REPLAY_SOURCE = None         # None = read the serial port
+REPLAY_SPEED = 1.0           # x real time; 0 = as fast as the pipeline goes
+REPLAY_LOOP = False          # Start over when the capture runs out
+
 # ============================================
 # MULTI-SENSOR CONFIGURATION
 # ============================================
@@ -57,16 +115,30 @@ ENABLE_PBT = True
 ENABLE_PMT = False           # Set True when PMT is ready
 ENABLE_GM = False            # Set True when GM counter is ready
 
-# Sensor ports (if using multiple)
+# Web ports when each sensor runs its own app
 PBT_PORT = 5000
 PMT_PORT = 5001
 GM_PORT = 5002
 
+# One process for all of them instead (app_multi.py, served on PORT):
+# serial port and per-sensor overrides of the settings above
+SENSORS = {
+    'pbt': {'enabled': ENABLE_PBT, 'port': SERIAL_PORT, 'pulses': True},
+    'pmt': {'enabled': ENABLE_PMT, 'port': "/dev/ttyUSB1"},
+    'gm': {'enabled': ENABLE_GM, 'port': "/dev/ttyUSB2"},
+}
+
 # ============================================
 # RESOURCE MANAGEMENT
 # ============================================
 
-# Thread priorities (nice values: -20 to 19, lower = higher priority)
+# Reading, detection and button presses in their own process (acquisition.py),
+# feeding the web server through a shared-memory ring; the priorities and
+# cores below are applied to the two processes
+ACQUISITION_PROCESS = True
+
+# Process priorities (nice values: -20 to 19, lower = higher priority;
+# below 0 needs root or CAP_SYS_NICE, otherwise a warning is printed)
 PBT_PRIORITY = -10           # High priority (real-time critical)
 WEB_PRIORITY = 0             # Normal priority
 FTP_PRIORITY = 10            # Low priority (not time-critical)
@@ -76,19 +148,19 @@ PBT_CPU_CORES = [0]          # Pin PBT to core 0
 WEB_CPU_CORES = [1, 2, 3]    # Web app can use cores 1-3
 
 # Memory limits
-MAX_BUFFER_MEMORY_MB = 50    # Maximum memory for data buffers
+MAX_BUFFER_MEMORY_MB = 50    # Maximum memory for the sample history ring buffer
 
 # ============================================
 # MONITORING & LOGGING
 # ============================================
 
-# Enable performance monitoring
+# Enable performance monitoring (/metrics endpoint, Prometheus text format)
 ENABLE_MONITORING = True
 
 # Log dropped samples
 LOG_DROPPED_SAMPLES = True
 
-# Performance metrics logging interval (seconds)
+# Performance metrics logging interval (seconds), for METRICS_FILE
 METRICS_INTERVAL = 10
 
 # Log file paths
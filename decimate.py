@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - Display decimation
+Min/max reduction of the sample stream to roughly one bucket per pixel
+
+A 5 s window at 800 Hz is 4000 samples, but the chart is only a few
+hundred pixels wide. Each bucket of `factor` consecutive samples is
+reduced to two points, its minimum and its maximum, in the order they
+occurred. Raw and envelope are reduced independently, so every peak
+still reaches its full height on screen (plain subsampling or averaging
+would clip short hits).
+
+Buckets are aligned to absolute sample indices (multiples of factor),
+so the same sample always lands in the same bucket whichever tick or
+snapshot it arrives in. The two points of a bucket are placed at its
+first and last sample index.
+
+Run directly for a quick check and timing:
+    python3 decimate.py
+"""
+import math
+import numpy as np
+
+
+def decimation_factor(width, window_samples, max_points):
+    """Samples per bucket for a chart `width` pixels wide (1 = no decimation)."""
+    if not width:
+        return 1
+    buckets = max(1, min(int(width), max_points // 2))
+    return max(1, math.ceil(window_samples / buckets))
+
+
+def minmax(raw, env, start, factor, keep_partial=True):
+    """
+    Reduce samples start, start+1, ... to min/max point pairs.
+
+    Returns (raw, env, index) point arrays and the number of trailing
+    samples left out because their bucket is still open (only when
+    keep_partial is False).
+    """
+    n = len(raw)
+    if factor <= 1 or n == 0:
+        # Passed through as given (lists stay lists)
+        return raw, env, start + np.arange(n, dtype=np.int64), 0
+    raw = np.asarray(raw)
+    env = np.asarray(env)
+
+    # Split at absolute bucket boundaries: a short head, full rows, a short tail
+    head = (-start) % factor
+    if head > n:
+        head = 0            # The block doesn't reach the first boundary: all tail
+    rows = (n - head) // factor
+    tail = n - head - rows * factor
+    leftover = 0 if keep_partial else tail
+
+    raw_parts, env_parts, idx_parts = [], [], []
+    if head:
+        _append_bucket(raw_parts, env_parts, idx_parts, raw[:head], env[:head], start)
+    if rows:
+        body = slice(head, head + rows * factor)
+        r, e = _rows_minmax(raw[body].reshape(rows, factor), env[body].reshape(rows, factor))
+        first = start + head + factor * np.arange(rows, dtype=np.int64)
+        idx = np.empty(2 * rows, dtype=np.int64)
+        idx[0::2] = first
+        idx[1::2] = first + factor - 1
+        raw_parts.append(r)
+        env_parts.append(e)
+        idx_parts.append(idx)
+    if tail and keep_partial:
+        _append_bucket(raw_parts, env_parts, idx_parts, raw[n - tail:], env[n - tail:],
+                       start + n - tail)
+
+    if not raw_parts:
+        return raw[:0], env[:0], np.empty(0, dtype=np.int64), leftover
+    return (np.concatenate(raw_parts), np.concatenate(env_parts),
+            np.concatenate(idx_parts), leftover)
+
+
+def _rows_minmax(raw_rows, env_rows):
+    """Interleaved (earlier, later) of each row's min and max, per series."""
+    out = []
+    for rows in (raw_rows, env_rows):
+        lo = rows.argmin(axis=1)
+        hi = rows.argmax(axis=1)
+        k = np.arange(len(rows))
+        vmin = rows[k, lo]
+        vmax = rows[k, hi]
+        min_first = lo <= hi
+        pts = np.empty(2 * len(rows), dtype=rows.dtype)
+        pts[0::2] = np.where(min_first, vmin, vmax)
+        pts[1::2] = np.where(min_first, vmax, vmin)
+        out.append(pts)
+    return out
+
+
+def _append_bucket(raw_parts, env_parts, idx_parts, raw, env, first):
+    """One (possibly short) bucket as a min/max pair."""
+    r, e = _rows_minmax(raw[None, :], env[None, :])
+    raw_parts.append(r)
+    env_parts.append(e)
+    idx_parts.append(np.array([first, first + len(raw) - 1], dtype=np.int64))
+
+
+class MinMaxDecimator:
+    """Streaming min/max decimation; an open bucket is carried to the next block."""
+
+    def __init__(self, factor):
+        self.factor = factor
+        self._raw = []
+        self._env = []
+        self._start = None      # Sample index of the first carried sample
+        self.end = None         # Index after the last sample reduced to points so far
+
+    def process(self, raw, env, start):
+        """Decimate a block of consecutive samples; return (raw, env, index) points."""
+        if self.factor <= 1:
+            self.end = start + len(raw)
+            return minmax(raw, env, start, 1)[:3]
+
+        if self._raw and self._start + len(self._raw) == start:
+            raw = self._raw + list(raw)
+            env = self._env + list(env)
+            start = self._start
+        # (after a gap in the indices the carried samples are dropped)
+
+        r, e, idx, leftover = minmax(raw, env, start, self.factor, keep_partial=False)
+        self.end = start + len(raw) - leftover
+        if leftover:
+            self._raw = list(raw[len(raw) - leftover:])
+            self._env = list(env[len(env) - leftover:])
+            self._start = start + len(raw) - leftover
+        else:
+            self._raw, self._env, self._start = [], [], None
+        return r, e, idx
+
+
+if __name__ == '__main__':
+    import time
+
+    rng = np.random.default_rng(0)
+    n = 4000
+    raw = 40 + rng.integers(-6, 7, n)
+    raw[1234] = 950                       # One-sample spike must survive
+    env = np.convolve(np.abs(raw - 40.0), np.full(8, 1 / 8), mode='same')
+
+    for width in (400, 800, 1600):
+        factor = decimation_factor(width, n, 4000)
+        dec = MinMaxDecimator(factor)
+        edges = np.cumsum(rng.integers(20, 80, 200))
+        edges = edges[edges < n]
+        parts = [dec.process(r.tolist(), e.tolist(), int(s))
+                 for r, e, s in zip(np.split(raw, edges), np.split(env, edges),
+                                    np.concatenate([[0], edges]))]
+        r = np.concatenate([p[0] for p in parts])
+        e = np.concatenate([p[1] for p in parts])
+        print(f"width {width:>5}: factor {factor:>2}, {n} samples -> {len(r)} points,"
+              f" raw max {r.max()} (true {raw.max()}), env max {e.max():.1f}"
+              f" (true {env.max():.1f})")
+
+    reps = 2000
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        minmax(raw[:40], env[:40], 12345, 5)
+    tick = (time.perf_counter() - t0) / reps * 1e6
+    t0 = time.perf_counter()
+    for _ in range(200):
+        minmax(raw, env, 12345, 5)
+    window = (time.perf_counter() - t0) / 200 * 1e6
+    print(f"40-sample tick: {tick:.0f} µs, 4000-sample window: {window:.0f} µs")
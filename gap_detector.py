@@ -0,0 +1,104 @@
+"""
+SICK Capstone - Dropped-sample accounting
+Detects samples lost between the Arduino and the reader thread
+
+Two sources of truth, depending on the wire format:
+- Binary frames carry a sequence number, so every missing frame is
+  counted exactly (FRAME_SAMPLES samples each).
+- ASCII lines carry no index, so the detector compares the samples
+  received per window with SAMPLES_PER_SEC. Data still queued in the
+  kernel buffer is not a loss, so backlog growth is credited back
+  before a deficit is counted.
+"""
+import time
+from serial_ingest import FRAME_SAMPLES
+
+KERNEL_RX_BUFFER = 4095     # Linux tty receive buffer; a full buffer drops bytes
+RATE_WINDOW_S = 1.0         # Rate-check window for ASCII mode (seconds)
+RATE_TOLERANCE = 0.02       # Ignore deficits below 2% (Arduino clock drift)
+
+
+class GapDetector:
+    """Counts dropped samples, serial overflows and the longest gap."""
+
+    def __init__(self, expected_sps, log=False):
+        self.expected_sps = expected_sps
+        self.log = log
+
+        # Statistics
+        self.received = 0
+        self.dropped_samples = 0
+        self.overflow_events = 0
+        self.longest_gap = 0        # samples
+        self.seq_resets = 0         # Duplicate / restarted frame sequences (binary protocol)
+        self.measured_sps = 0.0
+
+        # Internal state
+        self._lost_frames = None
+        self._overflowing = False
+        self._window_start = None
+        self._window_count = 0
+        self._window_backlog = 0.0
+
+    def update(self, ingest, n_samples, now=None):
+        """Account for one fresh block read by `ingest`."""
+        if now is None:
+            now = time.time()
+        self.received += n_samples
+
+        # Kernel buffer full at read time → bytes were (or are about to be) lost
+        full = ingest.last_waiting >= KERNEL_RX_BUFFER
+        if full and not self._overflowing:
+            self.overflow_events += 1
+            if self.log:
+                print(f"WARNING: serial receive buffer full ({ingest.last_waiting} bytes waiting)")
+        self._overflowing = full
+
+        # Exact accounting from frame sequence numbers
+        lost_frames = getattr(ingest, "lost_frames", None)
+        if lost_frames is not None:
+            if self._lost_frames is not None and lost_frames > self._lost_frames:
+                self._record_gap((lost_frames - self._lost_frames) * FRAME_SAMPLES, "sequence")
+            self._lost_frames = lost_frames
+            self.seq_resets = ingest.seq_resets
+
+        # Rate check against SAMPLES_PER_SEC
+        backlog = ingest.last_waiting / ingest.bytes_per_sample()
+        if self._window_start is None:
+            self._window_start = now
+            self._window_backlog = backlog
+            return
+
+        self._window_count += n_samples
+        elapsed = now - self._window_start
+        if elapsed < RATE_WINDOW_S:
+            return
+
+        self.measured_sps = self._window_count / elapsed
+        if lost_frames is None:
+            expected = self.expected_sps * elapsed
+            deficit = expected - self._window_count - (backlog - self._window_backlog)
+            if deficit > expected * RATE_TOLERANCE:
+                self._record_gap(int(deficit), "rate")
+
+        self._window_start = now
+        self._window_count = 0
+        self._window_backlog = backlog
+
+    def _record_gap(self, n_missing, source):
+        """Count one gap of n_missing samples."""
+        self.dropped_samples += n_missing
+        self.longest_gap = max(self.longest_gap, n_missing)
+        if self.log:
+            gap_ms = n_missing * 1000.0 / self.expected_sps
+            print(f"WARNING: dropped {n_missing} samples (~{gap_ms:.1f} ms, detected by {source})")
+
+    def stats(self):
+        """Counters for the stats event."""
+        return {
+            'dropped_samples': self.dropped_samples,
+            'overflow_events': self.overflow_events,
+            'seq_resets': self.seq_resets,
+            'longest_gap_ms': self.longest_gap * 1000.0 / self.expected_sps,
+            'measured_sps': self.measured_sps
+        }
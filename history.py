@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - Multi-resolution history
+Full-rate recent samples plus min/max/mean rollups for long look-backs
+
+Level 0 is the full-rate SampleRing. Each rollup level keeps one record
+per bucket of `factor` samples (10x, 100x, 1000x by default):
+    raw_min, raw_max, raw_mean, env_min, env_max, env_mean
+Level k is built from level k-1's records as they complete, so the cost
+per tick is a few vectorised reductions whatever the history length.
+Every level is a fixed-size ring, so memory is bounded by the retention
+set for it in HISTORY_LEVELS. When samples are skipped (a stalled reader
+catching up) the older records stay; the buckets of the skipped span are
+left empty and leave no points in query results.
+
+A query (t_start, t_end, max_points) is answered from the finest level
+that still holds t_start and needs at most MERGE_MAX records per point;
+neighbouring records are merged down to max_points. Records are
+addressed arithmetically from the sample index, so a query touches at
+most MERGE_MAX * max_points records and takes the same time for a minute
+or a week.
+
+Run directly for a quick check and timing:
+    python3 history.py
+"""
+import numpy as np
+
+ROLLUP_FIELDS = ('raw_min', 'raw_max', 'raw_mean', 'env_min', 'env_max', 'env_mean')
+ROLLUP_DTYPES = {
+    'raw_min': np.uint16, 'raw_max': np.uint16, 'raw_mean': np.float32,
+    'env_min': np.float32, 'env_max': np.float32, 'env_mean': np.float32
+}
+MERGE_MAX = 10      # A query may combine up to this many records into one point
+DEFAULT_SPAN_S = 60.0
+ROLLUP_BYTES = sum(np.dtype(dt).itemsize for dt in ROLLUP_DTYPES.values())
+# A bucket with no samples (skipped span); min/max values that any sample replaces
+EMPTY_RECORD = {
+    'raw_min': np.iinfo(np.uint16).max, 'raw_max': 0, 'raw_mean': np.nan,
+    'env_min': np.inf, 'env_max': -np.inf, 'env_mean': np.nan
+}
+
+
+class RollupLevel:
+    """Ring of per-bucket min/max/mean records at one resolution."""
+
+    def __init__(self, factor, capacity):
+        self.factor = factor
+        self.capacity = max(1, int(capacity))
+        self.cols = {name: np.zeros(self.capacity, dtype=ROLLUP_DTYPES[name])
+                     for name in ROLLUP_FIELDS}
+        self.newest = None      # Bucket number (sample index // factor) of the newest record
+        self.count = 0
+
+        # Children of the bucket that is still open, and their numbers
+        self._carry = None
+        self._carry_numbers = None
+
+    @property
+    def nbytes(self):
+        return self.capacity * ROLLUP_BYTES
+
+    def oldest(self):
+        """Bucket number of the oldest stored record (None when empty)."""
+        return None if self.newest is None else self.newest - self.count + 1
+
+    def feed(self, recs, first, ratio):
+        """
+        Add child records (dict of arrays) numbered first, first+1, ...;
+        `ratio` children make one bucket here. Completed buckets are stored
+        and returned as [(records, first bucket number), ...], one entry per
+        run of consecutive buckets, for the next level. After a gap in the
+        numbering the open bucket is closed with the children it has.
+        """
+        n = len(recs['raw_min'])
+        if n == 0:
+            return []
+        numbers = None
+        if self._carry is not None:
+            carried = self._carry_numbers
+            if first > carried[-1]:
+                recs = {k: np.concatenate([self._carry[k], recs[k]]) for k in ROLLUP_FIELDS}
+                if first == carried[-1] + 1 and carried[-1] - carried[0] == len(carried) - 1:
+                    first = int(carried[0])
+                else:
+                    numbers = np.concatenate([carried, first + np.arange(n)])
+                n = len(recs['raw_min'])
+            # (if the numbering went back, a restart, the open bucket is dropped)
+            self._carry = None
+        if numbers is None:
+            numbers = first + np.arange(n)
+
+        # Group children by parent bucket; the last group is open until its
+        # final child (number % ratio == ratio - 1) has arrived
+        parents = numbers // ratio
+        starts = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]])
+        closed = len(starts) if numbers[-1] % ratio == ratio - 1 else len(starts) - 1
+        if closed < len(starts):
+            cut = starts[closed]
+            self._carry = {k: recs[k][cut:] for k in ROLLUP_FIELDS}
+            self._carry_numbers = numbers[cut:]
+        if closed == 0:
+            return []
+
+        end = starts[closed] if closed < len(starts) else n
+        sizes = np.diff(np.r_[starts[:closed], end])
+        out = {
+            'raw_min': np.minimum.reduceat(recs['raw_min'][:end], starts[:closed]),
+            'raw_max': np.maximum.reduceat(recs['raw_max'][:end], starts[:closed]),
+            'raw_mean': np.add.reduceat(recs['raw_mean'][:end], starts[:closed],
+                                        dtype=np.float64) / sizes,
+            'env_min': np.minimum.reduceat(recs['env_min'][:end], starts[:closed]),
+            'env_max': np.maximum.reduceat(recs['env_max'][:end], starts[:closed]),
+            'env_mean': np.add.reduceat(recs['env_mean'][:end], starts[:closed],
+                                        dtype=np.float64) / sizes,
+        }
+        buckets = parents[starts[:closed]]
+        if buckets[-1] - buckets[0] == closed - 1:
+            runs = [(0, closed)]
+        else:
+            cuts = [0] + (np.flatnonzero(np.diff(buckets) != 1) + 1).tolist() + [closed]
+            runs = zip(cuts[:-1], cuts[1:])
+        batches = []
+        for a, b in runs:
+            run = out if b - a == closed else {k: v[a:b] for k, v in out.items()}
+            self._store(run, int(buckets[a]))
+            batches.append((run, int(buckets[a])))
+        return batches
+
+    def _store(self, out, first_bucket):
+        n = len(out['raw_min'])
+        if self.newest is not None and first_bucket != self.newest + 1:
+            if first_bucket <= self.newest:
+                self.count = 0      # Index went back (restart): old records no longer line up
+            else:
+                # Samples were skipped: keep the older records, leave the gap empty
+                gap = first_bucket - self.newest - 1
+                pos = np.arange(first_bucket - min(gap, self.capacity), first_bucket) % self.capacity
+                for name in ROLLUP_FIELDS:
+                    self.cols[name][pos] = EMPTY_RECORD[name]
+                self.newest = first_bucket - 1
+                self.count = min(self.capacity, self.count + gap)
+        if n > self.capacity:
+            out = {k: v[n - self.capacity:] for k, v in out.items()}
+            first_bucket += n - self.capacity
+            n = self.capacity
+        pos = (first_bucket + np.arange(n)) % self.capacity
+        for name in ROLLUP_FIELDS:
+            self.cols[name][pos] = out[name]
+        self.newest = first_bucket + n - 1
+        self.count = min(self.capacity, self.count + n)
+
+    def between(self, first_bucket, last_bucket):
+        """Copies of the stored records first..last (clipped); returns (records, first)."""
+        if self.newest is None:
+            return {k: self.cols[k][:0] for k in ROLLUP_FIELDS}, first_bucket
+        first_bucket = max(first_bucket, self.oldest())
+        last_bucket = min(last_bucket, self.newest)
+        if last_bucket < first_bucket:
+            return {k: self.cols[k][:0] for k in ROLLUP_FIELDS}, first_bucket
+        pos = np.arange(first_bucket, last_bucket + 1) % self.capacity
+        return {k: self.cols[k][pos] for k in ROLLUP_FIELDS}, first_bucket
+
+
+class HistoryStore:
+    """SampleRing for full-rate data plus a pyramid of RollupLevels."""
+
+    def __init__(self, ring, sample_rate, levels):
+        """levels: [(samples per bucket, seconds kept), ...], finest first."""
+        self.ring = ring
+        self.sample_rate = sample_rate
+        self.levels = [RollupLevel(factor, seconds * sample_rate / factor)
+                       for factor, seconds in sorted(levels)]
+
+    def __len__(self):
+        return len(self.ring)
+
+    @property
+    def nbytes(self):
+        return self.ring.nbytes + sum(level.nbytes for level in self.levels)
+
+    def latest(self, n=None):
+        return self.ring.latest(n)
+
+    def catch_up(self, index, n):
+        """
+        Samples from `index` to the newest when the ring still holds them
+        and there are at most n of them, else the newest n (a reconnecting
+        client that is too far behind gets a full snapshot).
+        Returns (raw, env, index, resumed).
+        """
+        newest = self.ring.newest_index()
+        if index is not None and newest is not None:
+            oldest = newest - len(self.ring) + 1
+            if oldest <= index <= newest + 1 and newest + 1 - index <= n:
+                return self.ring.between(index, newest) + (True,)
+        return self.ring.latest(n) + (False,)
+
+    def append(self, raw, env, first_index):
+        """Append a block of consecutive samples to every level."""
+        if not len(raw):
+            return
+        self.ring.append(raw, env, first_index)
+        self.roll_up(raw, env, first_index)
+
+    def roll_up(self, raw, env, first_index):
+        """
+        Feed a block to the rollup levels only, for a ring that another
+        process fills (shm_ring.SharedSampleRing).
+        """
+        if not len(raw):
+            return
+        raw = np.asarray(raw, dtype=np.uint16)
+        env = np.asarray(env, dtype=np.float32)
+        recs = {'raw_min': raw, 'raw_max': raw, 'raw_mean': raw.astype(np.float32),
+                'env_min': env, 'env_max': env, 'env_mean': env}
+        batches = [(recs, first_index)]
+        ratio = self.levels[0].factor if self.levels else 1
+        for i, level in enumerate(self.levels):
+            batches = [done for recs, first in batches for done in level.feed(recs, first, ratio)]
+            if not batches:
+                break
+            if i + 1 < len(self.levels):
+                ratio = self.levels[i + 1].factor // level.factor
+
+    def query(self, t_start=None, t_end=None, max_points=2000, t0=0.0):
+        """
+        Data between two times (seconds on the stamped axis) in at most
+        max_points points, from the cheapest level that can serve it.
+        t_end defaults to the newest sample, t_start to DEFAULT_SPAN_S before it.
+        """
+        rate = self.sample_rate
+        max_points = max(2, int(max_points))
+        newest = self.ring.newest_index()
+        if t_end is None:
+            t_end = t0 + (newest if newest is not None else 0) / rate
+        if t_start is None:
+            t_start = t_end - DEFAULT_SPAN_S
+        first = int(np.floor((t_start - t0) * rate))
+        last = int(np.ceil((t_end - t0) * rate))
+        if newest is not None:
+            last = min(last, newest)
+
+        # Nothing older than the oldest sample any level still holds
+        oldest = None if newest is None else newest - len(self.ring) + 1
+        held = [lv.oldest() * lv.factor for lv in self.levels if lv.oldest() is not None]
+        if oldest is not None:
+            held.append(oldest)
+        first = max(first, min(held) if held else 0)
+        span = max(0, last - first + 1)
+
+        # Full rate if it fits and is still held
+        if span <= max_points and oldest is not None and first >= oldest:
+            raw, env, index = self.ring.between(first, last)
+            return {
+                'level': 1,
+                'time': (t0 + index / rate).tolist(),
+                'raw': raw.tolist(),
+                'envelope': env.tolist()
+            }
+
+        # Finest rollup that needs at most MERGE_MAX records per returned point
+        # and still reaches back to t_start
+        candidates = [lv for lv in self.levels if span / lv.factor <= max_points * MERGE_MAX]
+        if not candidates and self.levels:
+            candidates = [self.levels[-1]]
+        level = None
+        for lv in candidates:
+            if lv.oldest() is not None and lv.oldest() <= first // lv.factor:
+                level = lv
+                break
+        if level is None:
+            level = candidates[-1] if candidates else None
+        if level is None:
+            return {'level': 1, 'time': [], 'raw': [], 'envelope': []}
+
+        recs, first_bucket = level.between(first // level.factor, last // level.factor)
+        n = len(recs['raw_min'])
+        if n > max_points:
+            # Combine neighbouring records down to max_points
+            recs = _merge(recs, -(-n // max_points))
+            step = -(-n // max_points) * level.factor
+        else:
+            step = level.factor
+        k = np.arange(len(recs['raw_min']))
+        held = ~np.isnan(recs['env_mean'])     # Empty buckets (skipped span) give no point
+        result = {
+            'level': int(step),
+            'time': (t0 + (first_bucket * level.factor + k[held] * step) / rate).tolist()
+        }
+        for name in ROLLUP_FIELDS:
+            result[name] = recs[name][held].tolist()
+        return result
+
+    def stats(self):
+        """History coverage for the stats event."""
+        return {
+            'history_bytes': self.nbytes,
+            'history_levels': [level.factor for level in self.levels],
+            'history_seconds': [level.count * level.factor / self.sample_rate
+                                for level in self.levels]
+        }
+
+
+def parse_query(params, max_points_limit):
+    """
+    (t_start, t_end, max_points) from request args or an event dict.
+    Missing values are None (query defaults); raises ValueError if invalid.
+    """
+    def number(name):
+        value = params.get(name)
+        if value is None or value == '':
+            return None
+        value = float(value)
+        if not np.isfinite(value):
+            raise ValueError(f"{name} must be a finite number")
+        return value
+
+    t_start = number('t_start')
+    t_end = number('t_end')
+    max_points = number('max_points')
+    if t_start is not None and t_end is not None and t_end < t_start:
+        raise ValueError("t_end is before t_start")
+    if max_points is None or max_points > max_points_limit:
+        max_points = max_points_limit
+    return t_start, t_end, int(max_points)
+
+
+def _merge(recs, group):
+    """
+    Combine every `group` consecutive records into one. Empty records are
+    left out of the means; a group of only empty records stays empty.
+    """
+    n = len(recs['raw_min'])
+    starts = np.arange(0, n, group)
+    held = ~np.isnan(recs['env_mean'])
+    counts = np.add.reduceat(held.astype(np.int64), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'raw_min': np.minimum.reduceat(recs['raw_min'], starts),
+            'raw_max': np.maximum.reduceat(recs['raw_max'], starts),
+            'raw_mean': np.add.reduceat(np.where(held, recs['raw_mean'], 0), starts,
+                                        dtype=np.float64) / counts,
+            'env_min': np.minimum.reduceat(recs['env_min'], starts),
+            'env_max': np.maximum.reduceat(recs['env_max'], starts),
+            'env_mean': np.add.reduceat(np.where(held, recs['env_mean'], 0), starts,
+                                        dtype=np.float64) / counts,
+        }
+
+
+if __name__ == '__main__':
+    import time
+    from ring_buffer import SampleRing
+
+    rate = 800
+    store = HistoryStore(SampleRing(60 * rate), rate,
+                         [(10, 600), (100, 3600), (1000, 6 * 3600)])
+    rng = np.random.default_rng(0)
+
+    # Two simulated hours in 40-sample ticks
+    n_total = 2 * 3600 * rate
+    index = 0
+    t0 = time.perf_counter()
+    while index < n_total:
+        raw = 40 + rng.integers(-6, 7, 4000)
+        raw[rng.integers(0, 4000)] = 900
+        env = np.abs(raw - 40.0)
+        for k in range(0, 4000, 40):
+            store.append(raw[k:k + 40], env[k:k + 40], index)
+            index += 40
+    per_tick = (time.perf_counter() - t0) / (n_total / 40) * 1e6
+    print(f"append: {per_tick:.1f} µs per 40-sample tick,"
+          f" {store.nbytes / 1e6:.1f} MB for all levels")
+
+    end = index / rate
+    for span in (2, 30, 600, 3600, 7200):
+        t0 = time.perf_counter()
+        for _ in range(50):
+            res = store.query(end - span, end, 2000)
+        dt = (time.perf_counter() - t0) / 50 * 1e3
+        peak = max(res.get('raw_max', res.get('raw', [0])))
+        print(f"query {span:>5} s: level {res['level']:>5}x, {len(res['time']):>5} points,"
+              f" peak {peak}, {dt:.2f} ms")
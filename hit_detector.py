@@ -0,0 +1,152 @@
+"""
+SICK Capstone - Hit detection
+Armed → capture → refractory → re-arm state machine over envelope blocks
+
+All windows are timed by sample count, so detection gives the same
+result however the samples were batched and never needs the wall clock.
+"""
+from collections import namedtuple
+import numpy as np
+
+# One detected hit. Indices are absolute sample numbers since start.
+#   index:         sample at which the capture window closed (pulse fires)
+#   trigger_index: first sample above the trigger threshold
+#   peak:          highest envelope value inside the capture window
+#   width_ms:      mapped output pulse width
+#   capture_ms:    time from trigger to capture end
+Hit = namedtuple('Hit', ['index', 'trigger_index', 'peak', 'width_ms', 'capture_ms'])
+
+ARMED, CAPTURE, REFRACTORY = range(3)
+
+
+def clamp(x, lo, hi):
+    """Clamp value between min and max."""
+    return max(lo, min(hi, x))
+
+
+def map_linear(x, x0, x1, y0, y1):
+    """Map value from one range to another."""
+    if x1 <= x0:
+        return y0
+    t = (x - x0) / (x1 - x0)
+    return y0 + t * (y1 - y0)
+
+
+def map_linear_inverse(x, x0, x1, y0, y1):
+    """Map value from one range to another INVERSELY (high x → low y)."""
+    if x1 <= x0:
+        return y1
+    t = (x - x0) / (x1 - x0)
+    return y1 - t * (y1 - y0)  # Inverted: subtract instead of add
+
+
+class HitDetector:
+    """
+    Incremental hit detector fed with envelope blocks.
+
+    - Armed: the first sample above `threshold` starts a capture.
+    - Capture: track the peak until `capture_ms` have elapsed or the
+      envelope drops below threshold / 2; then emit a Hit.
+    - Refractory: ignore the signal for the pulse width + `hold_ms` +
+      `refractory_ms` after the hit (the output pulse is still running).
+    - Re-arm: once refractory is over, re-arm when the envelope falls
+      below `rearm_level`.
+
+    Peak → width mapping: linear from [a_min, a_max] to [w_min, w_max]
+    ms, or inverted (strong hit → short pulse) when `inverse` is set.
+    """
+
+    def __init__(self, sample_rate, threshold, capture_ms, refractory_ms,
+                 rearm_level, a_range, w_range, inverse=False, hold_ms=0):
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.release_level = threshold * 0.5
+        self.rearm_level = rearm_level
+        self.capture_samples = self.ms_to_samples(capture_ms)
+        self.refractory_ms = refractory_ms
+        self.hold_ms = hold_ms
+        self.a_min, self.a_max = a_range
+        self.w_min, self.w_max = w_range
+        self.inverse = inverse
+
+        self.state = ARMED
+        self.index = 0          # Absolute index of the next sample to arrive
+        self.peak = 0.0
+        self._trigger = 0       # Absolute index of the current trigger
+        self._until = 0         # Capture end / refractory end (absolute index)
+
+    @property
+    def armed(self):
+        """True while waiting for a trigger."""
+        return self.state == ARMED
+
+    def ms_to_samples(self, ms):
+        """Convert a duration to a whole number of samples."""
+        return int(round(ms * self.sample_rate / 1000.0))
+
+    def width_for(self, peak):
+        """Output pulse width (ms) for a captured peak."""
+        a_clamped = clamp(peak, self.a_min, self.a_max)
+        mapping = map_linear_inverse if self.inverse else map_linear
+        return clamp(mapping(a_clamped, self.a_min, self.a_max, self.w_min, self.w_max),
+                     self.w_min, self.w_max)
+
+    def process(self, env):
+        """Advance over one envelope block; return the list of hits it completed."""
+        env = np.asarray(env, dtype=np.float64)
+        n = len(env)
+        base = self.index
+        hits = []
+        pos = 0
+
+        while pos < n:
+            if self.state == ARMED:
+                above = np.flatnonzero(env[pos:] > self.threshold)
+                if not above.size:
+                    break
+                k = pos + int(above[0])
+                self.state = CAPTURE
+                self.peak = float(env[k])
+                self._trigger = base + k
+                self._until = base + k + self.capture_samples
+                pos = k + 1
+
+            elif self.state == CAPTURE:
+                # Capture ends at the first sample below the release level,
+                # or at the sample where the capture window runs out
+                limit = min(n, self._until - base)
+                below = np.flatnonzero(env[pos:limit] < self.release_level)
+                if below.size:
+                    k = pos + int(below[0])
+                elif limit < n:
+                    k = max(limit, pos)
+                else:
+                    if pos < n:
+                        self.peak = max(self.peak, float(env[pos:].max()))
+                    break
+                self.peak = max(self.peak, float(env[pos:k + 1].max()))
+                hits.append(self._fire(base + k))
+                pos = k + 1
+
+            else:
+                start = max(pos, self._until - base)
+                if start >= n:
+                    break
+                low = np.flatnonzero(env[start:] < self.rearm_level)
+                if not low.size:
+                    break
+                self.state = ARMED
+                pos = start + int(low[0]) + 1
+
+        self.index = base + n
+        return hits
+
+    def _fire(self, k):
+        """Close the capture at absolute sample k and enter refractory."""
+        width_ms = self.width_for(self.peak)
+        hit = Hit(index=k, trigger_index=self._trigger, peak=self.peak,
+                  width_ms=width_ms,
+                  capture_ms=(k - self._trigger) * 1000.0 / self.sample_rate)
+        self.state = REFRACTORY
+        self._until = k + self.ms_to_samples(width_ms + self.hold_ms + self.refractory_ms)
+        return hit
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - Hit event store
+Every detected hit in a local SQLite database, written off the reader thread
+
+The reader thread only calls submit(), which puts the hit on a bounded
+queue and returns; a writer thread inserts whatever has queued up in one
+transaction. If the disk stalls long enough to fill the queue, hits are
+dropped from the store (counted in stats), never from detection.
+
+Tables:
+    hits      one row per hit: trigger time (Unix seconds), sample index,
+              peak envelope, mapped width_ms, capture_ms, baseline at the
+              trigger sample and the config in effect; indexed on time
+              and on peak
+    configs   each distinct config snapshot once, referenced by hits
+    hours     per-hour count / peak sum / peak max, kept up to date in the
+              same transaction, so hourly histograms over months read a
+              few thousand rows instead of every hit
+    snippets  where a hit's waveform snippet is in the SnippetStore chunk
+              files (see snippets.py), keyed by hit id
+
+The database runs in WAL mode, so the web server's queries (one
+connection per thread) never wait for the writer and vice versa; with
+app_combined.py --split the acquisition process writes and the web
+process only reads.
+
+Run directly to fill a scratch database with a year of hits and time
+the queries behind /api/hits:
+    python3 hit_store.py [--hits 1000000]
+"""
+import sys
+import json
+import math
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+from threading import Thread, Lock
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS configs (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    created REAL NOT NULL,
+    settings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hits (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    sample_index INTEGER NOT NULL,
+    peak REAL NOT NULL,
+    width_ms REAL NOT NULL,
+    capture_ms REAL NOT NULL,
+    baseline REAL NOT NULL,
+    config_id INTEGER REFERENCES configs(id)
+);
+CREATE INDEX IF NOT EXISTS hits_time ON hits(time);
+CREATE INDEX IF NOT EXISTS hits_peak ON hits(peak);
+CREATE TABLE IF NOT EXISTS hours (
+    hour INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL,
+    peak_sum REAL NOT NULL,
+    peak_max REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snippets (
+    hit_id INTEGER PRIMARY KEY REFERENCES hits(id),
+    chunk INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    start_index INTEGER NOT NULL,
+    rate REAL NOT NULL
+);
+"""
+HIT_COLUMNS = ('id', 'time', 'sample_index', 'peak', 'width_ms', 'capture_ms', 'baseline', 'config_id')
+# Top-N over a window holding more hits than this walks the peak index
+# (stopping after n matches) instead of sorting the window
+TOP_BY_PEAK_ROWS = 20000
+
+
+def connect(path):
+    """Connection with the schema in place and WAL enabled."""
+    conn = sqlite3.connect(path, timeout=5.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")    # WAL: durable at checkpoints, never corrupt
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def baseline_at(index, baseline, first_index, before):
+    """Baseline at sample `index` from a block's baseline array (`before` if it is from an earlier block)."""
+    k = index - first_index
+    return float(baseline[k]) if 0 <= k < len(baseline) else float(before)
+
+
+class HitStore:
+    """Bounded-queue SQLite sink for hits, plus the queries the API serves."""
+
+    def __init__(self, path, queue_hits=1024, config=None, snippets=None):
+        self.path = path
+        self._config_snapshot = config      # Settings stored with new hits (config_snapshot() if None)
+        self.snippets = snippets            # SnippetStore for waveform snippets (optional)
+        self._queue = queue.Queue(maxsize=queue_hits)
+        self._thread = None
+        self._local = threading.local()     # Per-thread read connection
+        self._stats_lock = Lock()
+
+        # Statistics
+        self.hits_written = 0
+        self.snippets_written = 0
+        self.dropped_hits = 0
+        self.write_errors = 0
+        self.max_write_ms = 0.0
+
+    def start(self):
+        """Create the database if needed and start the writer thread."""
+        connect(self.path).close()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=5.0):
+        """Write out everything queued so far."""
+        if self._thread is not None:
+            while True:
+                try:
+                    self._queue.put(None, timeout=timeout)
+                    break
+                except queue.Full:
+                    continue
+            self._thread.join(timeout)
+            self._thread = None
+        if self.snippets:
+            self.snippets.close()
+
+    def submit(self, hit, timestamp, baseline, snippet=None):
+        """Queue one detector Hit (trigger at wall time `timestamp`); never blocks the caller."""
+        try:
+            self._queue.put_nowait((timestamp, hit.trigger_index, hit.peak, hit.width_ms,
+                                    hit.capture_ms, baseline, snippet))
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped_hits += 1
+            return False
+
+    def _run(self):
+        conn = connect(self.path)
+        config_id = self._config_id(conn)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            # Drain whatever else is waiting so it goes in one transaction
+            items = [item]
+            stop = False
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                items.append(item)
+            try:
+                self._write(conn, items, config_id)
+            except (sqlite3.Error, OSError) as e:
+                self.write_errors += 1
+                print(f"ERROR: hit store write failed: {e}", file=sys.stderr)
+            if stop:
+                break
+        conn.close()
+
+    def _config_id(self, conn):
+        """Row id of the config in effect (inserted the first time it is seen)."""
+        if self._config_snapshot is None:
+            from recorder import config_snapshot
+            self._config_snapshot = config_snapshot()
+        settings = json.dumps(self._config_snapshot, sort_keys=True, separators=(",", ":"))
+        digest = hashlib.sha1(settings.encode()).hexdigest()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO configs (digest, created, settings) VALUES (?, ?, ?)",
+                         (digest, time.time(), settings))
+        return conn.execute("SELECT id FROM configs WHERE digest = ?", (digest,)).fetchone()[0]
+
+    def _write(self, conn, items, config_id):
+        t0 = time.perf_counter()
+        rows = [item[:6] + (config_id,) for item in items]
+        insert = ("INSERT INTO hits (time, sample_index, peak, width_ms, capture_ms, baseline, config_id)"
+                  " VALUES (?, ?, ?, ?, ?, ?, ?)")
+        snippets = [item[6] for item in items] if self.snippets else []
+        written = 0
+        with conn:
+            if any(snippet is not None for snippet in snippets):
+                # Blobs first and flushed, so no committed row points past the end of a chunk
+                places = [self.snippets.append(snippet) if snippet is not None else None
+                          for snippet in snippets]
+                self.snippets.flush()
+                for row, snippet, place in zip(rows, snippets, places):
+                    hit_id = conn.execute(insert, row).lastrowid
+                    if place:
+                        conn.execute(
+                            "INSERT INTO snippets (hit_id, chunk, offset, samples, start_index, rate)"
+                            " VALUES (?, ?, ?, ?, ?, ?)",
+                            (hit_id, *place, len(snippet.raw), snippet.start, snippet.rate))
+                        written += 1
+            else:
+                conn.executemany(insert, rows)
+            conn.executemany(
+                "INSERT INTO hours (hour, count, peak_sum, peak_max) VALUES (?, 1, ?, ?)"
+                " ON CONFLICT(hour) DO UPDATE SET count = count + 1,"
+                " peak_sum = peak_sum + excluded.peak_sum, peak_max = max(peak_max, excluded.peak_max)",
+                [(int(timestamp // 3600), peak, peak) for timestamp, _, peak, *_ in items])
+        ms = (time.perf_counter() - t0) * 1000.0
+        with self._stats_lock:
+            self.hits_written += len(items)
+            self.snippets_written += written
+            self.max_write_ms = max(self.max_write_ms, ms)
+
+    # Queries (any thread; each has its own connection)
+
+    def _reader(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    def page(self, limit=50, before=None, since=None, until=None):
+        """
+        Newest hits first, `limit` at a time. Pass the returned `next` as
+        `before` for the following page (None when there are no more).
+        """
+        conn = self._reader()
+        since = since if since is not None else float('-inf')
+        until = until if until is not None else float('inf')
+        cursor = (float('inf'), None)
+        if before is not None:
+            row = conn.execute("SELECT time FROM hits WHERE id = ?", (before,)).fetchone()
+            if row is None:
+                return {'hits': [], 'next': None}
+            cursor = (row['time'], before)
+        # Keyset on (time, id) with a single upper bound on time, so
+        # hits_time is entered at the page however deep it is
+        rows = conn.execute(
+            "SELECT * FROM hits WHERE time >= ? AND time <= ? AND NOT (time = ? AND id >= ?)"
+            " ORDER BY time DESC, id DESC LIMIT ?",
+            (since, min(until, cursor[0]), cursor[0], cursor[1], limit)).fetchall()
+        hits = [dict(row) for row in rows]
+        return {'hits': hits, 'next': hits[-1]['id'] if len(hits) == limit else None}
+
+    def top(self, n=10, since=None, until=None):
+        """Leaderboard: the n highest peaks between since and until."""
+        conn = self._reader()
+        if since is None and until is None:
+            index = 'hits_peak'
+        else:
+            index = 'hits_peak' if self._rows_between(conn, since, until) > TOP_BY_PEAK_ROWS else 'hits_time'
+        rows = conn.execute(
+            f"SELECT * FROM hits INDEXED BY {index} WHERE time >= ? AND time <= ?"
+            " ORDER BY peak DESC, id LIMIT ?",
+            (since if since is not None else float('-inf'),
+             until if until is not None else float('inf'), n)).fetchall()
+        return [dict(row) for row in rows]
+
+    def _rows_between(self, conn, since, until):
+        """Rough hit count between two times from the ids at either end (ids follow time)."""
+        lo = conn.execute("SELECT id FROM hits WHERE time >= ? ORDER BY time LIMIT 1",
+                          (since if since is not None else float('-inf'),)).fetchone()
+        hi = conn.execute("SELECT id FROM hits WHERE time <= ? ORDER BY time DESC LIMIT 1",
+                          (until if until is not None else float('inf'),)).fetchone()
+        return hi[0] - lo[0] + 1 if lo and hi else 0
+
+    def hourly(self, since=None, until=None):
+        """Per-hour hit count, mean and max peak (hour = Unix time of its start)."""
+        lo = int(since // 3600) if since is not None else -2 ** 62
+        hi = int(until // 3600) if until is not None else 2 ** 62
+        rows = self._reader().execute(
+            "SELECT hour, count, peak_sum, peak_max FROM hours WHERE hour BETWEEN ? AND ? ORDER BY hour",
+            (lo, hi)).fetchall()
+        return [{'hour': hour * 3600, 'count': count, 'peak_mean': peak_sum / count, 'peak_max': peak_max}
+                for hour, count, peak_sum, peak_max in rows]
+
+    def snippet(self, hit_id):
+        """A hit's waveform snippet (sample indices, raw and envelope), or None."""
+        if not self.snippets:
+            return None
+        row = self._reader().execute(
+            "SELECT s.chunk, s.offset, s.samples, s.start_index, s.rate, h.sample_index, h.capture_ms"
+            " FROM snippets s JOIN hits h ON h.id = s.hit_id WHERE s.hit_id = ?", (hit_id,)).fetchone()
+        if row is None:
+            return None
+        data = self.snippets.read(row['chunk'], row['offset'], row['samples'])
+        if data is None:
+            return None
+        raw, env = data
+        return {
+            'id': hit_id,
+            'rate': row['rate'],
+            'start': row['start_index'],
+            'trigger_index': row['sample_index'],
+            'capture_end': row['sample_index'] + int(round(row['capture_ms'] * row['rate'] / 1000.0)),
+            'raw': raw.tolist(),
+            'envelope': env.tolist()
+        }
+
+    def config(self, config_id):
+        """The config snapshot a hit refers to (None if unknown)."""
+        row = self._reader().execute("SELECT settings FROM configs WHERE id = ?", (config_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def stats(self):
+        """Hit store counters for the stats event."""
+        with self._stats_lock:
+            return {
+                'hits_written': self.hits_written,
+                'hits_dropped': self.dropped_hits,
+                'hits_queue_depth': self._queue.qsize(),
+                'hits_max_write_ms': self.max_write_ms,
+                'hits_errors': self.write_errors,
+                'snippets_written': self.snippets_written
+            }
+
+
+def parse_hits_query(params, limit_max):
+    """
+    (since, until, limit, before) from request args: Unix seconds, a row
+    count (capped at limit_max) and a hit id. Raises ValueError if invalid.
+    """
+    def number(name, cast=float):
+        value = params.get(name)
+        if value is None or value == '':
+            return None
+        value = cast(value)
+        if cast is float and not math.isfinite(value):
+            raise ValueError(f"{name} must be a finite number")
+        return value
+
+    since = number('since')
+    until = number('until')
+    limit = number('limit', int)
+    before = number('before', int)
+    if since is not None and until is not None and until < since:
+        raise ValueError("until is before since")
+    if limit is None or limit > limit_max:
+        limit = limit_max
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    return since, until, limit, before
+
+
+if __name__ == '__main__':
+    import os
+    import argparse
+    import tempfile
+    import numpy as np
+    from hit_detector import Hit
+
+    ap = argparse.ArgumentParser(description="Fill a scratch hit store and time its queries.")
+    ap.add_argument("--hits", type=int, default=1_000_000, help="hits to insert (spread over a year)")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hits.db")
+        store = HitStore(path, queue_hits=args.hits + 1, config={'TRIGGER_THRESHOLD': 60})
+        year_start = time.time() - 365 * 86400
+        times = np.sort(year_start + rng.uniform(0, 365 * 86400, args.hits))
+        peaks = 60 + rng.gamma(2.0, 6.0, args.hits)
+
+        t0 = time.perf_counter()
+        for k, (t, peak) in enumerate(zip(times, peaks)):
+            store.submit(Hit(k * 1000 + 200, k * 1000, float(peak), 50.0, 250.0), float(t), 41.5)
+        t_submit = (time.perf_counter() - t0) / args.hits * 1e6
+        t0 = time.perf_counter()
+        store.start()
+        store.stop(timeout=600)
+        print(f"{store.hits_written} hits: submit {t_submit:.1f} µs each, "
+              f"written in {time.perf_counter() - t0:.1f} s, {os.path.getsize(path) / 1e6:.0f} MB")
+
+        month = (times[-1] - 30 * 86400, times[-1])
+        day = (times[-1] - 86400, times[-1])
+        first_page = store.page(50)
+        deep_cursor = store.page(50, until=times[args.hits // 2])['next']
+        cases = [
+            ("page 1", lambda: store.page(50)),
+            ("page 2", lambda: store.page(50, before=first_page['next'])),
+            ("page mid-year", lambda: store.page(50, before=deep_cursor)),
+            ("top 10 all time", lambda: store.top(10)),
+            ("top 10 last month", lambda: store.top(10, *month)),
+            ("top 10 last day", lambda: store.top(10, *day)),
+            ("hourly, whole year", lambda: store.hourly()),
+            ("hourly, last day", lambda: store.hourly(*day)),
+        ]
+        for name, fn in cases:
+            fn()
+            best = float('inf')
+            for _ in range(5):
+                t0 = time.perf_counter()
+                fn()
+                best = min(best, time.perf_counter() - t0)
+            print(f"  {name:20} {best * 1000:7.2f} ms")
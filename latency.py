@@ -0,0 +1,119 @@
+"""
+SICK Capstone - Hit-to-pulse latency
+Per-hit timestamps from trigger sample to PIN5_LOW, with rolling percentiles
+
+Every hit that leads to a button press carries a HitTrace through the
+pipeline. All stamps are time.perf_counter() seconds:
+    trigger      first sample above TRIGGER_THRESHOLD was taken
+    capture_end  sample that closed the capture window was taken
+    arrival      reader got the block holding capture_end
+    detected     detector reported the hit (after DSP)
+    pin6_write   pulse thread starts writing PIN6_HIGH
+    pin6_flush   PIN6_HIGH flush returned
+    pin5_flush   PIN5_LOW flush returned
+Sample times come from the sample clock's smallest recent arrival lag
+(SampleClock.taken_at), converted to perf_counter once at startup, so
+"trigger" is when the Arduino took the sample plus the fastest the link
+has delivered lately, not when it reached the Pi, and "arrival" is only
+the delay beyond that.
+
+LatencyTracker keeps the stage durations of the last `window` hits and
+reports p50/p95/p99/max and a histogram per stage.
+"""
+import time
+from collections import deque
+from threading import Lock
+import numpy as np
+
+LATENCY_WINDOW = 1000       # Hits kept for the rolling percentiles
+# Histogram bucket upper edges (ms); the last bucket is everything above
+HISTOGRAM_EDGES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 300, 500, 1000)
+
+# Stage name -> (from, to) stamps
+STAGES = {
+    'capture': ('trigger', 'capture_end'),          # CAPTURE_MS or early release
+    'arrival': ('capture_end', 'arrival'),          # Arduino -> USB -> reader
+    'processing': ('arrival', 'detected'),          # DSP + detection of that block
+    'queue': ('detected', 'pin6_write'),            # Waiting for the pulse thread
+    'write': ('pin6_write', 'pin6_flush'),          # PIN6_HIGH write + flush
+    'trigger_to_pin6': ('trigger', 'pin6_flush'),   # What the player feels
+    'trigger_to_pin5': ('trigger', 'pin5_flush'),   # ... until the arcade reads the width
+}
+
+
+class HitTrace:
+    """Timestamps (perf_counter seconds) of one hit on its way to the pulse."""
+
+    __slots__ = ('trigger', 'capture_end', 'arrival', 'detected',
+                 'pin6_write', 'pin6_flush', 'pin5_flush')
+
+    def __init__(self, trigger, capture_end, arrival, detected):
+        self.trigger = trigger
+        self.capture_end = capture_end
+        self.arrival = arrival
+        self.detected = detected
+        self.pin6_write = None
+        self.pin6_flush = None
+        self.pin5_flush = None
+
+
+class LatencyTracker:
+    """Rolling per-stage latency percentiles over the last `window` hits."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._lock = Lock()
+        self._stages = {name: deque(maxlen=window) for name in STAGES}
+        self.hits = 0
+        # wall (time.time) -> perf_counter, fixed so traces stay comparable
+        self._perf_minus_wall = time.perf_counter() - time.time()
+
+    def trace(self, hit, clock, arrival):
+        """HitTrace for a detector Hit; `arrival` is when its block was read (perf_counter)."""
+        trigger, capture_end = clock.taken_at([hit.trigger_index, hit.index])
+        return HitTrace(trigger + self._perf_minus_wall, capture_end + self._perf_minus_wall,
+                        arrival, time.perf_counter())
+
+    def record(self, trace):
+        """Add the stage durations of one finished trace (stages with a missing stamp are skipped)."""
+        with self._lock:
+            self.hits += 1
+            for name, (start, end) in STAGES.items():
+                t0, t1 = getattr(trace, start), getattr(trace, end)
+                if t0 is not None and t1 is not None:
+                    self._stages[name].append((t1 - t0) * 1000.0)
+
+    def _snapshot(self):
+        with self._lock:
+            return {name: np.array(values) for name, values in self._stages.items()}
+
+    def stats(self):
+        """p50/p95/p99 (ms) per stage, flattened for the stats event."""
+        out = {'latency_hits': self.hits}
+        for name, values in self._snapshot().items():
+            if not len(values):
+                continue
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            out[f'latency_{name}_p50_ms'] = float(p50)
+            out[f'latency_{name}_p95_ms'] = float(p95)
+            out[f'latency_{name}_p99_ms'] = float(p99)
+        return out
+
+    def report(self):
+        """Per-stage count, percentiles, max and histogram (for /api/latency)."""
+        stages = {}
+        for name, values in self._snapshot().items():
+            counts = np.bincount(np.searchsorted(HISTOGRAM_EDGES_MS, values, side='left'),
+                                 minlength=len(HISTOGRAM_EDGES_MS) + 1)
+            entry = {'count': len(values), 'histogram': counts.tolist()}
+            if len(values):
+                p50, p95, p99 = np.percentile(values, (50, 95, 99))
+                entry.update(p50_ms=float(p50), p95_ms=float(p95), p99_ms=float(p99),
+                             max_ms=float(values.max()))
+            stages[name] = entry
+        return {
+            'hits': self.hits,
+            'window': self.window,
+            'histogram_edges_ms': list(HISTOGRAM_EDGES_MS),
+            'stages': stages
+        }
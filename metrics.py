@@ -0,0 +1,245 @@
+"""
+SICK Capstone - Prometheus metrics
+/metrics in the text exposition format (version 0.0.4)
+
+The reader thread only does cheap bookkeeping: observe_block() per
+serial read and Histogram.observe() around the emit and the data lock
+(a bisect and two additions each, ~1 µs). Everything else is gathered
+when /metrics is scraped: the app's stats dict is mapped to metric
+names through STATS_METRICS, and process RSS/CPU is read from /proc.
+
+METRICS_FILE / METRICS_INTERVAL (config) additionally append a JSON
+line of the same values to a file every METRICS_INTERVAL seconds.
+"""
+import os
+import re
+import json
+import time
+from bisect import bisect_left
+from threading import Thread
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SPS_WINDOW_S = 1.0          # Window for the effective sample rate gauge
+
+# stats key -> (metric name, type, help)
+STATS_METRICS = {
+    'sample_count': ('sick_samples_total', 'counter', 'Samples read from the sensor.'),
+    'dropped_samples': ('sick_dropped_samples_total', 'counter',
+                        'Samples lost between the Arduino and the reader.'),
+    'overflow_events': ('sick_serial_overflows_total', 'counter',
+                        'Times the serial receive buffer was found full.'),
+    'seq_resets': ('sick_serial_seq_resets_total', 'counter',
+                   'Binary frames whose sequence number repeated or went back (Arduino restart).'),
+    'measured_sps': ('sick_measured_sps', 'gauge', 'Sample rate seen by the gap detector.'),
+    'clock_est_sps': ('sick_clock_est_sps', 'gauge', 'Arduino sample rate estimated by the sample clock.'),
+    'clock_drift_ms': ('sick_clock_drift_ms', 'gauge', 'Sample axis drift against wall time.'),
+    'clients': ('sick_connected_clients', 'gauge', 'Connected Socket.IO clients.'),
+    'clients_lagging': ('sick_clients_lagging', 'gauge', 'Clients flagged as not keeping up.'),
+    'clients_no_acks': ('sick_clients_no_acks', 'gauge', 'Clients bounded by their transport queue instead of acks.'),
+    'clients_unbounded': ('sick_clients_unbounded', 'gauge', 'Clients sent every frame with no window.'),
+    'clients_refused': ('sick_clients_refused_total', 'counter', 'Connections refused at MAX_CLIENTS.'),
+    'clients_disconnected_slow': ('sick_clients_disconnected_slow_total', 'counter',
+                                  'Clients disconnected for not acknowledging frames.'),
+    'client_frames_dropped': ('sick_client_frames_dropped_total', 'counter',
+                              'Frames dropped from full client queues.'),
+    'ring_samples_skipped': ('sick_ring_samples_skipped_total', 'counter',
+                             'Samples the web process skipped after falling behind the acquisition ring.'),
+    'buffer_size': ('sick_history_samples', 'gauge', 'Samples held in the full-rate history.'),
+    'pulse_count': ('sick_pulses_total', 'counter', 'Hits detected and sent as button presses.'),
+    'pulse_errors': ('sick_pulse_errors_total', 'counter', 'Button presses that failed to write.'),
+    'pulse_max_abs_error_ms': ('sick_pulse_max_abs_error_ms', 'gauge',
+                               'Worst PIN6 to PIN5 gap error against the mapped width.'),
+    'record_dropped_samples': ('sick_record_dropped_samples_total', 'counter',
+                               'Samples left out of the recording.'),
+    'record_queue_depth': ('sick_record_queue_depth', 'gauge', 'Blocks waiting for the recording writer.'),
+    'hits_written': ('sick_hits_written_total', 'counter', 'Hits written to the hit store.'),
+    'hits_dropped': ('sick_hits_dropped_total', 'counter', 'Hits left out of the hit store.'),
+    'hits_queue_depth': ('sick_hits_queue_depth', 'gauge', 'Hits waiting for the hit store writer.'),
+    'hits_max_write_ms': ('sick_hits_max_write_ms', 'gauge', 'Longest hit store transaction.'),
+    'snippets_written': ('sick_snippets_written_total', 'counter', 'Hit waveform snippets written.'),
+}
+# latency_<stage>_p<q>_ms from latency.LatencyTracker.stats()
+LATENCY_KEY = re.compile(r'latency_(\w+)_p(\d+)_ms$')
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is safe enough without a lock under the GIL."""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        total = 0
+        counts = list(self.counts)
+        for le, n in zip(self.buckets, counts):
+            total += n
+            lines.append(f'{self.name}_bucket{{le="{le:g}"}} {total}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {total + counts[-1]}')
+        lines.append(f'{self.name}_sum {self.sum:.9g}')
+        lines.append(f'{self.name}_count {total + counts[-1]}')
+        return lines
+
+
+class Metrics:
+    """Reader-side instrumentation plus rendering of the app's stats."""
+
+    def __init__(self):
+        self.block_samples = Histogram(
+            'sick_read_block_samples', 'Samples returned by one serial read.',
+            (1, 4, 16, 32, 64, 128, 256, 512, 1024, 4096))
+        self.batch_samples = Histogram(
+            'sick_emit_batch_samples', 'Samples per sensor_data emit tick.',
+            (10, 20, 40, 80, 160, 400, 800, 4000))
+        self.emit_seconds = Histogram(
+            'sick_emit_duration_seconds', 'Time to store and publish one emit tick.',
+            (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+        self.lock_wait_seconds = Histogram(
+            'sick_lock_wait_seconds', 'Time the reader waited for the data lock.',
+            (0.00001, 0.0001, 0.001, 0.005, 0.01, 0.05, 0.1))
+
+        self.in_waiting = 0
+        self.max_in_waiting = 0
+        self.effective_sps = 0.0
+        self.reader_process = None  # (CPU s, RSS) of the acquisition process when it reads (--split)
+        self._window_start = None
+        self._window_count = 0
+
+    def observe_block(self, n, in_waiting=0, now=None):
+        """Account for one read of n samples with in_waiting bytes still queued."""
+        if now is None:
+            now = time.perf_counter()
+        self.block_samples.observe(n)
+        self.in_waiting = in_waiting
+        if in_waiting > self.max_in_waiting:
+            self.max_in_waiting = in_waiting
+        if self._window_start is None:
+            self._window_start = now
+            return
+        self._window_count += n
+        elapsed = now - self._window_start
+        if elapsed >= SPS_WINDOW_S:
+            self.effective_sps = self._window_count / elapsed
+            self._window_start = now
+            self._window_count = 0
+
+    def reader_status(self):
+        """Reader-side gauges as shm_ring status fields (acquisition process, --split)."""
+        cpu, rss = process_usage()
+        return {'effective_sps': self.effective_sps, 'in_waiting': self.in_waiting,
+                'max_in_waiting': self.max_in_waiting, 'cpu_seconds': cpu,
+                'rss_bytes': -1 if rss is None else rss}
+
+    def follow(self, status, block_samples=None):
+        """
+        Take the reader-side numbers from the acquisition process (--split),
+        which does the reading: its status fields and block-size histogram
+        as (counts, sum). Process CPU/RSS are then reported for both.
+        """
+        self.effective_sps = status['effective_sps']
+        self.in_waiting = int(status['in_waiting'])
+        self.max_in_waiting = int(status['max_in_waiting'])
+        rss = status['rss_bytes']
+        self.reader_process = (status['cpu_seconds'], None if rss < 0 else int(rss))
+        if block_samples:
+            counts, total = block_samples
+            self.block_samples.counts = list(counts)
+            self.block_samples.sum = total
+
+    def values(self, stats):
+        """(name, type, help, labels, value) for every scalar metric."""
+        out = [
+            ('sick_effective_sps', 'gauge', 'Samples per second through the reader (1 s window).',
+             None, self.effective_sps),
+            ('sick_serial_in_waiting_bytes', 'gauge', 'Bytes queued in the serial driver at the last read.',
+             None, self.in_waiting),
+            ('sick_serial_in_waiting_max_bytes', 'gauge', 'Largest serial backlog seen at a read.',
+             None, self.max_in_waiting),
+        ]
+        for key, value in stats.items():
+            if key in STATS_METRICS:
+                out.append(STATS_METRICS[key] + (None, value))
+                continue
+            m = LATENCY_KEY.match(key)
+            if m:
+                out.append(('sick_hit_latency_ms', 'gauge',
+                            'Hit-to-pulse latency percentiles over the last hits, by stage.',
+                            {'stage': m.group(1), 'quantile': f'{int(m.group(2)) / 100:g}'}, value))
+        if self.reader_process:
+            out.extend(process_values(labels={'process': 'web'}))
+            out.extend(process_values(self.reader_process, {'process': 'acquisition'}))
+        else:
+            out.extend(process_values())
+        return out
+
+    def render(self, stats):
+        """Text exposition for one scrape."""
+        lines = []
+        seen = set()
+        for name, kind, help, labels, value in self.values(stats):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+            label = ''
+            if labels:
+                label = '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+            lines.append(f'{name}{label} {float(value):.9g}')
+        for hist in (self.block_samples, self.batch_samples, self.emit_seconds,
+                     self.lock_wait_seconds):
+            lines.extend(hist.render())
+        return '\n'.join(lines) + '\n'
+
+    def start_log(self, path, interval, collect):
+        """Append {time, metrics} JSON lines to path every interval seconds."""
+        def run():
+            while True:
+                time.sleep(interval)
+                snapshot = {'time': time.time(), 'metrics': {
+                    _flat_name(name, labels): value
+                    for name, _, _, labels, value in self.values(collect())}}
+                try:
+                    with open(path, 'a') as f:
+                        f.write(json.dumps(snapshot) + '\n')
+                except OSError as e:
+                    print(f"WARNING: metrics log {path} not writable, stopping: {e}")
+                    return
+
+        thread = Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+def _flat_name(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}={v}' for k, v in labels.items()) + '}'
+
+
+def process_usage():
+    """(CPU seconds, resident bytes or None) of this process."""
+    t = os.times()
+    try:
+        with open('/proc/self/statm') as f:
+            rss_pages = int(f.read().split()[1])
+        rss = rss_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        rss = None
+    return t.user + t.system, rss
+
+
+def process_values(usage=None, labels=None):
+    """Process CPU seconds and resident memory (this process unless `usage` is given), standard Prometheus names."""
+    cpu, rss = usage or process_usage()
+    out = [('process_cpu_seconds_total', 'counter', 'User and system CPU time spent.', labels, cpu)]
+    if rss is not None:
+        out.append(('process_resident_memory_bytes', 'gauge', 'Resident memory size.', labels, rss))
+    return out
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - WebSocket payload encodings
+JSON arrays (default) or packed binary blocks for sensor_data/initial_data
+
+A client opts in to binary when it connects:
+    io({auth: {encoding: 'binary'}})
+Clients that send nothing (older pages, other tools) keep getting JSON.
+broadcast.Broadcaster keeps track of which client gets which.
+
+Binary payload fields:
+    encoding:  'binary'
+    raw:       bytes, little-endian int16 per sample
+    envelope:  bytes, little-endian float32 per sample
+    start:     sample index of the first sample
+    rate:      samples per second
+    t0:        seconds added to index / rate to get the time axis
+    offsets:   optional bytes, little-endian uint32 per point (decimated data)
+plus the same scalar fields as the JSON payload (baseline, threshold, ...).
+A channel passed as None (a client subscribed to the other one only) is
+left out of either encoding.
+Point k's time is t0 + (start + k) / rate, or t0 + (start + offsets[k]) / rate
+when offsets are present, so no time array is sent.
+
+Run directly to compare payload size and encode time:
+    python3 payloads.py
+"""
+import numpy as np
+
+ENCODINGS = ('json', 'binary')
+
+
+def negotiate(auth):
+    """Encoding requested in the Socket.IO connect auth data ('json' if none)."""
+    if isinstance(auth, dict) and auth.get('encoding') in ENCODINGS:
+        return auth['encoding']
+    return 'json'
+
+
+def encode_json(raw, env, times, **fields):
+    """The original payload: three lists (sent as JSON arrays) plus scalar fields."""
+    payload = {'time': times}
+    if raw is not None:
+        payload['raw'] = raw
+    if env is not None:
+        payload['envelope'] = env
+    payload.update(fields)
+    return payload
+
+
+def encode_binary(raw, env, start, rate, t0=0.0, offsets=None, **fields):
+    """Packed int16 raw + float32 envelope, with the time axis as start/rate/t0."""
+    payload = {
+        'encoding': 'binary',
+        'start': int(start),
+        'rate': rate,
+        't0': float(t0)
+    }
+    if raw is not None:
+        payload['raw'] = np.asarray(raw, dtype='<i2').tobytes()
+    if env is not None:
+        payload['envelope'] = np.asarray(env, dtype='<f4').tobytes()
+    if offsets is not None:
+        # Non-consecutive points (decimated): index of each point minus start
+        payload['offsets'] = np.asarray(offsets, dtype='<u4').tobytes()
+    payload.update(fields)
+    return payload
+
+
+def _packet_size(payload):
+    """Bytes on the wire for one Socket.IO event carrying payload."""
+    from socketio import packet
+
+    pkt = packet.Packet(packet.EVENT, data=['sensor_data', payload])
+    encoded = pkt.encode()
+    if isinstance(encoded, list):
+        # Binary event: header text + one attachment per bytes field
+        return sum(len(part) for part in encoded)
+    return len(encoded)
+
+
+if __name__ == '__main__':
+    import time
+
+    rate = 800
+    rng = np.random.default_rng(0)
+    print(f"{'samples':>8} {'json bytes':>11} {'binary bytes':>13} {'ratio':>6}"
+          f" {'json µs':>8} {'binary µs':>10}")
+    for n in (40, 80, 4000):
+        raw = (40 + rng.integers(-6, 7, n)).tolist()
+        env = (rng.random(n) * 300).tolist()
+        times = (123.0 + np.arange(n) / rate).tolist()
+
+        reps = max(5, 20000 // n)
+        results = []
+        for encode in (lambda: encode_json(raw, env, times, baseline=41.7, threshold=60),
+                       lambda: encode_binary(raw, env, 98400, rate, 0.0123,
+                                             baseline=41.7, threshold=60)):
+            size = _packet_size(encode())
+            t0 = time.perf_counter()
+            for _ in range(reps):
+                _packet_size(encode())
+            results.append((size, (time.perf_counter() - t0) / reps * 1e6))
+
+        (js, jt), (bs, bt) = results
+        print(f"{n:>8} {js:>11,} {bs:>13,} {js / bs:>5.1f}x {jt:>8.0f} {bt:>10.0f}")
@@ -6,6 +6,10 @@ import serial
 import pigpio
 import matplotlib.pyplot as plt
 from collections import deque
+from serial_ingest import open_ingest
+from gap_detector import GapDetector
+from dsp import EnvelopeFilter
+from hit_detector import HitDetector
 
 # configure ts boy
 SERIAL_PORT = "/dev/ttyUSB0"  # keeps changing for some reason
@@ -28,15 +32,6 @@ W_MIN_MS, W_MAX_MS = 60, 1500
 N_PLOT = 2000  # 2.5 s history at 800 SPS
 PLOT_EVERY = 40  # update chart 20 Hz
 
-def clamp(x, lo, hi):
-    return max(lo, min(hi, x))
-
-def map_linear(x, x0, x1, y0, y1):
-    if x1 <= x0:
-        return y0
-    t = (x - x0) / (x1 - x0)
-    return y0 + t * (y1 - y0)
-
 def build_pulse_wave(pi, gpio, width_ms):
     pi.write(gpio, 0)
     pi.wave_clear()
@@ -45,22 +40,14 @@ def build_pulse_wave(pi, gpio, width_ms):
     pi.wave_add_generic([up, dn])
     return pi.wave_create()
 
-def read_one_int(ser):
-    """Read one line and parse int; return None on empty/invalid."""
-    s = ser.readline().decode(errors="ignore").strip()
-    if not s:
-        return None
-    try:
-        return int(s)
-    except ValueError:
-        return None
-
 def main():
     ap = argparse.ArgumentParser(description="PBT amplitude → pulse with live plot (throttled).")
     ap.add_argument("--port", default=SERIAL_PORT)
     ap.add_argument("--baud", type=int, default=BAUD)
     ap.add_argument("--gpio", type=int, default=GPIO_PULSE)
     ap.add_argument("--print-peaks", action="store_true")
+    ap.add_argument("--protocol", choices=["auto", "ascii", "binary"], default="auto",
+                    help="serial wire format (auto = try binary frames, fall back to ASCII)")
     args = ap.parse_args()
 
     # pigpio
@@ -74,20 +61,23 @@ def main():
     # serial
     ser = serial.Serial(args.port, args.baud, timeout=1)
     time.sleep(0.2); ser.reset_input_buffer()
+    ingest = open_ingest(ser, args.protocol)
 
     # quick baseline warm-up (200 ms)
     baseline, env = 0.0, 0.0
-    armed, peak, cap_end = True, 0.0, 0.0
     t0 = time.time()
     n = 0
     while time.time() - t0 < 0.2:
-        v = read_one_int(ser)
-        if v is None:
-            continue
-        baseline = (baseline*n + v) / (n+1) if n > 0 else v
-        n += 1
+        for v in ingest.read_block():
+            baseline = (baseline*n + v) / (n+1) if n > 0 else v
+            n += 1
 
     print(f"Baseline ≈ {baseline:.1f} (0–1023 ADC counts)")
+    dsp = EnvelopeFilter(BASELINE_ALPHA, ENVELOPE_ALPHA, baseline, env)
+
+    # dropped-sample accounting (sequence gaps in binary mode, rate deficit in ASCII)
+    gaps = GapDetector(SAMPLES_PER_SEC, log=True)
+    ingest.monitor = gaps
 
     # plot setup
     raw_buf = deque([baseline]*N_PLOT, maxlen=N_PLOT)
@@ -107,109 +97,53 @@ def main():
     # stats
     samp_count, t_last = 0, time.time()
 
-    # re-arm level to avoid re-trigger while env is still high
+    # hit detection; re-arm level avoids re-trigger while env is still high
     REARM_LEVEL = TRIGGER_THRESHOLD * 0.4
+    detector = HitDetector(SAMPLES_PER_SEC, TRIGGER_THRESHOLD, CAPTURE_MS, REFRACTORY_MS,
+                           REARM_LEVEL, (A_MIN, A_MAX), (W_MIN_MS, W_MAX_MS))
 
     try:
         plot_tick = 0
         while True:
-            # 1) drain backlog quickly (so hits don't stretch over seconds)
-            consumed = 0
-            while ser.in_waiting > 0 and consumed < 2000:
-                v = read_one_int(ser)
-                if v is None:
-                    break
-                consumed += 1
-                samp_count += 1
-
-                # update baseline/env
-                baseline = (1 - BASELINE_ALPHA)*baseline + BASELINE_ALPHA*v
-                xmag = abs(v - baseline)
-                env = (1 - ENVELOPE_ALPHA)*env + ENVELOPE_ALPHA*xmag
-
-                now = time.time()
-                if armed:
-                    if env > TRIGGER_THRESHOLD:
-                        armed = False
-                        peak = env
-                        cap_end = now + (CAPTURE_MS/1000.0)
+            # 1) drain everything buffered in one read (blocks up to the serial timeout)
+            block = ingest.read_block()
+
+            # update baseline/env for the whole block
+            _, env_block = dsp.process(block)
+            n = len(block)
+
+            # refractory/re-arm are counted in samples, so samples that queue
+            # up during a (blocking) pulse are still detected in order
+            for hit in detector.process(env_block):
+                if args.print_peaks:
+                    print(f"Peak={hit.peak:.1f} → {hit.width_ms:.0f} ms")
+
+                wid = build_pulse_wave(pi, args.gpio, hit.width_ms)
+                if wid >= 0:
+                    pi.wave_send_once(wid)
+                    while pi.wave_tx_busy():
+                        time.sleep(0.001)
+                    pi.wave_delete(wid)
                 else:
-                    if env > peak:
-                        peak = env
-                    if now >= cap_end or env < (TRIGGER_THRESHOLD * 0.5):
-                        # map and fire pulse
-                        a_clamped = clamp(peak, A_MIN, A_MAX)
-                        width_ms = clamp(map_linear(a_clamped, A_MIN, A_MAX, W_MIN_MS, W_MAX_MS), W_MIN_MS, W_MAX_MS)
-                        if args.print_peaks:
-                            print(f"Peak={peak:.1f} → {width_ms:.0f} ms")
-
-                        wid = build_pulse_wave(pi, args.gpio, width_ms)
-                        if wid >= 0:
-                            pi.wave_send_once(wid)
-                            while pi.wave_tx_busy():
-                                time.sleep(0.001)
-                            pi.wave_delete(wid)
-                        else:
-                            pi.write(args.gpio, 1); time.sleep(width_ms/1000.0); pi.write(args.gpio, 0)
-
-                        # refractory, but do NOT re-arm until env is truly low
-                        t_ref_end = time.time() + (REFRACTORY_MS/1000.0)
-                        while time.time() < t_ref_end:
-                            v2 = read_one_int(ser)
-                            if v2 is None:
-                                continue
-                            samp_count += 1
-                            baseline = (1-BASELINE_ALPHA)*baseline + BASELINE_ALPHA*v2
-                            xmag = abs(v2 - baseline)
-                            env = (1-ENVELOPE_ALPHA)*env + ENVELOPE_ALPHA*xmag
-
-                        # wait to re-arm until env falls below REARM_LEVEL
-                        while True:
-                            if env < REARM_LEVEL:
-                                armed = True
-                                break
-                            v3 = read_one_int(ser)
-                            if v3 is None:
-                                time.sleep(0.001);  # yield briefly
-                                continue
-                            samp_count += 1
-                            baseline = (1-BASELINE_ALPHA)*baseline + BASELINE_ALPHA*v3
-                            xmag = abs(v3 - baseline)
-                            env = (1-ENVELOPE_ALPHA)*env + ENVELOPE_ALPHA*xmag
-
-                # update plot buffers for each consumed sample
-                raw_buf.append(v)
-                env_buf.append(env)
-
-            # throttle UI updates
-            plot_tick += 1
-            if plot_tick % PLOT_EVERY == 0:
+                    pi.write(args.gpio, 1); time.sleep(hit.width_ms/1000.0); pi.write(args.gpio, 0)
+
+            # update plot buffers for each consumed sample
+            samp_count += n
+            raw_buf.extend(block)
+            env_buf.extend(env_block.tolist())
+            plot_tick += n
+
+            # throttle UI updates (PLOT_EVERY samples ≈ 20 Hz)
+            if plot_tick >= PLOT_EVERY:
+                plot_tick = 0
                 line_raw.set_ydata(raw_buf)
                 line_env.set_ydata(env_buf)
                 fig.canvas.draw_idle()
                 fig.canvas.flush_events()
 
-            # fallback blocking read if no backlog
-            if ser.in_waiting == 0:
-                v = read_one_int(ser)
-                if v is not None:
-                    samp_count += 1
-                    baseline = (1-BASELINE_ALPHA)*baseline + BASELINE_ALPHA*v
-                    xmag = abs(v - baseline)
-                    env = (1-ENVELOPE_ALPHA)*env + ENVELOPE_ALPHA*xmag
-
-                    raw_buf.append(v); env_buf.append(env)
-
-                    plot_tick += 1
-                    if plot_tick % PLOT_EVERY == 0:
-                        line_raw.set_ydata(raw_buf)
-                        line_env.set_ydata(env_buf)
-                        fig.canvas.draw_idle()
-                        fig.canvas.flush_events()
-
             # print effective SPS once per second (for sanity)
             if time.time() - t_last >= 1.0:
-                print(f"SPS: {samp_count}")
+                print(f"SPS: {samp_count}  dropped: {gaps.dropped_samples}  overflows: {gaps.overflow_events}")
                 samp_count = 0
                 t_last = time.time()
 
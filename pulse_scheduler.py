@@ -0,0 +1,155 @@
+"""
+SICK Capstone - Arcade pulse scheduler
+Runs the Arduino PIN6/PIN5 button-press sequence on its own thread
+
+The reader thread only calls schedule(), which queues the request and
+returns immediately, so sampling, buffering and emitting carry on while
+a pulse is in flight.
+"""
+import time
+import queue
+from threading import Thread, Lock
+
+PULSE_HOLD_MS = 100   # Pins stay active this long after PIN5_LOW
+SPIN_S = 0.002        # Final stretch before a deadline is spent polling, not sleeping
+
+
+def sleep_until(deadline):
+    """Sleep until time.perf_counter() reaches deadline, spinning at the end."""
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return
+        if remaining > SPIN_S:
+            time.sleep(remaining - SPIN_S)
+        else:
+            time.sleep(0)  # Yield the GIL while polling
+
+
+class PulseScheduler:
+    """
+    Arcade button press protocol using Arduino GPIO control.
+
+    Sends commands to Arduino which controls the arcade motherboard pins.
+    Arduino Pin 6: Active HIGH (normally LOW) - Press start signal
+    Arduino Pin 5: Active LOW (normally HIGH) - Press confirmation signal
+
+    Sequence (per scheduled pulse):
+    1. Send PIN6_HIGH command to Arduino
+    2. Wait until width_ms after PIN6_HIGH (THE PULSE - arcade measures this gap)
+    3. Send PIN5_LOW command to Arduino
+    4. Hold active state for PULSE_HOLD_MS, then reset
+
+    The arcade measures the time between Pin 6↑ and Pin 5↓; the measured
+    gap between the two flushes is recorded for pulse-width accuracy stats.
+    A pulse scheduled with a latency.HitTrace gets its write/flush times
+    stamped and is handed to `latency` (a LatencyTracker) once sent.
+    """
+
+    def __init__(self, ser, hold_ms=PULSE_HOLD_MS, latency=None):
+        self.ser = ser
+        self.hold_ms = hold_ms
+        self.latency = latency
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stats_lock = Lock()
+
+        # Statistics
+        self.pulses = 0
+        self.errors = 0
+        self.last_width_ms = 0.0
+        self.last_error_ms = 0.0
+        self.max_abs_error_ms = 0.0
+        self._sum_abs_error_ms = 0.0
+
+    def start(self):
+        """Start the output thread."""
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=1.0):
+        """Finish any queued pulses and stop the output thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def schedule(self, width_ms, trace=None):
+        """Queue one button press; never blocks the caller."""
+        self._queue.put((width_ms, trace))
+
+    def busy(self):
+        """True while a pulse is queued or in flight."""
+        return self._queue.unfinished_tasks > 0
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._press(*item)
+            finally:
+                self._queue.task_done()
+
+    def _press(self, width_ms, trace=None):
+        ser = self.ser
+        try:
+            # Step 1: Pin 6 HIGH (press start signal) - 5V output from Arduino
+            t_write = time.perf_counter()
+            ser.write(b"PIN6_HIGH\n")
+            ser.flush()  # Ensure command is sent immediately
+            t_high = time.perf_counter()
+
+            # Step 2: Wait for the mapped duration, measured from the PIN6 flush
+            sleep_until(t_high + width_ms / 1000.0)
+
+            # Step 3: Pin 5 LOW (press confirmed) - 0V output from Arduino
+            ser.write(b"PIN5_LOW\n")
+            ser.flush()
+            t_low = time.perf_counter()
+            self._record((t_low - t_high) * 1000.0, width_ms)
+            if trace is not None and self.latency is not None:
+                trace.pin6_write, trace.pin6_flush, trace.pin5_flush = t_write, t_high, t_low
+                self.latency.record(trace)
+
+            # Step 4: Hold active state longer (cleanup)
+            sleep_until(t_low + self.hold_ms / 1000.0)
+
+            # Step 5: Reset both pins to idle state
+            ser.write(b"PIN5_HIGH\n")  # Pin 5 back to HIGH (5V)
+            ser.write(b"PIN6_LOW\n")   # Pin 6 back to LOW (0V)
+            ser.flush()
+
+        except Exception as e:
+            self.errors += 1
+            print(f"Error in arcade button press: {e}")
+            # Try to reset GPIO on error
+            try:
+                ser.write(b"RESET_GPIO\n")
+                ser.flush()
+            except Exception:
+                pass
+
+    def _record(self, actual_ms, width_ms):
+        error = actual_ms - width_ms
+        with self._stats_lock:
+            self.pulses += 1
+            self.last_width_ms = actual_ms
+            self.last_error_ms = error
+            self.max_abs_error_ms = max(self.max_abs_error_ms, abs(error))
+            self._sum_abs_error_ms += abs(error)
+
+    def stats(self):
+        """Pulse-width accuracy for the stats event."""
+        with self._stats_lock:
+            mean = self._sum_abs_error_ms / self.pulses if self.pulses else 0.0
+            return {
+                'pulses_sent': self.pulses,
+                'pulse_errors': self.errors,
+                'pulse_last_width_ms': self.last_width_ms,
+                'pulse_last_error_ms': self.last_error_ms,
+                'pulse_mean_abs_error_ms': mean,
+                'pulse_max_abs_error_ms': self.max_abs_error_ms
+            }
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - Raw sample recording
+Append-only capture files written off the reader thread, read back with memmap
+
+The reader thread only calls submit(), which puts the block on a bounded
+queue and returns; a writer thread does the disk I/O. If the disk stalls
+long enough to fill the queue, blocks are dropped and counted rather
+than ever blocking acquisition.
+
+File layout (one file per rotation, *.rec):
+    HEADER_SIZE bytes  b"SICKREC1" + uint32 length + JSON header, space padded
+    then               raw samples, little-endian uint16, appended in chunks
+The JSON header holds the sample rate, the wall time and sample index of
+the first sample, and a snapshot of the config. The sample count is the
+data size / 2, so a file cut short by a crash or power loss is still
+readable up to its last complete sample.
+
+Files rotate after RECORD_MAX_FILE_MB or RECORD_MAX_FILE_S, whichever
+comes first, or when the sample index jumps (e.g. after a restart).
+
+Run directly to measure write throughput and submit() latency while a
+background job saturates the same disk:
+    python3 recorder.py [--dir /tmp/rec-bench]
+"""
+import os
+import sys
+import json
+import time
+import queue
+import struct
+import numpy as np
+from threading import Thread, Lock
+
+MAGIC = b"SICKREC1"
+HEADER_SIZE = 4096
+SAMPLE_DTYPE = np.dtype('<u2')
+SUFFIX = ".rec"
+
+
+def config_snapshot():
+    """JSON-safe copy of the active config.py settings."""
+    try:
+        import config
+    except ImportError:
+        return {}
+    snapshot = {}
+    for name, value in vars(config).items():
+        if name.isupper():
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError):
+                value = repr(value)
+            snapshot[name] = value
+    return snapshot
+
+
+def _encode_header(header):
+    body = json.dumps(header, separators=(",", ":")).encode()
+    if len(MAGIC) + 4 + len(body) > HEADER_SIZE:
+        # Keep the fixed-size header; the config snapshot is the only large field
+        header = dict(header, config={"truncated": True})
+        body = json.dumps(header, separators=(",", ":")).encode()
+    out = MAGIC + struct.pack("<I", len(body)) + body
+    return out + b" " * (HEADER_SIZE - len(out))
+
+
+class Recorder:
+    """Bounded-queue recording sink with size/time based file rotation."""
+
+    def __init__(self, directory, sample_rate, max_file_mb=64, max_file_s=3600,
+                 queue_blocks=256, config=None):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_file_bytes = int(max_file_mb * 1024 * 1024)
+        self.max_file_s = max_file_s
+        self.config = config_snapshot() if config is None else config
+        self._queue = queue.Queue(maxsize=queue_blocks)
+        self._thread = None
+        self._stats_lock = Lock()
+
+        # Current file
+        self._file = None
+        self.path = None
+        self._file_bytes = 0
+        self._file_opened = 0.0
+        self._next_index = None
+
+        # Statistics
+        self.files = 0
+        self.samples_written = 0
+        self.bytes_written = 0
+        self.dropped_blocks = 0
+        self.dropped_samples = 0
+        self.write_errors = 0
+        self.max_queue_depth = 0
+        self.max_write_ms = 0.0
+
+    def start(self):
+        """Start the writer thread."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=5.0):
+        """Write out everything queued so far and close the current file."""
+        if self._thread is not None:
+            while True:
+                try:
+                    self._queue.put(None, timeout=timeout)
+                    break
+                except queue.Full:
+                    continue
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, raw, first_index, now=None):
+        """Queue one block of consecutive samples; never blocks the caller."""
+        if not len(raw):
+            return True
+        if now is None:
+            now = time.time()
+        try:
+            self._queue.put_nowait((raw, first_index, now))
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped_blocks += 1
+                self.dropped_samples += len(raw)
+            return False
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            # Drain whatever else is waiting so each write is one larger chunk
+            items = [item]
+            stop = False
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                items.append(item)
+            try:
+                self._write(items)
+            except OSError as e:
+                self.write_errors += 1
+                print(f"ERROR: recording write failed: {e}", file=sys.stderr)
+                self._close()
+            if stop:
+                break
+        self._close()
+
+    def _write(self, items):
+        t0 = time.perf_counter()
+        chunk = []
+        for raw, first_index, now in items:
+            if self._file is not None and self._needs_rotation(first_index, now):
+                self._flush(chunk)
+                chunk = []
+                self._close()
+            if self._file is None:
+                self._open(first_index, now - (len(raw) - 1) / self.sample_rate)
+            chunk.append(np.asarray(raw, dtype=SAMPLE_DTYPE).tobytes())
+            self._next_index = first_index + len(raw)
+        self._flush(chunk)
+        ms = (time.perf_counter() - t0) * 1000.0
+        if ms > self.max_write_ms:
+            self.max_write_ms = ms
+
+    def _flush(self, chunk):
+        if not chunk:
+            return
+        data = b"".join(chunk)
+        self._file.write(data)
+        self._file.flush()
+        self._file_bytes += len(data)
+        with self._stats_lock:
+            self.bytes_written += len(data)
+            self.samples_written += len(data) // SAMPLE_DTYPE.itemsize
+
+    def _needs_rotation(self, first_index, now):
+        return (first_index != self._next_index
+                or self._file_bytes >= self.max_file_bytes
+                or now - self._file_opened >= self.max_file_s)
+
+    def _open(self, first_index, start_time):
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(start_time))
+        self.path = os.path.join(self.directory, f"sick_{stamp}_{first_index}{SUFFIX}")
+        header = {
+            "version": 1,
+            "sample_rate": self.sample_rate,
+            "start_time": start_time,
+            "first_index": first_index,
+            "dtype": SAMPLE_DTYPE.str,
+            "config": self.config
+        }
+        self._file = open(self.path, "wb")
+        self._file.write(_encode_header(header))
+        self._file_bytes = 0
+        self._file_opened = start_time
+        self.files += 1
+
+    def _close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def stats(self):
+        """Recording counters for the stats event."""
+        with self._stats_lock:
+            return {
+                'record_files': self.files,
+                'record_samples': self.samples_written,
+                'record_bytes': self.bytes_written,
+                'record_dropped_samples': self.dropped_samples,
+                'record_queue_depth': self._queue.qsize(),
+                'record_max_queue_depth': self.max_queue_depth,
+                'record_max_write_ms': self.max_write_ms,
+                'record_errors': self.write_errors
+            }
+
+
+class Recording:
+    """One capture file opened for zero-copy random access."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            head = f.read(HEADER_SIZE)
+        if len(head) < HEADER_SIZE or head[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: not a SICK recording")
+        length, = struct.unpack_from("<I", head, len(MAGIC))
+        self.header = json.loads(head[len(MAGIC) + 4:len(MAGIC) + 4 + length])
+        self.sample_rate = self.header["sample_rate"]
+        self.start_time = self.header["start_time"]
+        self.first_index = self.header["first_index"]
+
+        dtype = np.dtype(self.header.get("dtype", SAMPLE_DTYPE.str))
+        count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+        if count > 0:
+            self.samples = np.memmap(path, dtype=dtype, mode="r",
+                                     offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.samples = np.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def times(self, start=0, stop=None):
+        """Wall-clock times (epoch seconds) of samples start..stop."""
+        stop = len(self.samples) if stop is None else stop
+        return self.start_time + np.arange(start, stop) / self.sample_rate
+
+    def between(self, t_start, t_end):
+        """View of the samples between two wall-clock times."""
+        i0 = max(0, int((t_start - self.start_time) * self.sample_rate))
+        i1 = max(i0, int(np.ceil((t_end - self.start_time) * self.sample_rate)))
+        return self.samples[i0:i1]
+
+
+def list_recordings(directory):
+    """Paths of all capture files in directory, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.endswith(SUFFIX)]
+    return sorted(paths, key=lambda p: Recording(p).start_time)
+
+
+def open_recordings(directory):
+    """Recording objects for every capture file in directory, oldest first."""
+    return [Recording(p) for p in list_recordings(directory)]
+
+
+def _disk_hog(directory, stop, chunk_mb=8):
+    """Keep the disk busy like a large FTP upload: big writes + fsync."""
+    path = os.path.join(directory, "contention.bin")
+    block = os.urandom(chunk_mb * 1024 * 1024)
+    with open(path, "wb") as f:
+        while not stop[0]:
+            f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+            if f.tell() > 512 * 1024 * 1024:
+                f.seek(0)
+    os.remove(path)
+
+
+def _bench(directory, seconds, rate, block, contention):
+    """Submit `block`-sample blocks at `rate` SPS; return submit/write figures."""
+    import shutil
+
+    stop = [False]
+    hog = None
+    if contention:
+        hog = Thread(target=_disk_hog, args=(directory, stop), daemon=True)
+        hog.start()
+        time.sleep(0.5)
+
+    rec_dir = os.path.join(directory, "rec")
+    rec = Recorder(rec_dir, rate, max_file_mb=16, config={})
+    rec.start()
+    samples = (40 + np.arange(block) % 900).astype(np.uint16).tolist()
+    period = block / rate
+    lat = []
+    index = 0
+    t_next = time.perf_counter()
+    t_end = t_next + seconds
+    while t_next < t_end:
+        delay = t_next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        t0 = time.perf_counter()
+        rec.submit(samples, index)
+        lat.append(time.perf_counter() - t0)
+        index += block
+        t_next += period
+    t_stop = time.perf_counter()
+    rec.stop(timeout=30)
+    flushed = time.perf_counter() - t_stop
+
+    stop[0] = True
+    if hog is not None:
+        hog.join()
+    stats = rec.stats()
+    shutil.rmtree(rec_dir, ignore_errors=True)
+
+    lat = np.array(lat) * 1e6
+    return {
+        "submit_p50_us": float(np.percentile(lat, 50)),
+        "submit_max_us": float(lat.max()),
+        "written_sps": stats["record_samples"] / (seconds + flushed),
+        "dropped": stats["record_dropped_samples"],
+        "max_write_ms": stats["record_max_write_ms"],
+        "max_queue": stats["record_max_queue_depth"],
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+
+    ap = argparse.ArgumentParser(description="Recording sink throughput under disk contention.")
+    ap.add_argument("--dir", default=None, help="directory on the disk to test (default: temp dir)")
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--rate", type=int, default=50000, help="samples per second to record")
+    args = ap.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="sick-rec-")
+    os.makedirs(directory, exist_ok=True)
+    print(f"{'disk':>10} {'submit p50':>11} {'submit max':>11} {'written SPS':>12}"
+          f" {'dropped':>8} {'max write':>10} {'max queue':>10}")
+    for contention in (False, True):
+        r = _bench(directory, args.seconds, args.rate, 40, contention)
+        print(f"{'busy' if contention else 'idle':>10} {r['submit_p50_us']:>9.1f}µs"
+              f" {r['submit_max_us']:>9.1f}µs {r['written_sps']:>12,.0f}"
+              f" {r['dropped']:>8} {r['max_write_ms']:>8.1f}ms {r['max_queue']:>10}")
+
+    # Readback: memmap random access
+    rec = Recorder(os.path.join(directory, "read"), 800, config={})
+    rec.start()
+    data = np.arange(1_000_000) % 1024
+    rec.submit(data.tolist(), 0)
+    rec.stop()
+    r = open_recordings(os.path.join(directory, "read"))[0]
+    t0 = time.perf_counter()
+    total = 0
+    for i in np.random.default_rng(0).integers(0, len(r) - 800, 1000):
+        total += int(r.samples[i:i + 800].max())
+    dt = (time.perf_counter() - t0) / 1000 * 1e6
+    assert np.array_equal(r.samples[:1000], data[:1000])
+    print(f"readback: {len(r):,} samples, random 800-sample window in {dt:.1f} µs")
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - Capture replay
+Feeds recorded samples to the reader loop in place of the Arduino
+
+ReplaySource has the same read_block() interface as SerialIngest, so the
+apps run the recorded data through their normal DSP, hit detection,
+history and emit path. Supported captures:
+- recorder.py files (*.rec), a single file or a whole directory
+- JSON lines, one object per line with "samples" (or "raw") as a list
+  or "value" as one sample; bare numbers and lists are accepted too
+- plain text dumps of the ASCII serial stream (one sample per line)
+
+Pacing is by sample count against time.perf_counter(): speed 1 plays
+at the recorded rate, 10 at ten times that, and 0 as fast as the
+pipeline can take it. now() gives the replay time of the last sample
+handed out, so the sample clock sees a steady link whatever the speed.
+
+Run directly to measure how fast the DSP + hit detector keep up:
+    python3 replay.py recordings/ [--speed 0]
+"""
+import os
+import sys
+import json
+import time
+import numpy as np
+from recorder import Recording, list_recordings, SUFFIX
+
+BLOCK_SAMPLES = 4096    # Largest block returned by one read_block() call
+IDLE_SLEEP_S = 0.001    # Shortest wait when no sample is due yet
+
+
+def _load_json_lines(path):
+    """Samples from a JSON-lines log."""
+    samples = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, dict):
+                item = item.get("samples", item.get("raw", item.get("value", [])))
+            if isinstance(item, list):
+                samples.extend(item)
+            else:
+                samples.append(item)
+    return np.asarray(samples, dtype=np.int64)
+
+
+def _load_text(path):
+    """Samples from a dump of the ASCII serial stream, skipping garbled lines."""
+    samples = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                samples.append(int(line))
+            except ValueError:
+                pass
+    return np.asarray(samples, dtype=np.int64)
+
+
+def load_segments(path):
+    """
+    (samples, sample_rate) for each capture under path, oldest first.
+
+    sample_rate is None for logs that do not record it.
+    """
+    if os.path.isdir(path):
+        return [(rec.samples, rec.sample_rate)
+                for rec in map(Recording, list_recordings(path))]
+    if path.endswith(SUFFIX):
+        rec = Recording(path)
+        return [(rec.samples, rec.sample_rate)]
+    if path.endswith((".jsonl", ".json")):
+        return [(_load_json_lines(path), None)]
+    return [(_load_text(path), None)]
+
+
+class ReplaySource:
+    """Paced stand-in for SerialIngest, fed from recorded captures."""
+
+    def __init__(self, path, sample_rate, speed=1.0, loop=False, block_samples=BLOCK_SAMPLES):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.loop = loop
+        self.block_samples = block_samples
+        self.monitor = None  # Interface parity with SerialIngest; replay has no link to watch
+        self.last_waiting = 0
+
+        segments = load_segments(path)
+        self._segments = [s for s, _ in segments if len(s)]
+        if not self._segments:
+            raise ValueError(f"{path}: no samples to replay")
+        for _, rate in segments:
+            if rate is not None and rate != sample_rate:
+                print(f"WARNING: {path} was recorded at {rate} SPS, replaying at {sample_rate} SPS")
+                break
+        self.total = sum(len(s) for s in self._segments)
+
+        self._seg = 0
+        self._pos = 0
+        self._t_start = None
+        self._origin = None
+        self.finished = False
+
+        # Statistics
+        self.samples_read = 0
+        self.passes = 0
+        self.max_lag_ms = 0.0
+
+    def start(self, now=None):
+        """Start the pacing clock; now() counts from this wall time."""
+        self._t_start = time.perf_counter()
+        self._origin = time.time() if now is None else now
+
+    def now(self):
+        """Replay time (epoch seconds) of the last sample handed out."""
+        if self._origin is None:
+            self.start()
+        return self._origin + self.samples_read / self.sample_rate
+
+    def peek(self, n):
+        """The next n samples (fewer at the end), without consuming them."""
+        out = []
+        seg, pos = self._seg, self._pos
+        while n > 0 and seg < len(self._segments):
+            part = self._segments[seg][pos:pos + n]
+            out.extend(part.tolist())
+            n -= len(part)
+            seg, pos = seg + 1, 0
+        return out
+
+    def read_block(self):
+        """Return the samples due now (may be empty); waits briefly when none are."""
+        if self.finished:
+            return []
+        if self._t_start is None:
+            self.start()
+
+        want = self.block_samples
+        if self.speed > 0:
+            elapsed = time.perf_counter() - self._t_start
+            due = int(elapsed * self.sample_rate * self.speed) - self.samples_read
+            if due <= 0:
+                wait = (1 - due) / (self.sample_rate * self.speed)
+                time.sleep(max(wait, IDLE_SLEEP_S))
+                return []
+            # Behind by more than one block: the pipeline cannot keep up
+            lag_ms = (due - want) * 1000.0 / (self.sample_rate * self.speed)
+            if lag_ms > self.max_lag_ms:
+                self.max_lag_ms = lag_ms
+            want = min(want, due)
+
+        block = self._take(want)
+        self.samples_read += len(block)
+        return block
+
+    def _take(self, n):
+        out = []
+        while n > 0:
+            seg = self._segments[self._seg]
+            part = seg[self._pos:self._pos + n]
+            out.extend(part.tolist())
+            n -= len(part)
+            self._pos += len(part)
+            if self._pos >= len(seg):
+                self._seg += 1
+                self._pos = 0
+                if self._seg == len(self._segments):
+                    self.passes += 1
+                    if not self.loop:
+                        self.finished = True
+                        break
+                    self._seg = 0
+        return out
+
+    def stats(self):
+        """Replay progress for the stats event."""
+        return {
+            'replay_speed': self.speed,
+            'replay_samples': self.samples_read,
+            'replay_progress': min(1.0, (self._seg_offset() + self._pos) / self.total),
+            'replay_passes': self.passes,
+            'replay_max_lag_ms': self.max_lag_ms
+        }
+
+    def _seg_offset(self):
+        return sum(len(s) for s in self._segments[:self._seg])
+
+
+def _bench(path, sample_rate, speed):
+    """Run a capture through DSP + hit detection; return samples/s and hits."""
+    from config import BASELINE_ALPHA, ENVELOPE_ALPHA, TRIGGER_THRESHOLD
+    from dsp import EnvelopeFilter
+    from hit_detector import HitDetector
+
+    source = ReplaySource(path, sample_rate, speed)
+    warm = source.peek(int(0.2 * sample_rate))
+    dsp = EnvelopeFilter(BASELINE_ALPHA, ENVELOPE_ALPHA, sum(warm) / max(len(warm), 1), 0.0)
+    detector = HitDetector(sample_rate, TRIGGER_THRESHOLD, 250, 200, TRIGGER_THRESHOLD * 0.4,
+                           (60, 95), (10, 100), inverse=True)
+    hits = 0
+    t0 = time.perf_counter()
+    while not source.finished:
+        block = source.read_block()
+        if block:
+            _, env = dsp.process(block)
+            hits += len(detector.process(env))
+    elapsed = time.perf_counter() - t0
+    return source.samples_read / elapsed, hits, source.max_lag_ms
+
+
+if __name__ == '__main__':
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Replay a capture through DSP + hit detection.")
+    ap.add_argument("path", help="recording directory, .rec file, .jsonl log or ASCII dump")
+    ap.add_argument("--rate", type=int, default=800, help="sample rate of the capture")
+    ap.add_argument("--speed", type=float, default=0.0, help="x real time (0 = as fast as possible)")
+    args = ap.parse_args()
+
+    try:
+        sps, hits, lag = _bench(args.path, args.rate, args.speed)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{sps:,.0f} samples/s ({sps / args.rate:,.0f}x real time at {args.rate} SPS),"
+          f" {hits} hits, max lag {lag:.1f} ms")
@@ -0,0 +1,121 @@
+"""
+SICK Capstone - Sample history ring buffer
+Preallocated struct-of-arrays storage for raw, envelope and sample index
+
+Each column is a flat NumPy array (uint16 raw ADC, float32 envelope,
+int64 sample index) instead of a deque of boxed Python numbers, so
+minutes of history fit in a few tens of MB.
+
+The arrays are mirrored: every sample is written at position p and
+p + capacity. Any run of up to `capacity` consecutive samples is then a
+single contiguous slice, so latest() returns views with no copying and
+no wrap-around handling. A view of the newest n samples stays valid
+until capacity - n further samples have been appended.
+"""
+import numpy as np
+
+RAW_DTYPE = np.uint16
+ENV_DTYPE = np.float32
+INDEX_DTYPE = np.int64
+
+# Stored bytes per sample (each column is held twice, see above)
+BYTES_PER_SAMPLE = 2 * (np.dtype(RAW_DTYPE).itemsize
+                        + np.dtype(ENV_DTYPE).itemsize
+                        + np.dtype(INDEX_DTYPE).itemsize)
+
+
+def capacity_for_memory(max_mb):
+    """Number of samples a SampleRing can hold within max_mb megabytes."""
+    return max(1, int(max_mb * 1024 * 1024) // BYTES_PER_SAMPLE)
+
+
+class SampleRing:
+    """Fixed-capacity history of (raw, envelope, index) samples."""
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.raw = np.zeros(2 * self.capacity, dtype=RAW_DTYPE)
+        self.env = np.zeros(2 * self.capacity, dtype=ENV_DTYPE)
+        self.index = np.zeros(2 * self.capacity, dtype=INDEX_DTYPE)
+        self.head = 0       # Physical position of the next write (0..capacity-1)
+        self.count = 0      # Samples stored (≤ capacity)
+        self.total = 0      # Samples ever appended
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return self.raw.nbytes + self.env.nbytes + self.index.nbytes
+
+    def append(self, raw, env, first_index):
+        """Append a block; sample k gets index first_index + k."""
+        n = len(raw)
+        if n == 0:
+            return
+        raw = np.asarray(raw, dtype=RAW_DTYPE)
+        env = np.asarray(env, dtype=ENV_DTYPE)
+        index = first_index + np.arange(n, dtype=INDEX_DTYPE)
+
+        # Only the newest `capacity` samples of an oversized block survive
+        if n > self.capacity:
+            skip = n - self.capacity
+            self.head = (self.head + skip) % self.capacity
+            self.total += skip
+            raw, env, index = raw[skip:], env[skip:], index[skip:]
+            n = self.capacity
+
+        cap = self.capacity
+        start = self.head
+        first = min(n, cap - start)
+        for col, values in ((self.raw, raw), (self.env, env), (self.index, index)):
+            # Primary copy (may wrap to the front) ...
+            col[start:start + first] = values[:first]
+            col[:n - first] = values[first:]
+            # ... and its mirror one capacity further on
+            col[cap + start:cap + start + first] = values[:first]
+            col[cap:cap + n - first] = values[first:]
+
+        self.head = (start + n) % cap
+        self.count = min(cap, self.count + n)
+        self.total += n
+
+    def latest(self, n=None):
+        """Views of the newest n samples (all if None): (raw, env, index)."""
+        if n is None or n > self.count:
+            n = self.count
+        end = self.head + self.capacity
+        return (self.raw[end - n:end],
+                self.env[end - n:end],
+                self.index[end - n:end])
+
+    def newest_index(self):
+        """Sample index of the newest stored sample (None when empty)."""
+        if not self.count:
+            return None
+        return int(self.index[self.head + self.capacity - 1])
+
+    def between(self, first, last):
+        """
+        Views of the stored samples with index first..last (inclusive).
+
+        Indices are consecutive, so the slice is found arithmetically;
+        the range is clipped to what is still stored.
+        """
+        newest = self.newest_index()
+        if newest is None:
+            return self.latest(0)
+        oldest = newest - self.count + 1
+        first = max(first, oldest)
+        last = min(last, newest)
+        if last < first:
+            return self.latest(0)
+        end = self.head + self.capacity - (newest - last)
+        return (self.raw[end - (last - first + 1):end],
+                self.env[end - (last - first + 1):end],
+                self.index[end - (last - first + 1):end])
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.total = 0
@@ -0,0 +1,137 @@
+"""
+SICK Capstone - Sample clock
+Timestamps samples from their index instead of their arrival time
+
+Serial data reaches the reader in bursts (USB packets, kernel buffering,
+GIL stalls), so stamping samples with time.time() puts that jitter into
+the chart's time axis. The Arduino's sample clock is far steadier, so a
+sample's time is simply
+
+    t = offset + index / SAMPLES_PER_SEC
+
+The clock still watches wall time once per block to estimate the real
+sample rate and how far the sample axis has drifted from wall time.
+Arrival lag is only ever positive (a sample cannot be read before it is
+taken), so the smallest lag seen in a window is the best estimate of the
+true offset. Every resync window the drift is measured against that
+minimum; when it exceeds max_drift_ms (clock drift over a long run, or
+samples lost on the link) the offset is snapped back to wall time.
+
+taken_at() gives wall times from that smallest lag instead of the offset,
+for measuring how long after a sample was taken something happened.
+"""
+import time
+import numpy as np
+
+CLOCK_RESYNC_S = 10.0        # Drift/rate estimation window (seconds)
+CLOCK_MAX_DRIFT_MS = 20.0    # Re-anchor the time axis beyond this drift
+
+
+class SampleClock:
+    """Index-based timestamps with rate and drift estimation against wall time."""
+
+    def __init__(self, sample_rate, resync_s=CLOCK_RESYNC_S, max_drift_ms=CLOCK_MAX_DRIFT_MS):
+        self.sample_rate = sample_rate
+        self.period = 1.0 / sample_rate
+        self.resync_s = resync_s
+        self.max_drift_s = max_drift_ms / 1000.0
+
+        self.start_time = None
+        self.index = 0              # Index of the next sample to stamp
+        self.offset = None          # Seconds added to index / sample_rate
+
+        # Estimates
+        self.est_sps = float(sample_rate)
+        self.drift_ms = 0.0         # Sample axis behind (+) or ahead (-) of wall time
+        self.resyncs = 0
+        self.lag = None             # Smallest recent arrival lag (last and current window)
+
+        # Window state
+        self._window_start = None
+        self._min_lag = None
+        self._min_lag_at = None     # (index, wall) of the smallest lag in the window
+        self._anchor = None         # (index, wall) of the first window's minimum
+
+    def start(self, now=None):
+        """Set the time origin (t = 0) for the stamped axis."""
+        self.start_time = time.time() if now is None else now
+        self._window_start = self.start_time
+
+    @property
+    def t0(self):
+        """Time of sample index 0 on the stamped axis (seconds since start)."""
+        return 0.0 if self.offset is None else self.offset
+
+    def advance(self, n, now=None):
+        """Account for n new samples read at `now`; return the first one's index."""
+        if now is None:
+            now = time.time()
+        if self.start_time is None:
+            self.start(now)
+        first = self.index
+        if n > 0:
+            self.index += n
+            self._observe(first + n - 1, now - self.start_time)
+        return first
+
+    def stamp(self, n, now=None):
+        """Timestamps (seconds since start) for the next n samples, as a NumPy array."""
+        first = self.advance(n, now)
+        return self.times(first + np.arange(max(n, 0)))
+
+    def times(self, index):
+        """Timestamps (seconds since start) for an array of sample indices."""
+        return self.t0 + np.asarray(index) * self.period
+
+    def taken_at(self, index):
+        """
+        Wall times (time.time() seconds) when samples were taken, from the
+        smallest recent arrival lag: not biased by the first block's read
+        lag or moved by resyncs, and never after a block that has been read.
+        """
+        return self.start_time + self.lag + np.asarray(index) * self.period
+
+    def _observe(self, last_index, wall):
+        """Account for sample `last_index` having been read at `wall` seconds."""
+        lag = wall - last_index * self.period
+        if self.offset is None:
+            # First block: its last sample arrived now, back-date the rest
+            self.offset = lag
+        if self._min_lag is None or lag < self._min_lag:
+            self._min_lag = lag
+            self._min_lag_at = (last_index, wall)
+        if self.lag is None or lag < self.lag:
+            self.lag = lag
+
+        if wall - (self._window_start - self.start_time) < self.resync_s:
+            return
+
+        # Real sample rate from the minimum-lag points; measuring from the
+        # first window keeps the lag noise shrinking as the run gets longer
+        if self._anchor is None:
+            self._anchor = self._min_lag_at
+        else:
+            d_index = self._min_lag_at[0] - self._anchor[0]
+            d_wall = self._min_lag_at[1] - self._anchor[1]
+            if d_wall > 0 and d_index > 0:
+                self.est_sps = d_index / d_wall
+
+        drift = self._min_lag - self.offset
+        self.drift_ms = drift * 1000.0
+        if abs(drift) > self.max_drift_s:
+            self.offset += drift
+            self.resyncs += 1
+
+        self._window_start = self.start_time + wall
+        self.lag = self._min_lag
+        self._min_lag = None
+        self._min_lag_at = None
+
+    def stats(self):
+        """Clock estimates for the stats event."""
+        return {
+            'clock_est_sps': self.est_sps,
+            'clock_drift_ms': self.drift_ms,
+            'clock_drift_ppm': (self.est_sps / self.sample_rate - 1.0) * 1e6,
+            'clock_resyncs': self.resyncs
+        }
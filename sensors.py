@@ -0,0 +1,310 @@
+"""
+SICK Capstone - Multi-sensor acquisition
+Several Arduinos (PBT, PMT, GM) read from one selector loop, one pipeline each
+
+Each enabled entry of SENSORS (config) becomes a SensorPipeline with its
+own serial link, wire protocol, gap detector, sample clock, DSP, hit
+detector and history. Settings missing from an entry fall back to the
+global ones (SAMPLES_PER_SEC, TRIGGER_THRESHOLD, ...).
+
+SensorReader waits on all serial file descriptors at once with
+selectors and only reads a port when the kernel has bytes for it, so one
+thread serves every sensor without polling and a quiet or unplugged
+sensor costs nothing. Ports are switched to non-blocking reads
+(timeout=0) after the protocol negotiation.
+
+Run directly to read N virtual sensors (signal_gen.py ptys) for a few
+seconds and print per-sensor rates and the reader's CPU use:
+    python3 sensors.py [--sensors 3] [--rate 800] [--seconds 5]
+"""
+import os
+import sys
+import time
+import selectors
+from threading import Lock
+from dsp import EnvelopeFilter
+from gap_detector import GapDetector
+from sample_clock import SampleClock
+from hit_detector import HitDetector
+from ring_buffer import SampleRing, capacity_for_memory
+from history import HistoryStore
+from pulse_scheduler import PulseScheduler, PULSE_HOLD_MS
+
+CALIBRATE_S = 0.2           # Baseline warm-up per sensor (samples still kept)
+
+# Per-sensor settings and their defaults; keys absent here come from config globals
+SENSOR_DEFAULTS = {
+    'enabled': True,
+    'capture_ms': 250,
+    'refractory_ms': 200,
+    'amp_range': (60, 95),          # Peak range mapped to the pulse width ...
+    'width_range_ms': (10, 100),    # ... onto this range
+    'inverse': True,                # Strong hit -> short pulse
+    'pulses': False,                # Send arcade button presses on this port
+    'memory_mb': 50,                # Full-rate history kept for this sensor
+}
+GLOBAL_SETTINGS = {     # settings key -> config name
+    'port': 'SERIAL_PORT',
+    'baud': 'BAUD',
+    'samples_per_sec': 'SAMPLES_PER_SEC',
+    'protocol': 'SERIAL_PROTOCOL',
+    'baseline_alpha': 'BASELINE_ALPHA',
+    'envelope_alpha': 'ENVELOPE_ALPHA',
+    'trigger_threshold': 'TRIGGER_THRESHOLD',
+    'memory_mb': 'MAX_BUFFER_MEMORY_MB',
+}
+
+
+def sensor_settings(sensors, config):
+    """
+    {name: settings} for the enabled sensors, in config order.
+    `config` is a dict of config globals (e.g. vars(config)).
+    """
+    out = {}
+    for name, entry in sensors.items():
+        settings = dict(SENSOR_DEFAULTS)
+        for key, config_name in GLOBAL_SETTINGS.items():
+            if config_name in config:
+                settings[key] = config[config_name]
+        unknown = set(entry) - set(settings)
+        if unknown:
+            raise ValueError(f"sensor {name}: unknown setting(s) {', '.join(sorted(unknown))}")
+        settings.update(entry)
+        if settings['enabled']:
+            out[name] = settings
+    return out
+
+
+class SensorPipeline:
+    """Serial link, DSP, detection and history for one sensor."""
+
+    def __init__(self, name, settings, log_dropped=False):
+        self.name = name
+        self.settings = settings
+        rate = settings['samples_per_sec']
+        self.sample_rate = rate
+        self.threshold = settings['trigger_threshold']
+
+        self.ser = None
+        self.ingest = None
+        self.pulser = None
+        self.gaps = GapDetector(rate, log=log_dropped)
+        self.clock = SampleClock(rate)
+        self.detector = HitDetector(rate, self.threshold, settings['capture_ms'],
+                                    settings['refractory_ms'], self.threshold * 0.4,
+                                    settings['amp_range'], settings['width_range_ms'],
+                                    inverse=settings['inverse'],
+                                    hold_ms=PULSE_HOLD_MS if settings['pulses'] else 0)
+        self.dsp = None         # Created once the baseline is calibrated
+        self.lock = Lock()      # Guards history (reader thread vs. web handlers)
+        self.history = None     # HistoryStore, set by the app (rollup levels are app config)
+
+        # Current values
+        self.baseline = 0.0
+        self.envelope = 0.0
+        self.sample_count = 0
+        self.hit_count = 0
+        self.error = None
+
+        self._calibration = []
+        self._calibrate_until = None
+        self._batch_raw = []
+        self._batch_env = []
+        self._batch_first = 0
+
+    def open(self):
+        """Open the port and negotiate the protocol; False (and self.error) on failure."""
+        import serial
+        from serial_ingest import open_ingest
+
+        try:
+            self.ser = serial.Serial(self.settings['port'], self.settings['baud'], timeout=1)
+            time.sleep(0.2)
+            self.ser.reset_input_buffer()
+            self.ingest = open_ingest(self.ser, self.settings['protocol'])
+            self.ser.timeout = 0    # From here on reads never block; the selector waits
+        except Exception as e:
+            self.error = str(e)
+            print(f"ERROR: {self.name}: could not open {self.settings['port']}: {e}", file=sys.stderr)
+            if self.ser:
+                self.ser.close()
+            self.ser = None
+            return False
+        self.ingest.monitor = self.gaps
+        if self.settings['pulses']:
+            self.pulser = PulseScheduler(self.ser)
+            self.pulser.start()
+        return True
+
+    def fileno(self):
+        return self.ser.fileno()
+
+    def read(self, now=None):
+        """Read what the port has buffered and run it through the pipeline."""
+        block = self.ingest.read_block()
+        if block:
+            self.process(block, time.time() if now is None else now)
+
+    def process(self, block, now):
+        """DSP and hit detection for one block of raw samples."""
+        if self.dsp is None:
+            # Baseline from the first CALIBRATE_S of samples, which are kept
+            if self._calibrate_until is None:
+                self._calibrate_until = now + CALIBRATE_S
+                self.clock.start(now)
+            self._calibration.extend(block)
+            if now < self._calibrate_until:
+                return
+            block, self._calibration = self._calibration, []
+            self.baseline = sum(block) / len(block)
+            self.dsp = EnvelopeFilter(self.settings['baseline_alpha'],
+                                      self.settings['envelope_alpha'], self.baseline, 0.0)
+            print(f"{self.name}: baseline calibrated: {self.baseline:.1f} ADC counts")
+
+        n = len(block)
+        first_index = self.clock.advance(n, now)
+        _, env_block = self.dsp.process(block)
+        for hit in self.detector.process(env_block):
+            self.hit_count += 1
+            print(f"{self.name}: hit #{self.hit_count}: peak={hit.peak:.1f} → {hit.width_ms:.0f} ms")
+            if self.pulser:
+                self.pulser.schedule(hit.width_ms)
+
+        if not self._batch_raw:
+            self._batch_first = first_index
+        self._batch_raw.extend(block)
+        self._batch_env.extend(env_block.tolist())
+        self.sample_count += n
+        self.baseline = self.dsp.baseline
+        self.envelope = self.dsp.envelope
+
+    def take_batch(self):
+        """Samples since the last call as (raw, env, first_index), stored in history."""
+        raw, env = self._batch_raw, self._batch_env
+        self._batch_raw, self._batch_env = [], []
+        if raw and self.history is not None:
+            with self.lock:
+                self.history.append(raw, env, self._batch_first)
+        return raw, env, self._batch_first
+
+    def stats(self):
+        """Per-sensor statistics for the stats event."""
+        stats = {
+            'sensor': self.name,
+            'sample_count': self.sample_count,
+            'baseline': self.baseline,
+            'envelope': self.envelope,
+            'threshold': self.threshold,
+            'hit_count': self.hit_count,
+            'connected': self.ser is not None,
+        }
+        if self.error:
+            stats['error'] = self.error
+        stats.update(self.gaps.stats())
+        stats.update(self.clock.stats())
+        if self.history is not None:
+            stats['buffer_size'] = len(self.history)
+            stats.update(self.history.stats())
+        if self.pulser:
+            stats.update(self.pulser.stats())
+        return stats
+
+    def close(self):
+        if self.pulser:
+            self.pulser.stop()
+            self.pulser = None
+        if self.ser:
+            try:
+                if self.settings['pulses']:
+                    self.ser.write(b"RESET_GPIO\n")
+                    self.ser.flush()
+            except Exception:
+                pass
+            self.ser.close()
+            self.ser = None
+
+
+def make_history(pipeline, levels):
+    """Full-rate ring plus rollups sized from the sensor's memory_mb."""
+    ring = SampleRing(capacity_for_memory(pipeline.settings['memory_mb']))
+    pipeline.history = HistoryStore(ring, pipeline.sample_rate, levels)
+    return pipeline.history
+
+
+class SensorReader:
+    """One selector loop over every open sensor port."""
+
+    def __init__(self, pipelines):
+        self.pipelines = [p for p in pipelines if p.ser is not None]
+        self.selector = selectors.DefaultSelector()
+        for pipeline in self.pipelines:
+            self.selector.register(pipeline.fileno(), selectors.EVENT_READ, pipeline)
+        self.read_errors = 0
+
+    def poll(self, timeout):
+        """Wait up to timeout for data and read every port that has some."""
+        if not self.pipelines:
+            time.sleep(timeout)
+            return
+        events = self.selector.select(timeout)
+        now = time.time()
+        for key, _ in events:
+            pipeline = key.data
+            try:
+                pipeline.read(now)
+            except OSError as e:
+                # Unplugged: stop watching this port, keep the others going
+                self.read_errors += 1
+                pipeline.error = str(e)
+                print(f"ERROR: {pipeline.name}: read failed, dropping sensor: {e}", file=sys.stderr)
+                self.selector.unregister(key.fd)
+                self.pipelines.remove(pipeline)
+                pipeline.close()
+
+    def close(self):
+        self.selector.close()
+        for pipeline in self.pipelines:
+            pipeline.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    from signal_gen import SignalGenerator, VirtualSerialPort
+
+    ap = argparse.ArgumentParser(description="Read several virtual sensors from one selector loop.")
+    ap.add_argument("--sensors", type=int, default=3)
+    ap.add_argument("--rate", type=int, default=800)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    args = ap.parse_args()
+
+    ports = [VirtualSerialPort(SignalGenerator(args.rate, seed=k)) for k in range(args.sensors)]
+    pipelines = []
+    for k, port in enumerate(ports):
+        port.start()
+        settings = dict(SENSOR_DEFAULTS, port=port.port, baud=115200, samples_per_sec=args.rate,
+                        protocol='auto', baseline_alpha=0.001, envelope_alpha=0.12,
+                        trigger_threshold=60, memory_mb=1)
+        pipeline = SensorPipeline(f"sensor{k}", settings)
+        if pipeline.open():
+            make_history(pipeline, [(10, 60)])
+            pipelines.append(pipeline)
+    reader = SensorReader(pipelines)
+
+    cpu0, t0 = os.times(), time.perf_counter()
+    t_end = t0 + args.seconds
+    while time.perf_counter() < t_end:
+        reader.poll(0.05)
+        for pipeline in pipelines:
+            pipeline.take_batch()
+    elapsed = time.perf_counter() - t0
+    cpu1 = os.times()
+    reader.close()
+    for port in ports:
+        port.stop()
+
+    for pipeline in pipelines:
+        print(f"{pipeline.name}: {pipeline.sample_count / elapsed:8.1f} SPS,"
+              f" {pipeline.hit_count} hits, {pipeline.gaps.dropped_samples} dropped")
+    cpu = (cpu1.user + cpu1.system) - (cpu0.user + cpu0.system)
+    print(f"process CPU (reader + virtual ports): {cpu / elapsed:.1%} of one core"
+          f" for {len(pipelines)} sensors")
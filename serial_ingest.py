@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - Buffered serial ingest
+Drains the Arduino's sample stream in bulk instead of one line per call
+
+Two wire formats are supported:
+- ASCII: one decimal sample per line (default, ~5 bytes/sample)
+- Binary: fixed frames of packed uint16 samples with a sequence counter
+  and CRC (~2.4 bytes/sample), negotiated at startup by open_ingest()
+
+Binary frame layout (little-endian, FRAME_SIZE bytes):
+    A5 5A | seq:uint16 | FRAME_SAMPLES x sample:uint16 | crc:uint16
+The CRC is CRC-16/CCITT-FALSE over seq + samples. seq counts up from 0
+(wrapping at 65536); a jump forward means frames were lost, a repeated or
+backward seq means a duplicate frame or a restarted Arduino.
+
+Run directly to measure parse throughput against a pty stand-in for the Arduino:
+    python3 serial_ingest.py [--samples 200000]
+"""
+import os
+import sys
+import time
+import struct
+import binascii
+import numpy as np
+
+# Binary protocol (must match signal_simulator.ino)
+FRAME_SYNC = b"\xa5\x5a"
+FRAME_SAMPLES = 16
+FRAME_SIZE = 2 + 2 + 2 * FRAME_SAMPLES + 2
+MODE_BIN_CMD = b"MODE_BIN\n"
+MODE_BIN_ACK = b"ACK_BIN\n"
+NEGOTIATE_TIMEOUT = 0.5  # Seconds to wait for ACK_BIN before using ASCII
+SEQ_MAX_STEP = 0x8000    # A larger step forward is really a step back (serial number arithmetic)
+
+_U16 = struct.Struct("<H")
+
+
+class SerialIngest:
+    """
+    Chunked reader for newline-separated ADC samples.
+
+    Each read_block() call drains everything the kernel has buffered
+    (ser.in_waiting), splits the whole chunk in one pass and parses it.
+    A trailing partial line is kept and completed by the next read.
+    When nothing is waiting, a single-byte read blocks for up to
+    ser.timeout, so callers never need to sleep between reads.
+    """
+
+    def __init__(self, ser, max_chunk=65536):
+        self.ser = ser
+        self.max_chunk = max_chunk
+        self.monitor = None  # Optional GapDetector, updated on every fresh read
+        self._partial = b""
+        self._pending = []
+
+        # Statistics
+        self.bytes_read = 0
+        self.samples_read = 0
+        self.bad_lines = 0
+        self.last_waiting = 0
+
+    def read_block(self):
+        """Return a list of all samples available now (may be empty)."""
+        if self._pending:
+            block, self._pending = self._pending, []
+            return block
+
+        waiting = self.ser.in_waiting
+        self.last_waiting = waiting
+        if waiting:
+            data = self.ser.read(min(waiting, self.max_chunk))
+        else:
+            # Block for the first byte, then grab whatever arrived with it
+            data = self.ser.read(1)
+            if data:
+                waiting = self.ser.in_waiting
+                if waiting:
+                    data += self.ser.read(min(waiting, self.max_chunk))
+
+        samples = self.feed(data)
+        if self.monitor is not None and data:
+            self.monitor.update(self, len(samples))
+        return samples
+
+    def feed(self, data):
+        """Parse raw bytes into samples, keeping any trailing partial line."""
+        if not data:
+            return []
+        self.bytes_read += len(data)
+
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        if not lines:
+            return []
+
+        try:
+            # int() accepts bytes and ignores surrounding whitespace ("\r")
+            samples = list(map(int, lines))
+        except ValueError:
+            samples = self._parse_slow(lines)
+        self.samples_read += len(samples)
+        return samples
+
+    def _parse_slow(self, lines):
+        """Per-line fallback that skips empty or garbled lines."""
+        samples = []
+        for line in lines:
+            try:
+                samples.append(int(line))
+            except ValueError:
+                if line.strip():
+                    self.bad_lines += 1
+        return samples
+
+    def unread(self, samples):
+        """Push samples back so the next read_block() returns them first."""
+        if samples:
+            self._pending = list(samples) + self._pending
+
+    def bytes_per_sample(self):
+        """Average wire size of one sample (for converting backlog bytes)."""
+        if self.samples_read:
+            return self.bytes_read / self.samples_read
+        return 5.0
+
+
+class FrameIngest(SerialIngest):
+    """
+    Chunked reader for the binary framed protocol.
+
+    Frames are validated by sync word and CRC. A bad frame costs one
+    byte: the parser steps past its sync word and searches for the next
+    one, so a corrupted or truncated frame never shifts later samples.
+    """
+
+    def __init__(self, ser, max_chunk=65536):
+        super().__init__(ser, max_chunk)
+        self.last_seq = None
+
+        # Statistics
+        self.frames = 0
+        self.lost_frames = 0
+        self.seq_resets = 0     # Duplicate frames and Arduino restarts (not losses)
+        self.crc_errors = 0
+        self.resyncs = 0
+
+    def feed(self, data):
+        """Parse raw bytes into samples, keeping any trailing partial frame."""
+        if not data:
+            return []
+        self.bytes_read += len(data)
+
+        buf = self._partial + data
+        end = len(buf)
+        pos = 0
+        payloads = []
+
+        while end - pos >= FRAME_SIZE:
+            if buf[pos:pos + 2] != FRAME_SYNC:
+                self.resyncs += 1
+                nxt = buf.find(FRAME_SYNC, pos + 1)
+                # Keep the last byte: it may be the first half of a sync word
+                pos = nxt if nxt >= 0 else end - 1
+                continue
+
+            body = buf[pos + 2:pos + FRAME_SIZE - 2]
+            crc, = _U16.unpack_from(buf, pos + FRAME_SIZE - 2)
+            if binascii.crc_hqx(body, 0xFFFF) != crc:
+                self.crc_errors += 1
+                pos += 1
+                continue
+
+            seq, = _U16.unpack_from(body)
+            if self.last_seq is not None:
+                step = (seq - self.last_seq) & 0xFFFF
+                if step == 0 or step >= SEQ_MAX_STEP or (seq == 0 and self.last_seq != 0xFFFF):
+                    self.seq_resets += 1
+                else:
+                    self.lost_frames += step - 1
+            self.last_seq = seq
+            self.frames += 1
+
+            payloads.append(body[2:])
+            pos += FRAME_SIZE
+
+        self._partial = buf[pos:]
+        if not payloads:
+            return []
+        self.samples_read += len(payloads) * FRAME_SAMPLES
+        return np.frombuffer(b"".join(payloads), dtype="<u2").tolist()
+
+    def bytes_per_sample(self):
+        """Wire size of one sample in a frame."""
+        return FRAME_SIZE / FRAME_SAMPLES
+
+
+def open_ingest(ser, protocol="auto"):
+    """
+    Negotiate the wire format and return a matching ingest.
+
+    protocol: "ascii" skips negotiation; "binary" and "auto" send
+    MODE_BIN and switch to FrameIngest if the Arduino answers ACK_BIN.
+    Firmware that ignores the command keeps streaming ASCII, so both
+    fall back to SerialIngest after NEGOTIATE_TIMEOUT.
+    """
+    if protocol == "ascii":
+        return SerialIngest(ser)
+
+    ser.write(MODE_BIN_CMD)
+    ser.flush()
+
+    seen = b""
+    deadline = time.time() + NEGOTIATE_TIMEOUT
+    while time.time() < deadline:
+        seen += ser.read(max(1, ser.in_waiting))
+        ack = seen.find(MODE_BIN_ACK)
+        if ack >= 0:
+            print("Serial protocol: binary frames")
+            ingest = FrameIngest(ser)
+            ingest.unread(ingest.feed(seen[ack + len(MODE_BIN_ACK):]))
+            return ingest
+
+    if protocol == "binary":
+        print("WARNING: Arduino did not acknowledge binary mode, using ASCII")
+    else:
+        print("Serial protocol: ASCII lines")
+    ingest = SerialIngest(ser)
+    ingest.unread(ingest.feed(seen))
+    return ingest
+
+
+def encode_frames(samples, seq=0):
+    """Pack samples into binary frames (host-side mirror of the sketch)."""
+    out = []
+    for start in range(0, len(samples) - FRAME_SAMPLES + 1, FRAME_SAMPLES):
+        body = _U16.pack(seq & 0xFFFF) + np.asarray(
+            samples[start:start + FRAME_SAMPLES], dtype="<u2").tobytes()
+        out.append(FRAME_SYNC + body + _U16.pack(binascii.crc_hqx(body, 0xFFFF)))
+        seq += 1
+    return b"".join(out)
+
+
+def read_one_int(ser):
+    """Read one line and parse int; return None on empty/invalid."""
+    try:
+        s = ser.readline().decode(errors="ignore").strip()
+        if not s:
+            return None
+        return int(s)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _pty_throughput(n_samples):
+    """Measure samples/s and bytes/sample of each reader over a pty pair."""
+    import pty
+    import serial
+    from threading import Thread
+
+    n_samples -= n_samples % FRAME_SAMPLES
+    samples = [40 + (i * 37) % 900 for i in range(n_samples)]
+    ascii_payload = b"".join(b"%d\r\n" % v for v in samples)
+    payloads = {
+        "read_one_int": ascii_payload,
+        "SerialIngest": ascii_payload,
+        "FrameIngest": encode_frames(samples),
+    }
+    results = {}
+
+    for name, payload in payloads.items():
+        master, slave = pty.openpty()
+        ser = serial.Serial(os.ttyname(slave), 115200, timeout=0.5)
+
+        def writer():
+            view = memoryview(payload)
+            while view:
+                written = os.write(master, view[:4096])
+                view = view[written:]
+
+        t = Thread(target=writer, daemon=True)
+        received = 0
+        t0 = time.perf_counter()
+        t.start()
+        if name == "read_one_int":
+            while received < n_samples:
+                if read_one_int(ser) is None:
+                    break
+                received += 1
+        else:
+            ingest = SerialIngest(ser) if name == "SerialIngest" else FrameIngest(ser)
+            while received < n_samples:
+                block = ingest.read_block()
+                if not block:
+                    break
+                received += len(block)
+        elapsed = time.perf_counter() - t0
+        t.join()
+
+        ser.close()
+        os.close(master)
+        os.close(slave)
+        results[name] = (received / elapsed, len(payload) / n_samples)
+
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Serial ingest throughput over a pty.")
+    ap.add_argument("--samples", type=int, default=200000)
+    ap.add_argument("--baud", type=int, default=115200,
+                    help="link speed used for the max-SPS estimate")
+    args = ap.parse_args()
+
+    if not hasattr(os, "openpty"):
+        print("ERROR: pty benchmark needs a POSIX system", file=sys.stderr)
+        sys.exit(1)
+
+    res = _pty_throughput(args.samples)
+    for name, (sps, bps) in res.items():
+        link_sps = args.baud / 10 / bps  # 8N1: 10 bits per byte
+        print(f"{name:>14}: {sps:12,.0f} samples/s  {bps:4.2f} bytes/sample"
+              f"  (link limit {link_sps:,.0f} SPS @ {args.baud} baud)")
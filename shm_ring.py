@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - Shared-memory sample ring
+SampleRing in multiprocessing.shared_memory, one writer process, any readers
+
+The acquisition process appends; web processes attach by name and only
+read. The layout is SampleRing's (mirrored columns), plus a small int64
+header for the ring position and a float64 status block:
+
+    header   [seq, capacity, head, count, total]
+    status   STATUS_FIELDS (baseline, envelope, ...), written by acquisition
+    raw      uint16 x 2*capacity
+    env      float32 x 2*capacity
+    index    int64 x 2*capacity
+
+Writes are guarded by a sequence counter (seqlock): the writer makes seq
+odd, appends, and makes it even again. A reader copies what it needs and
+retries if seq was odd or changed meanwhile, so it never sees a torn
+block and never blocks the writer. Readers get copies, not views, since
+the writer keeps overwriting the memory.
+
+Run directly to measure append and read cost with a reader process attached:
+    python3 shm_ring.py
+"""
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from ring_buffer import SampleRing, RAW_DTYPE, ENV_DTYPE, INDEX_DTYPE
+
+SEQ, CAPACITY, HEAD, COUNT, TOTAL = range(5)
+HEADER_FIELDS = 5
+STATUS_FIELDS = ('baseline', 'envelope', 't0', 'sample_count', 'pulse_count',
+                 'threshold', 'running',
+                 # Reader-side metrics (metrics.Metrics.reader_status), for /metrics in the web process
+                 'effective_sps', 'in_waiting', 'max_in_waiting', 'cpu_seconds', 'rss_bytes')
+_ALIGN = 8
+
+
+def _layout(capacity):
+    """(offset, dtype, length) per region, and the total size in bytes."""
+    regions = {}
+    offset = 0
+    for name, dtype, length in (('header', np.int64, HEADER_FIELDS),
+                                ('status', np.float64, len(STATUS_FIELDS)),
+                                ('index', INDEX_DTYPE, 2 * capacity),
+                                ('env', ENV_DTYPE, 2 * capacity),
+                                ('raw', RAW_DTYPE, 2 * capacity)):
+        regions[name] = (offset, np.dtype(dtype), length)
+        offset += np.dtype(dtype).itemsize * length
+        offset = -(-offset // _ALIGN) * _ALIGN
+    return regions, offset
+
+
+class SharedSampleRing(SampleRing):
+    """SampleRing whose arrays and position live in shared memory."""
+
+    def __init__(self, shm, owner=False):
+        # SampleRing.__init__ would allocate private arrays; map the shared ones instead
+        self.shm = shm
+        self.owner = owner
+        capacity = int(np.ndarray((HEADER_FIELDS,), np.int64, shm.buf)[CAPACITY])
+        regions, _ = _layout(capacity)
+        views = {name: np.ndarray((length,), dtype, shm.buf, offset)
+                 for name, (offset, dtype, length) in regions.items()}
+        self._header = views['header']
+        self._status = views['status']
+        self.capacity = capacity
+        self.raw, self.env, self.index = views['raw'], views['env'], views['index']
+        self.retries = 0
+
+    @classmethod
+    def create(cls, capacity, name=None):
+        """Allocate a new ring (the caller owns it and must close() it)."""
+        _, size = _layout(int(capacity))
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), np.int64, shm.buf)
+        header[:] = 0
+        header[CAPACITY] = int(capacity)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Map an existing ring created by another process."""
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # Ring position, shared with every process
+    head = property(lambda self: int(self._header[HEAD]),
+                    lambda self, v: self._header.__setitem__(HEAD, v))
+    count = property(lambda self: int(self._header[COUNT]),
+                     lambda self, v: self._header.__setitem__(COUNT, v))
+    total = property(lambda self: int(self._header[TOTAL]),
+                     lambda self, v: self._header.__setitem__(TOTAL, v))
+
+    def append(self, raw, env, first_index):
+        """Append a block (writer process only)."""
+        self._header[SEQ] += 1
+        try:
+            super().append(raw, env, first_index)
+        finally:
+            self._header[SEQ] += 1
+
+    def _read(self, fn):
+        """Run fn() on a consistent snapshot; fn must return copies."""
+        while True:
+            seq = int(self._header[SEQ])
+            if seq & 1:
+                time.sleep(0)
+                continue
+            result = fn()
+            if int(self._header[SEQ]) == seq:
+                return result
+            self.retries += 1
+
+    def latest(self, n=None):
+        """Copies of the newest n samples (all if None): (raw, env, index)."""
+        return self._read(lambda: tuple(np.array(a) for a in SampleRing.latest(self, n)))
+
+    def between(self, first, last):
+        """Copies of the stored samples with index first..last (inclusive)."""
+        return self._read(lambda: tuple(np.array(a) for a in SampleRing.between(self, first, last)))
+
+    def newest_index(self):
+        return self._read(lambda: SampleRing.newest_index(self))
+
+    def since(self, index, limit=None):
+        """
+        Copies of the samples with index >= `index` (at most `limit`, the
+        oldest first), for a reader catching up: (raw, env, first_index).
+        Samples already overwritten are skipped.
+        """
+        def read():
+            newest = SampleRing.newest_index(self)
+            if newest is None or newest < index:
+                return None
+            n = min(newest - index + 1, self.count)
+            if limit is not None:
+                n = min(n, limit)
+            first = max(index, newest - self.count + 1)
+            raw, env, idx = SampleRing.between(self, first, first + n - 1)
+            return np.array(raw), np.array(env), int(idx[0]) if len(idx) else first
+        return self._read(read)
+
+    def set_status(self, **fields):
+        """Update status fields (writer process)."""
+        for name, value in fields.items():
+            self._status[STATUS_FIELDS.index(name)] = value
+
+    def status(self):
+        """All status fields as a dict."""
+        return dict(zip(STATUS_FIELDS, self._status.tolist()))
+
+    def clear(self):
+        self._header[SEQ] += 1
+        super().clear()
+        self._header[SEQ] += 1
+
+    def close(self):
+        """Unmap; the owner also frees the shared memory."""
+        self.raw = self.env = self.index = self._header = self._status = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _bench_reader(name, seconds, out):
+    ring = SharedSampleRing.attach(name)
+    cursor = 0
+    reads = 0
+    samples = 0
+    t_end = time.perf_counter() + seconds
+    t_read = 0.0
+    while time.perf_counter() < t_end:
+        t0 = time.perf_counter()
+        block = ring.since(cursor)
+        t_read += time.perf_counter() - t0
+        if block is not None:
+            raw, _, first = block
+            cursor = first + len(raw)
+            samples += len(raw)
+            reads += 1
+        ring.latest(4000)
+        time.sleep(0.005)
+    out.put((reads, samples, t_read / max(reads, 1), ring.retries))
+    ring.close()
+
+
+if __name__ == '__main__':
+    import multiprocessing as mp
+
+    ctx = mp.get_context('spawn')
+    ring = SharedSampleRing.create(60 * 50000)
+    out = ctx.Queue()
+    reader = ctx.Process(target=_bench_reader, args=(ring.name, 3.0, out))
+    reader.start()
+    time.sleep(0.5)
+
+    block = 40
+    raw = (40 + np.arange(block) % 900).astype(np.uint16)
+    env = raw.astype(np.float32)
+    appends = []
+    index = 0
+    t_end = time.perf_counter() + 2.0
+    while time.perf_counter() < t_end:
+        t0 = time.perf_counter()
+        ring.append(raw, env, index)
+        appends.append(time.perf_counter() - t0)
+        index += block
+        time.sleep(block / 50000)
+    reads, samples, read_s, retries = out.get()
+    reader.join()
+    ring.close()
+
+    appends = np.array(appends) * 1e6
+    print(f"append {block} samples: p50 {np.percentile(appends, 50):.1f} µs,"
+          f" p99 {np.percentile(appends, 99):.1f} µs")
+    print(f"reader: {reads} catch-up reads, {samples} samples, {read_s * 1e6:.1f} µs per read,"
+          f" {retries} seqlock retries")
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - Block signal generator
+Seeded, vectorized stand-in for the sensor, plus a pty that acts like the Arduino
+
+SignalGenerator produces any number of samples per call with NumPy, so
+it keeps up with 50+ kHz. Hits are scheduled by sample index and noise
+comes from a seeded numpy Generator, so the same seed gives the same
+samples however the output is split into blocks. Two hit profiles:
+- "pbt":       half-sine hits on a quiet baseline, as signal_simulator.ino
+- "sick10bar": fast rise (~50 ms) and exponential decay over ~700 ms on
+               a 512 baseline, from the scope figures in config_sick10bar.py
+
+VirtualSerialPort serves the generator on a pty pair at a paced sample
+rate. It speaks the same protocol as the sketch (ASCII lines, MODE_BIN /
+ACK_BIN handshake, binary frames) and swallows pulse commands, so the
+real serial.Serial path in app.py / app_combined.py runs end to end:
+    python3 signal_gen.py --pty [--seed 1] [--profile sick10bar]
+    python3 app.py --port /dev/pts/N
+
+Run without --pty to measure generator throughput:
+    python3 signal_gen.py [--rate 50000]
+"""
+import os
+import sys
+import time
+import select
+import numpy as np
+from threading import Thread
+from serial_ingest import FRAME_SAMPLES, MODE_BIN_ACK, encode_frames
+
+ADC_MAX = 1023
+PTY_TICK_S = 0.005   # How often the virtual port writes what is due
+
+
+def half_sine(t):
+    """Half-sine hit shape over t in [0, 1)."""
+    return np.sin(np.pi * t)
+
+
+def rise_decay(t, rise=50 / 700, tau=130 / 700):
+    """Fast sine rise to 1 at `rise`, then exponential decay (t in [0, 1))."""
+    return np.where(t < rise,
+                    np.sin(0.5 * np.pi * t / rise),
+                    np.exp(-(t - rise) / tau))
+
+
+# Hit profiles. peak and duration_ms are drawn per hit from these ranges;
+# gap_s is the time from one hit's start to the next. Hits either replace
+# the noisy baseline (as in the sketch) or ride on top of it.
+PROFILES = {
+    "pbt": {
+        "baseline": 40, "noise": 6, "peak": (200, 900), "duration_ms": (120, 320),
+        "gap_s": (1.7, 3.3), "first_gap_s": 3.0, "shape": half_sine, "add_noise": False,
+    },
+    "sick10bar": {
+        "baseline": 512, "noise": 3, "peak": (562, 734), "duration_ms": (650, 750),
+        "gap_s": (2.0, 4.0), "first_gap_s": 3.0, "shape": rise_decay, "add_noise": True,
+    },
+}
+
+
+class SignalGenerator:
+    """Vectorized, seeded sensor signal with randomly timed hits."""
+
+    def __init__(self, sample_rate, profile="pbt", seed=None, **overrides):
+        if profile not in PROFILES:
+            raise ValueError(f"unknown profile {profile!r} (choose from {', '.join(PROFILES)})")
+        p = dict(PROFILES[profile], **overrides)
+        self.sample_rate = sample_rate
+        self.profile = profile
+        self.baseline = p["baseline"]
+        self.noise = p["noise"]
+        self.peak = p["peak"]
+        self.duration_ms = p["duration_ms"]
+        self.gap_s = p["gap_s"]
+        self.shape = p["shape"]
+        self.add_noise = p["add_noise"]
+        # Separate streams, so hit timing does not depend on how many noise
+        # samples were drawn before it (i.e. on the block sizes)
+        noise_seed, hit_seed = np.random.SeedSequence(seed).spawn(2)
+        self.noise_rng = np.random.default_rng(noise_seed)
+        self.hit_rng = np.random.default_rng(hit_seed)
+
+        self.index = 0              # Index of the next sample
+        self.hits = 0
+        self._hit = None            # (start, length, amplitude) of the current/next hit
+        self._schedule(int(p["first_gap_s"] * sample_rate))
+
+    def _schedule(self, start):
+        """Draw the hit starting at sample `start`."""
+        peak = self.hit_rng.integers(self.peak[0], self.peak[1], endpoint=False)
+        ms = self.hit_rng.integers(self.duration_ms[0], self.duration_ms[1], endpoint=True)
+        length = max(1, int(ms * self.sample_rate / 1000))
+        self._hit = (start, length, peak - self.baseline)
+
+    def generate(self, n):
+        """The next n samples as an int64 array, clamped to 0..ADC_MAX."""
+        i0, i1 = self.index, self.index + n
+        out = self.baseline + self.noise_rng.integers(-self.noise, self.noise + 1, n)
+
+        while True:
+            start, length, amplitude = self._hit
+            if start >= i1:
+                break
+            a, b = max(start, i0), min(start + length, i1)
+            wave = (self.shape((np.arange(a, b) - start) / length) * amplitude).astype(np.int64)
+            if self.add_noise:
+                out[a - i0:b - i0] += wave
+            else:
+                out[a - i0:b - i0] = self.baseline + wave
+            if start + length > i1:
+                break
+            self.hits += 1
+            gap = int(self.hit_rng.uniform(*self.gap_s) * self.sample_rate)
+            self._schedule(start + max(gap, length))
+
+        self.index = i1
+        return np.clip(out, 0, ADC_MAX, out=out)
+
+
+class VirtualSerialPort:
+    """
+    pty pair that streams a SignalGenerator like the Arduino sketch.
+
+    Open `port` with serial.Serial as if it were /dev/ttyUSB0. Commands
+    written by the host are answered like the sketch: MODE_BIN switches
+    to binary frames (after ACK_BIN), MODE_ASCII back to lines; pulse
+    commands (PIN6_HIGH, ...) are counted in `commands` and ignored.
+    """
+
+    def __init__(self, generator):
+        import pty
+        import tty
+
+        self.generator = generator
+        self.sample_rate = generator.sample_rate
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self.binary = False
+        self.commands = {}
+        self.samples_sent = 0
+        self.bytes_sent = 0
+        self._seq = 0
+        self._pending = np.empty(0, dtype=np.int64)  # Samples waiting for a full frame
+        self._cmd = b""
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Start streaming on a background thread."""
+        self._running = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Stop streaming and close the pty."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _run(self):
+        t_start = time.perf_counter()
+        while self._running:
+            readable, _, _ = select.select([self.master], [], [], PTY_TICK_S)
+            if readable:
+                self._handle_commands(os.read(self.master, 4096))
+            due = int((time.perf_counter() - t_start) * self.sample_rate) - self.generator.index
+            if due > 0:
+                self._send(self.generator.generate(due))
+
+    def _handle_commands(self, data):
+        lines = (self._cmd + data.replace(b"\r", b"\n")).split(b"\n")
+        self._cmd = lines.pop()
+        for line in lines:
+            if not line:
+                continue
+            if line == b"MODE_BIN":
+                self._write(MODE_BIN_ACK)
+                self.binary = True
+                self._pending = self._pending[:0]
+            elif line == b"MODE_ASCII":
+                self.binary = False
+            name = line.decode(errors="replace")
+            self.commands[name] = self.commands.get(name, 0) + 1
+
+    def _send(self, samples):
+        self.samples_sent += len(samples)
+        if not self.binary:
+            self._write(b"".join(b"%d\r\n" % v for v in samples.tolist()))
+            return
+        samples = np.concatenate([self._pending, samples])
+        whole = len(samples) - len(samples) % FRAME_SAMPLES
+        if whole:
+            self._write(encode_frames(samples[:whole], self._seq))
+            self._seq += whole // FRAME_SAMPLES
+        self._pending = samples[whole:]
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view and self._running:
+            try:
+                written = os.write(self.master, view)
+            except BlockingIOError:
+                time.sleep(0.001)
+                continue
+            view = view[written:]
+            self.bytes_sent += written
+
+
+def _throughput(sample_rate, profile, block, seconds=1.0):
+    """Samples per second the generator makes in `block`-sample calls."""
+    gen = SignalGenerator(sample_rate, profile, seed=0)
+    n = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        gen.generate(block)
+        n += block
+    return n / (time.perf_counter() - t0), gen.hits
+
+
+if __name__ == '__main__':
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Seeded block signal generator / virtual Arduino.")
+    ap.add_argument("--rate", type=int, default=800, help="samples per second")
+    ap.add_argument("--profile", choices=sorted(PROFILES), default="pbt")
+    ap.add_argument("--seed", type=int, default=None, help="RNG seed (same seed, same samples)")
+    ap.add_argument("--pty", action="store_true", help="serve the signal on a pty until Ctrl-C")
+    args = ap.parse_args()
+
+    if not args.pty:
+        for block in (40, 800, 8000):
+            sps, hits = _throughput(args.rate, args.profile, block)
+            print(f"{args.profile:>10} block {block:>5}: {sps:14,.0f} samples/s"
+                  f" ({sps / args.rate:,.0f}x {args.rate} SPS)")
+        sys.exit(0)
+
+    if not hasattr(os, "openpty"):
+        print("ERROR: --pty needs a POSIX system", file=sys.stderr)
+        sys.exit(1)
+
+    port = VirtualSerialPort(SignalGenerator(args.rate, args.profile, args.seed))
+    port.start()
+    print(f"Virtual Arduino ({args.profile}, {args.rate} SPS, seed {args.seed}) on {port.port}")
+    print(f"Run: python3 app.py --port {port.port}")
+    try:
+        while True:
+            time.sleep(5)
+            mode = "binary" if port.binary else "ascii"
+            print(f"{port.samples_sent:,} samples ({mode}), {port.generator.hits} hits,"
+                  f" commands {port.commands}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        port.stop()
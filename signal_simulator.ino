@@ -1,5 +1,10 @@
 // arduino "PBT simulator" -> prints 0..1023 lines at ~800 Hz
 // quiet baseline with noise + occasional hits (half-sine envelope)
+//
+// optional binary mode: host sends "MODE_BIN\n", we answer "ACK_BIN\n" and
+// switch to fixed frames (see serial_ingest.py):
+//   A5 5A | seq:uint16 | FRAME_SAMPLES x sample:uint16 | crc16:uint16  (little-endian)
+// crc is CRC-16/CCITT-FALSE over seq + samples. "MODE_ASCII\n" switches back.
 
 const int SAMPLES_PER_SEC = 800;
 const unsigned long SAMPLE_US = 1000000UL / SAMPLES_PER_SEC;
@@ -16,6 +21,73 @@ int peak = 500;             // will be randomised per hit
 unsigned long lastHitMs = 0;
 unsigned long hitGapMs = 3000;  // ms between hits (randomized a bit)
 
+// binary framing
+const int FRAME_SAMPLES = 16;
+const int FRAME_BYTES = 2 + 2 + 2 * FRAME_SAMPLES + 2;
+bool binaryMode = false;
+uint8_t frame[FRAME_BYTES];
+int frameFill = 0;
+uint16_t frameSeq = 0;
+
+// host command line buffer
+char cmdBuf[16];
+int cmdLen = 0;
+
+uint16_t crc16Ccitt(const uint8_t *data, int len) {
+  uint16_t crc = 0xFFFF;
+  for (int i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int b = 0; b < 8; b++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+void pollCommands() {
+  while (Serial.available() > 0) {
+    char c = Serial.read();
+    if (c == '\n' || c == '\r') {
+      cmdBuf[cmdLen] = '\0';
+      if (strcmp(cmdBuf, "MODE_BIN") == 0) {
+        Serial.print("ACK_BIN\n");  // last ASCII bytes before the first frame
+        binaryMode = true;
+        frameFill = 0;
+      } else if (strcmp(cmdBuf, "MODE_ASCII") == 0) {
+        binaryMode = false;
+      }
+      cmdLen = 0;
+    } else if (cmdLen < (int)sizeof(cmdBuf) - 1) {
+      cmdBuf[cmdLen++] = c;
+    }
+  }
+}
+
+void sendSample(int value) {
+  if (!binaryMode) {
+    Serial.println(value);
+    return;
+  }
+
+  if (frameFill == 0) {
+    frame[0] = 0xA5;
+    frame[1] = 0x5A;
+    frame[2] = frameSeq & 0xFF;
+    frame[3] = frameSeq >> 8;
+  }
+  frame[4 + 2 * frameFill] = value & 0xFF;
+  frame[5 + 2 * frameFill] = value >> 8;
+
+  if (++frameFill == FRAME_SAMPLES) {
+    uint16_t crc = crc16Ccitt(frame + 2, FRAME_BYTES - 4);
+    frame[FRAME_BYTES - 2] = crc & 0xFF;
+    frame[FRAME_BYTES - 1] = crc >> 8;
+    Serial.write(frame, FRAME_BYTES);
+    frameSeq++;
+    frameFill = 0;
+  }
+}
+
 void startNewHit() {
   // randomise peak and duration
   peak = random(200, 900);  // 200..900 counts ~ strength
@@ -33,6 +105,8 @@ void setup() {
 }
 
 void loop() {
+  pollCommands();
+
   unsigned long now = micros();
   if ((long)(now - nextSample) >= 0) {
     nextSample += SAMPLE_US;
@@ -62,7 +136,7 @@ void loop() {
     if (value < 0) value = 0;
     if (value > 1023) value = 1023;
 
-    Serial.println(value);
+    sendSample(value);
   }
 }
 
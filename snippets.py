@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+SICK Capstone - Hit waveform snippets
+Raw and envelope samples around every stored hit, kept in chunked blob files
+
+SnippetRing sits in the reader loop. It keeps the last pre-trigger +
+capture samples in a small lookback ring, so when the detector reports a
+hit (at capture end) the samples from SNIPPET_PRE_MS before its trigger
+are still there; the SNIPPET_POST_MS after capture end are copied from
+the blocks that follow. A finished snippet is submitted to the hit store
+together with its hit, and the store's writer thread appends it to a
+SnippetStore, so the reader thread never touches the disk.
+
+Chunk files (SNIPPET_DIR/000001.snp, a new one after SNIPPET_CHUNK_MB):
+    per snippet: raw samples (little-endian uint16), then the envelope
+    (little-endian float32); 6 bytes per sample, no framing
+The hit store's snippets table maps a hit id to (chunk, offset, samples,
+start index, rate), so reading one back is a primary key lookup and one
+read at a known offset, however many snippets are stored.
+
+Run directly to time push() per block and snippet reads by hit id from a
+scratch store:
+    python3 snippets.py [--snippets 100000]
+"""
+import os
+import numpy as np
+from collections import namedtuple
+from recorder import SAMPLE_DTYPE
+
+ENVELOPE_DTYPE = np.dtype('<f4')
+SUFFIX = ".snp"
+
+# Samples from `start` (absolute sample index) at `rate` SPS
+Snippet = namedtuple('Snippet', ['start', 'rate', 'raw', 'env'])
+
+
+class SnippetRing:
+    """Lookback ring plus the snippets still waiting for their post-capture samples."""
+
+    def __init__(self, sample_rate, pre_ms, post_ms, capture_ms):
+        self.sample_rate = sample_rate
+        self.pre = int(round(pre_ms * sample_rate / 1000.0))
+        self.post = int(round(post_ms * sample_rate / 1000.0))
+        # A hit is reported at most capture_ms after its trigger, so this
+        # always reaches back to pre before the trigger
+        self.capacity = self.pre + int(round(capture_ms * sample_rate / 1000.0)) + 1
+        self._raw = np.zeros(self.capacity, dtype=SAMPLE_DTYPE)
+        self._env = np.zeros(self.capacity, dtype=ENVELOPE_DTYPE)
+        self.end = 0            # Index after the newest sample in the ring
+        self._pending = []      # [tag, start, stop, raw, env, filled]
+
+    def add(self, hit, tag):
+        """
+        Start the snippet for `hit`; `tag` comes back with it from push().
+        Call before push() of the block the hit was detected in.
+        """
+        start = max(hit.trigger_index - self.pre, self.end - self.capacity, 0)
+        stop = hit.index + 1 + self.post
+        raw = np.empty(stop - start, dtype=SAMPLE_DTYPE)
+        env = np.empty(stop - start, dtype=ENVELOPE_DTYPE)
+        filled = min(self.end, stop)
+        if filled > start:
+            k = np.arange(start, filled) % self.capacity
+            raw[:filled - start] = self._raw[k]
+            env[:filled - start] = self._env[k]
+        self._pending.append([tag, start, stop, raw, env, max(filled, start)])
+
+    def push(self, raw, env, first_index):
+        """Add one block; return [(tag, Snippet)] for the snippets it completed."""
+        n = len(raw)
+        done = []
+        if self._pending:
+            raw = np.asarray(raw, dtype=SAMPLE_DTYPE)
+            end = first_index + n
+            still = []
+            for item in self._pending:
+                tag, start, stop, s_raw, s_env, filled = item
+                upto = min(stop, end)
+                if upto > filled:
+                    s_raw[filled - start:upto - start] = raw[filled - first_index:upto - first_index]
+                    s_env[filled - start:upto - start] = env[filled - first_index:upto - first_index]
+                    item[5] = upto
+                if item[5] >= stop:
+                    done.append((tag, Snippet(start, self.sample_rate, s_raw, s_env)))
+                else:
+                    still.append(item)
+            self._pending = still
+        self._store(raw, env, first_index)
+        return done
+
+    def flush(self):
+        """The unfinished snippets, cut short at the newest sample (on shutdown)."""
+        done = [(tag, Snippet(start, self.sample_rate, raw[:filled - start], env[:filled - start]))
+                for tag, start, stop, raw, env, filled in self._pending]
+        self._pending = []
+        return done
+
+    def _store(self, raw, env, first_index):
+        n = len(raw)
+        if n > self.capacity:
+            raw, env = raw[n - self.capacity:], env[n - self.capacity:]
+            first_index += n - self.capacity
+            n = self.capacity
+        pos = first_index % self.capacity
+        k = min(n, self.capacity - pos)
+        self._raw[pos:pos + k] = raw[:k]
+        self._env[pos:pos + k] = env[:k]
+        if k < n:
+            self._raw[:n - k] = raw[k:]
+            self._env[:n - k] = env[k:]
+        self.end = first_index + n
+
+
+class SnippetStore:
+    """Append-only chunk files; a snippet is found again by (chunk, offset, samples)."""
+
+    def __init__(self, directory, chunk_mb=64):
+        self.directory = directory
+        self.chunk_bytes = int(chunk_mb * 1024 * 1024)
+        self.chunk = None
+        self._file = None
+
+    def path(self, chunk):
+        return os.path.join(self.directory, f"{chunk:06d}{SUFFIX}")
+
+    def append(self, snippet):
+        """Write one snippet (writer thread only); returns (chunk, offset)."""
+        if self._file is None or self._file.tell() >= self.chunk_bytes:
+            self._next_chunk()
+        offset = self._file.tell()
+        self._file.write(np.asarray(snippet.raw, dtype=SAMPLE_DTYPE).tobytes())
+        self._file.write(np.asarray(snippet.env, dtype=ENVELOPE_DTYPE).tobytes())
+        return self.chunk, offset
+
+    def flush(self):
+        """Make appended snippets readable (before the rows pointing at them commit)."""
+        if self._file:
+            self._file.flush()
+
+    def _next_chunk(self):
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            chunks = sorted(int(name[:-len(SUFFIX)]) for name in os.listdir(self.directory)
+                            if name.endswith(SUFFIX) and name[:-len(SUFFIX)].isdigit())
+            self.chunk = chunks[-1] if chunks else 1
+        else:
+            self._file.close()
+            self.chunk += 1
+        # Append mode: after a restart the last chunk carries on where it ended
+        self._file = open(self.path(self.chunk), "ab")
+
+    def read(self, chunk, offset, samples):
+        """(raw, env) arrays of one snippet, or None if its chunk is missing or short."""
+        size = samples * (SAMPLE_DTYPE.itemsize + ENVELOPE_DTYPE.itemsize)
+        try:
+            with open(self.path(chunk), "rb") as f:
+                f.seek(offset)
+                data = f.read(size)
+        except OSError:
+            return None
+        if len(data) < size:
+            return None
+        raw = np.frombuffer(data, dtype=SAMPLE_DTYPE, count=samples)
+        env = np.frombuffer(data, dtype=ENVELOPE_DTYPE, count=samples,
+                            offset=samples * SAMPLE_DTYPE.itemsize)
+        return raw, env
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+if __name__ == '__main__':
+    import time
+    import argparse
+    import tempfile
+    from hit_detector import Hit
+    from hit_store import HitStore
+
+    ap = argparse.ArgumentParser(description="Time snippet capture and reads by hit id.")
+    ap.add_argument("--snippets", type=int, default=100_000, help="hits with snippets to store")
+    ap.add_argument("--rate", type=int, default=800, help="sample rate")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    block = args.rate // 20
+    ring = SnippetRing(args.rate, 200, 200, 250)
+    raw = rng.integers(40, 900, block).tolist()
+    env = rng.uniform(0, 100, block)
+    for k in range(ring.capacity // block + 1):
+        ring.push(raw, env, k * block)
+    index = (k + 1) * block
+    for pending in (0, 1):
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            if pending:
+                ring.add(Hit(index, index - 100, 80.0, 50.0, 125.0), None)
+            ring.push(raw, env, index)
+            index += block
+        print(f"push, {block}-sample blocks, {'a hit' if pending else 'no hit':6} per block:"
+              f" {(time.perf_counter() - t0) / 1000 * 1e6:.1f} µs")
+    ring.flush()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HitStore(os.path.join(tmp, "hits.db"), queue_hits=args.snippets + 1,
+                         config={'TRIGGER_THRESHOLD': 60},
+                         snippets=SnippetStore(os.path.join(tmp, "snippets"), chunk_mb=16))
+        n = ring.capacity + ring.post
+        snippet = Snippet(0, args.rate, rng.integers(40, 900, n), rng.uniform(0, 100, n))
+        start = time.time() - 365 * 86400
+        for k in range(args.snippets):
+            store.submit(Hit(k * 1000 + 200, k * 1000, 80.0, 50.0, 250.0),
+                         start + k * 300.0, 41.5, snippet._replace(start=k * 1000 - ring.pre))
+        t0 = time.perf_counter()
+        store.start()
+        store.stop(timeout=600)
+        chunks = os.listdir(os.path.join(tmp, "snippets"))
+        size = sum(os.path.getsize(os.path.join(tmp, "snippets", c)) for c in chunks)
+        print(f"{args.snippets} snippets of {n} samples written in {time.perf_counter() - t0:.1f} s,"
+              f" {size / 1e6:.0f} MB in {len(chunks)} chunks")
+
+        ids = rng.integers(1, args.snippets + 1, 1000)
+        store.snippet(1)
+        t0 = time.perf_counter()
+        for hit_id in ids:
+            assert store.snippet(int(hit_id))['raw'] is not None
+        print(f"snippet by hit id: {(time.perf_counter() - t0) / len(ids) * 1000:.2f} ms")
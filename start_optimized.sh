@@ -92,7 +92,8 @@ fi
 echo ""
 
 # Service 2: Additional sensors (when ready)
-# Uncomment when you add PMT, GM, etc.
+# Prefer a single process for all sensors instead of the lines below:
+# enable them in SENSORS (config.py) and start app_multi.py in place of app.py
 
 # echo "   📡 Starting PMT sensor..."
 # PORT=5001 python3 app_pmt.py > logs/pmt.log 2>&1 &
@@ -1,13 +1,39 @@
-// WebSocket connection
-const socket = io();
+// Chart width in pixels; the server sends about one min/max pair per pixel
+function chartWidth() {
+    const canvas = document.getElementById('waveformChart');
+    return canvas ? Math.round(canvas.clientWidth || canvas.width) : 0;
+}
+
+// Resume point: the server's stream id and the sample index after the last
+// sample received. Sent again on reconnect, so only the gap is re-sent.
+let streamId = null;
+let lastEnd = null;
+
+// Subscription profile from the URL, e.g. a kiosk showing only the hit
+// count: ?channels=hits&rate=5 (channels: all, raw, envelope or hits;
+// rate: 5, 10, 20 or 60 frames per second)
+const params = new URLSearchParams(window.location.search);
+const channels = params.get('channels') || 'all';
+const rate = Number(params.get('rate')) || null;
+let isPaused = false;
+
+// WebSocket connection (ask for packed binary, decimated sample blocks, and
+// acknowledge each block so the server only sends as fast as this page keeps up).
+// auth is re-evaluated on every (re)connect.
+// With app_multi.py, ?sensor=<name> picks that sensor's namespace.
+const sensorName = params.get('sensor');
+const socket = io(sensorName ? '/' + encodeURIComponent(sensorName) : '/', {
+    auth: (cb) => cb({ encoding: 'binary', width: chartWidth(), acks: true,
+                       channels: channels, rate: rate, paused: isPaused || document.hidden,
+                       stream: streamId, resume: lastEnd })
+});
 
 // Chart configuration
 let chart;
-let isPaused = false;
 let totalSamples = 0;
 
-// Data buffers
-const MAX_POINTS = 4000; // 5 seconds at 800 Hz
+// Data buffers (the server may decimate, so the window is kept by time)
+let windowSeconds = 5; // Updated from initial_data
 let rawData = [];
 let envelopeData = [];
 let timeData = [];
@@ -101,14 +127,19 @@ function initChart() {
 function updateChart(newRaw, newEnv, newTime, threshold) {
     if (isPaused) return;
 
-    // Append new data
-    rawData.push(...newRaw);
-    envelopeData.push(...newEnv);
-    timeData.push(...newTime);
+    // Append new data (skipping points already held, e.g. around a reconnect)
+    const newest = timeData.length ? timeData[timeData.length - 1] : -Infinity;
+    let skip = 0;
+    while (skip < newTime.length && newTime[skip] <= newest) skip++;
+    rawData.push(...newRaw.slice(skip));
+    envelopeData.push(...newEnv.slice(skip));
+    timeData.push(...newTime.slice(skip));
 
-    // Keep only last MAX_POINTS
-    if (rawData.length > MAX_POINTS) {
-        const excess = rawData.length - MAX_POINTS;
+    // Keep only the last windowSeconds
+    const cutoff = timeData[timeData.length - 1] - windowSeconds;
+    let excess = 0;
+    while (excess < timeData.length && timeData[excess] < cutoff) excess++;
+    if (excess > 0) {
         rawData = rawData.slice(excess);
         envelopeData = envelopeData.slice(excess);
         timeData = timeData.slice(excess);
@@ -126,6 +157,33 @@ function updateChart(newRaw, newEnv, newTime, threshold) {
     chart.update('none'); // 'none' mode for best performance
 }
 
+// Decode a binary sample block into the same arrays the JSON payload carries.
+// raw is little-endian Int16, envelope Float32; point k's time is
+// t0 + (start + k) / rate, or t0 + (start + offsets[k]) / rate when decimated.
+// A channel left out of the subscription comes back as nulls (a gap in the chart).
+function decodePayload(data) {
+    if (data.channels === 'hits') return Object.assign({}, data, { raw: [], envelope: [], time: [] });
+
+    if (data.encoding === 'binary') {
+        const raw = data.raw ? Array.from(new Int16Array(data.raw)) : null;
+        const envelope = data.envelope ? Array.from(new Float32Array(data.envelope)) : null;
+        const offsets = data.offsets ? new Uint32Array(data.offsets) : null;
+        const time = new Array((raw || envelope).length);
+        for (let k = 0; k < time.length; k++) {
+            time[k] = data.t0 + (data.start + (offsets ? offsets[k] : k)) / data.rate;
+        }
+        data = Object.assign({}, data, { raw: raw, envelope: envelope, time: time });
+    }
+    const gap = () => new Array(data.time.length).fill(null);
+    return Object.assign({}, data, { raw: data.raw || gap(), envelope: data.envelope || gap() });
+}
+
+// Samples a payload stands for (a decimated min/max pair covers `factor` samples)
+function samplesIn(data) {
+    const factor = data.factor || 1;
+    return factor > 1 ? data.raw.length / 2 * factor : data.raw.length;
+}
+
 // Update statistics display
 function updateStats(baseline, envelope, threshold) {
     document.getElementById('baseline-value').textContent = baseline.toFixed(1);
@@ -162,14 +220,37 @@ socket.on('disconnect', () => {
     updateConnectionStatus(false);
 });
 
-socket.on('initial_data', (data) => {
-    console.log('Received initial data:', data.raw.length, 'samples');
-    rawData = data.raw;
-    envelopeData = data.envelope;
-    timeData = data.time;
-    totalSamples = rawData.length;
-    
-    updateChart([], [], [], data.threshold);
+// Refused at MAX_CLIENTS
+socket.on('connect_error', (err) => {
+    console.log('Connection refused:', err.message);
+    updateConnectionStatus(false);
+    document.getElementById('status-text').textContent = 'Refused: ' + err.message;
+});
+
+// The server is dropping frames because this page is not keeping up
+socket.on('lag', (info) => {
+    console.warn(info.lagging ? 'Falling behind' : 'Caught up', '-', info.dropped, 'frames dropped');
+});
+
+socket.on('initial_data', (payload) => {
+    const data = decodePayload(payload);
+    if (data.window) windowSeconds = data.window;
+    streamId = data.stream;
+    if (data.resumed) {
+        // Reconnected: only the samples missed while away
+        console.log('Resumed:', data.raw.length, 'points missed');
+        totalSamples += samplesIn(data);
+        if (data.end !== undefined) lastEnd = data.end;
+        updateChart(data.raw, data.envelope, data.time, data.threshold);
+    } else {
+        console.log('Received initial data:', data.raw.length, 'points');
+        rawData = data.raw;
+        envelopeData = data.envelope;
+        timeData = data.time;
+        totalSamples = samplesIn(data);
+        lastEnd = data.end !== undefined ? data.end : null;
+        updateChart([], [], [], data.threshold);
+    }
     updateStats(data.baseline, data.envelope[data.envelope.length - 1] || 0, data.threshold);
     
     document.getElementById('buffer-size').textContent = rawData.length;
@@ -180,22 +261,25 @@ socket.on('initial_data', (data) => {
     }
 });
 
-socket.on('sensor_data', (data) => {
-    if (data.raw && data.raw.length > 0) {
-        totalSamples += data.raw.length;
+socket.on('sensor_data', (payload, ack) => {
+    const data = decodePayload(payload);
+    if (data.end !== undefined) lastEnd = data.end;
+    if (data.raw.length > 0) {
+        totalSamples += samplesIn(data);
         
         updateChart(data.raw, data.envelope, data.time, data.threshold);
         
-        const lastEnvelope = data.envelope[data.envelope.length - 1] || 0;
-        updateStats(data.baseline, lastEnvelope, data.threshold);
-        
         document.getElementById('buffer-size').textContent = rawData.length;
         document.getElementById('sample-count').textContent = totalSamples;
-        
-        if (data.pulse_count !== undefined) {
-            document.getElementById('pulse-count').textContent = data.pulse_count;
-        }
     }
+    
+    const lastEnvelope = data.envelope[data.envelope.length - 1] || 0;
+    updateStats(data.baseline, lastEnvelope, data.threshold);
+    
+    if (data.pulse_count !== undefined) {
+        document.getElementById('pulse-count').textContent = data.pulse_count;
+    }
+    if (ack) ack();
 });
 
 // Control buttons
@@ -203,6 +287,12 @@ document.getElementById('pause-btn').addEventListener('click', function() {
     isPaused = !isPaused;
     this.textContent = isPaused ? 'Resume' : 'Pause';
     this.classList.toggle('paused');
+    // The server stops sending while paused (and while the tab is hidden)
+    socket.emit('subscribe', { paused: isPaused || document.hidden });
+});
+
+document.addEventListener('visibilitychange', () => {
+    socket.emit('subscribe', { paused: isPaused || document.hidden });
 });
 
 document.getElementById('clear-btn').addEventListener('click', function() {
@@ -227,6 +317,15 @@ document.addEventListener('DOMContentLoaded', () => {
     console.log('PBT Sensor Monitor initialized');
 });
 
+// Ask for a new resolution when the chart is resized
+let resizeTimer = null;
+window.addEventListener('resize', () => {
+    clearTimeout(resizeTimer);
+    resizeTimer = setTimeout(() => {
+        socket.emit('set_viewport', { width: chartWidth() });
+    }, 250);
+});
+
 // Request stats periodically
 setInterval(() => {
     socket.emit('request_stats');
@@ -5,13 +5,15 @@ Simulates sensor data without requiring Arduino connection
 """
 import time
 import sys
-import math
-import random
 from threading import Thread, Lock
-from collections import deque
-from flask import Flask, render_template
+from flask import Flask, render_template, request, jsonify
 from flask_socketio import SocketIO, emit
 from config import *
+from dsp import EnvelopeFilter
+from ring_buffer import SampleRing, capacity_for_memory
+from history import HistoryStore, parse_query
+from broadcast import Broadcaster
+from signal_gen import SignalGenerator, PROFILES
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = SECRET_KEY
@@ -19,131 +21,73 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
 # Shared data buffers
 data_lock = Lock()
-raw_buffer = deque(maxlen=BUFFER_SIZE)
-env_buffer = deque(maxlen=BUFFER_SIZE)
-time_buffer = deque(maxlen=BUFFER_SIZE)
+history = HistoryStore(SampleRing(capacity_for_memory(MAX_BUFFER_MEMORY_MB)),
+                       SAMPLES_PER_SEC, HISTORY_LEVELS)
+
+# Connected clients (payload encoding and display resolution per client)
+broadcaster = Broadcaster(socketio, SAMPLES_PER_SEC, BUFFER_SIZE, MAX_DISPLAY_POINTS)
 
 # Simulation state
 sim_running = False
 baseline = 40.0
 envelope = 0.0
 sample_count = 0
-
-
-class SignalSimulator:
-    """Simulates PBT sensor signal similar to Arduino simulator"""
-    
-    def __init__(self):
-        self.baseline = 40
-        self.noise_amp = 6
-        self.peak = 500
-        self.in_hit = False
-        self.phase = 0.0
-        self.phase_step = 0.0
-        self.last_hit_time = time.time()
-        self.hit_gap = 3.0
-    
-    def start_new_hit(self):
-        """Start a new simulated hit"""
-        self.peak = random.randint(200, 900)
-        hit_duration_ms = random.randint(120, 320)
-        self.phase = 0.0
-        self.phase_step = math.pi / (hit_duration_ms * (SAMPLES_PER_SEC / 1000.0))
-        self.in_hit = True
-    
-    def get_next_sample(self):
-        """Generate next sample value"""
-        now = time.time()
-        
-        # Randomly start a hit
-        if not self.in_hit and (now - self.last_hit_time) > self.hit_gap:
-            self.start_new_hit()
-            self.last_hit_time = now
-            self.hit_gap = 2.5 + random.uniform(-0.8, 0.8)
-        
-        # Base value with noise
-        value = self.baseline + random.randint(-self.noise_amp, self.noise_amp + 1)
-        
-        # Add hit envelope
-        if self.in_hit:
-            env = math.sin(self.phase)
-            hit_add = int(env * (self.peak - self.baseline))
-            value = self.baseline + hit_add
-            self.phase += self.phase_step
-            
-            if self.phase >= math.pi:
-                self.in_hit = False
-        
-        # Clamp to ADC range
-        return max(0, min(1023, value))
+sim_profile = "pbt"   # SignalGenerator hit profile
+sim_seed = None       # RNG seed; set one to get the same signal every run
 
 
 def simulator_thread():
     """Background thread to simulate sensor data"""
     global sim_running, baseline, envelope, sample_count
     
-    print("Starting signal simulator...")
-    simulator = SignalSimulator()
+    print(f"Starting signal simulator ({sim_profile}, seed {sim_seed})...")
+    simulator = SignalGenerator(SAMPLES_PER_SEC, sim_profile, sim_seed)
     
     # Baseline warm-up
-    baseline_samples = [simulator.get_next_sample() for _ in range(160)]
-    baseline = sum(baseline_samples) / len(baseline_samples)
+    baseline = float(simulator.generate(160).mean())
     envelope = 0.0
     
     print(f"Simulated baseline: {baseline:.1f} ADC counts")
+    dsp = EnvelopeFilter(BASELINE_ALPHA, ENVELOPE_ALPHA, baseline, envelope)
     
     # Main simulation loop
-    start_time = time.time()
     sample_count = 0
     last_emit = time.time()
+    t_start = last_emit
     
     batch_raw = []
     batch_env = []
-    batch_time = []
-    
-    sample_interval = 1.0 / SAMPLES_PER_SEC
-    next_sample_time = time.time()
     
     while sim_running:
         now = time.time()
         
-        if now >= next_sample_time:
-            # Generate sample
-            v = simulator.get_next_sample()
-            sample_count += 1
-            current_time = now - start_time
+        # Generate every sample that is due, as one block
+        due = int((now - t_start) * SAMPLES_PER_SEC) - sample_count
+        block = simulator.generate(due).tolist() if due > 0 else []
+        
+        if block:
+            sample_count += len(block)
             
-            # Update baseline and envelope
-            baseline = (1 - BASELINE_ALPHA) * baseline + BASELINE_ALPHA * v
-            xmag = abs(v - baseline)
-            envelope = (1 - ENVELOPE_ALPHA) * envelope + ENVELOPE_ALPHA * xmag
+            # Update baseline and envelope for the whole block
+            _, env_block = dsp.process(block)
+            baseline = dsp.baseline
+            envelope = dsp.envelope
             
             # Store in batch
-            batch_raw.append(v)
-            batch_env.append(envelope)
-            batch_time.append(current_time)
-            
-            next_sample_time += sample_interval
+            batch_raw.extend(block)
+            batch_env.extend(env_block.tolist())
         
         # Emit data in batches
         if now - last_emit >= EMIT_INTERVAL:
             if batch_raw:
                 with data_lock:
-                    raw_buffer.extend(batch_raw)
-                    env_buffer.extend(batch_env)
-                    time_buffer.extend(batch_time)
+                    history.append(batch_raw, batch_env, sample_count - len(batch_raw))
                 
-                socketio.emit('sensor_data', {
-                    'raw': batch_raw,
-                    'envelope': batch_env,
-                    'time': batch_time,
-                    'baseline': baseline,
-                    'threshold': TRIGGER_THRESHOLD
-                })
+                broadcaster.publish(batch_raw, batch_env, sample_count - len(batch_raw), 0.0,
+                                    baseline=baseline, threshold=TRIGGER_THRESHOLD)
                 
                 batch_raw = []
                 batch_env = []
-                batch_time = []
             
             last_emit = now
         
@@ -159,36 +103,75 @@ def index():
     return render_template('index.html')
 
 
+@app.route('/api/history')
+def api_history():
+    """History between t_start and t_end (seconds): ?t_start=&t_end=&max_points="""
+    result = query_history(request.args)
+    return jsonify(result), (400 if 'error' in result else 200)
+
+
+@socketio.on('query_history')
+def handle_query_history(params):
+    """Same query over Socket.IO; the result is returned as the ack"""
+    return query_history(params if isinstance(params, dict) else {})
+
+
+def query_history(params):
+    """Answer a history query from the cheapest resolution that fits"""
+    try:
+        t_start, t_end, max_points = parse_query(params, HISTORY_MAX_POINTS)
+    except ValueError as e:
+        return {'error': str(e)}
+    with data_lock:
+        return history.query(t_start, t_end, max_points, 0.0)
+
+
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     """Handle client connection"""
-    print('Client connected')
+    encoding, factor = broadcaster.add(request.sid, auth)
+    print(f'Client connected ({encoding}, {factor} samples/point pair)')
     
     with data_lock:
-        emit('initial_data', {
-            'raw': list(raw_buffer),
-            'envelope': list(env_buffer),
-            'time': list(time_buffer),
-            'baseline': baseline,
-            'threshold': TRIGGER_THRESHOLD
-        })
+        raw, env, index, resumed = history.catch_up(broadcaster.resume_index(auth), BUFFER_SIZE)
+    
+    emit('initial_data', broadcaster.initial_data(
+        request.sid, raw, env, index, 0.0, resumed=resumed,
+        baseline=baseline, threshold=TRIGGER_THRESHOLD))
+
+
+@socketio.on('set_viewport')
+def handle_set_viewport(data):
+    """Client chart was resized: change its display resolution"""
+    if isinstance(data, dict):
+        broadcaster.set_viewport(request.sid, data.get('width'))
+
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Change this client's channels, rate or pause state; the profile in effect is the ack"""
+    return broadcaster.subscribe(request.sid, data)
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
     print('Client disconnected')
+    broadcaster.remove(request.sid)
 
 
 @socketio.on('request_stats')
 def handle_stats_request():
     """Send current statistics"""
-    emit('stats', {
+    stats = {
         'sample_count': sample_count,
         'baseline': baseline,
         'envelope': envelope,
-        'buffer_size': len(raw_buffer)
-    })
+        'buffer_size': len(history)
+    }
+    stats.update(broadcaster.stats())
+    stats.update(history.stats())
+    emit('stats', stats)
 
 
 def start_simulator_thread():
@@ -201,6 +184,15 @@ def start_simulator_thread():
 
 
 if __name__ == '__main__':
+    import argparse
+    
+    ap = argparse.ArgumentParser(description="SICK PBT Sensor Web App - Test Mode")
+    ap.add_argument("--profile", choices=sorted(PROFILES), default=sim_profile,
+                    help="simulated hit shape")
+    ap.add_argument("--seed", type=int, default=sim_seed, help="RNG seed (same seed, same signal)")
+    args = ap.parse_args()
+    sim_profile, sim_seed = args.profile, args.seed
+    
     print("=" * 50)
     print("  SICK PBT Sensor Web App - TEST MODE")
     print("  (Simulated data - no Arduino required)")